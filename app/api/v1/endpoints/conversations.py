@@ -5,11 +5,15 @@ Operations:
 - GET /conversations - List all conversations for a user
 - GET /conversations/{id} - Get conversation detail with messages
 - POST /conversations/{id}/messages - Add message to conversation (Update)
+- POST /conversations/{id}/messages/stream - Add message and stream the response (SSE)
 - DELETE /conversations/{id} - Delete conversation and messages
 """
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional
+import json
 
 from app.core.database import get_db
 from app.services.chat_service import ChatService, chat_service
@@ -31,6 +35,13 @@ def get_chat_service() -> ChatService:
     return chat_service
 
 
+async def _to_sse(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Format service events as Server-Sent Events frames; closing this closes the event stream"""
+    async with aclosing(events):
+        async for event in events:
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
 @router.post(
     "/",
     response_model=CreateConversationResponse,
@@ -40,7 +51,7 @@ def get_chat_service() -> ChatService:
 )
 async def create_conversation(
     request: CreateConversationRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     service: ChatService = Depends(get_chat_service)
 ):
     """
@@ -65,13 +76,13 @@ async def create_conversation(
     "/",
     response_model=PaginatedConversations,
     summary="List conversations",
-    description="Get all conversations for a user with pagination support."
+    description="Get all conversations for a user with cursor-based pagination."
 )
 async def list_conversations(
     user_id: str = Query(..., description="User identifier"),
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(20, ge=1, le=100, description="Maximum number of records to return"),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    db: AsyncSession = Depends(get_db),
     service: ChatService = Depends(get_chat_service)
 ):
     """
@@ -82,8 +93,13 @@ async def list_conversations(
     - Message count
     - Last message preview
     - Token usage
+    
+    Pass the returned next_cursor to fetch the following page.
     """
-    return service.list_conversations(db, user_id, skip, limit)
+    try:
+        return await service.list_conversations(db, user_id, limit, cursor)
+    except ChatException as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e.detail))
 
 
 @router.get(
@@ -94,7 +110,7 @@ async def list_conversations(
 )
 async def get_conversation(
     conversation_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     service: ChatService = Depends(get_chat_service)
 ):
     """
@@ -106,7 +122,7 @@ async def get_conversation(
     - Token usage statistics
     """
     try:
-        return service.get_conversation(db, conversation_id)
+        return await service.get_conversation(db, conversation_id)
     except ChatException as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e.detail))
 
@@ -121,7 +137,7 @@ async def get_conversation_messages(
     conversation_id: str,
     skip: int = Query(0, ge=0, description="Number of messages to skip"),
     limit: int = Query(100, ge=1, le=500, description="Maximum messages to return"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     service: ChatService = Depends(get_chat_service)
 ):
     """
@@ -130,7 +146,7 @@ async def get_conversation_messages(
     Messages are returned in chronological order (oldest first).
     """
     try:
-        return service.get_conversation_history(db, conversation_id, skip, limit)
+        return await service.get_conversation_history(db, conversation_id, skip, limit)
     except ChatException as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e.detail))
 
@@ -145,7 +161,7 @@ async def get_conversation_messages(
 async def add_message(
     conversation_id: str,
     request: AddMessageRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     service: ChatService = Depends(get_chat_service)
 ):
     """
@@ -170,6 +186,41 @@ async def add_message(
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e.detail))
 
 
+@router.post(
+    "/{conversation_id}/messages/stream",
+    response_class=StreamingResponse,
+    summary="Add message and stream the response",
+    description="Add a new message to an existing conversation and stream the AI response as Server-Sent Events."
+)
+async def add_message_stream(
+    conversation_id: str,
+    request: AddMessageRequest,
+    db: AsyncSession = Depends(get_db),
+    service: ChatService = Depends(get_chat_service)
+):
+    """
+    Add a message to an existing conversation and stream the response.
+    
+    Emits `token` events while the LLM generates, followed by a single `done`
+    event carrying both persisted messages (or an `error` event).
+    The assistant message is stored even if the client disconnects early.
+    
+    - message: The message content to send
+    """
+    try:
+        events = await service.add_message_stream(db, conversation_id, request)
+    except ChatException as e:
+        if "not found" in str(e.detail).lower():
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e.detail))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e.detail))
+    
+    return StreamingResponse(
+        _to_sse(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.delete(
     "/{conversation_id}",
     status_code=status.HTTP_204_NO_CONTENT,
@@ -178,7 +229,7 @@ async def add_message(
 )
 async def delete_conversation(
     conversation_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     service: ChatService = Depends(get_chat_service)
 ):
     """
@@ -186,7 +237,7 @@ async def delete_conversation(
     
     """
     try:
-        service.delete_conversation(db, conversation_id)
+        await service.delete_conversation(db, conversation_id)
         return None
     except ChatException as e:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e.detail))
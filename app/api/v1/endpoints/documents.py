@@ -1,37 +1,103 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import os
 
-from app.schemas.document import DocumentUploadResponse, DocumentDeleteResponse
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.exceptions import DocumentTooLargeException
+from app.models.ingestion_job import IngestionJob, JobStatus
+from app.schemas.document import IngestionJobResponse, DocumentDeleteResponse
+from app.services.ingestion_jobs import ingestion_job_queue
 from app.services.ingestion_service import ingestion_service
+from app.services.document_processor.processor import spool_stream
 
 router = APIRouter()
 
 
-@router.post("/upload", response_model=DocumentUploadResponse)
-async def upload_document(file: UploadFile = File(...)):
-    """Upload a document for RAG processing."""
-    try:
-        content = await file.read()
-        result = await ingestion_service.ingest(
-            content=content,
-            filename=file.filename,
-            content_type=file.content_type or "text/plain"
-        )
-        return DocumentUploadResponse(
-            document_id=result.document_id,
-            filename=result.filename,
-            chunk_count=result.chunk_count,
-            status=result.status
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@router.post("/upload", response_model=IngestionJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def upload_document(
+    file: UploadFile = File(...),
+    user_id: Optional[str] = Form(None, description="Owner, for tenant-scoped retrieval"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Upload a document for RAG processing; poll /documents/jobs/{job_id} for progress."""
+    job = await ingestion_job_queue.submit(
+        db,
+        source_path=await _spool_upload(file),
+        filename=file.filename,
+        content_type=file.content_type or "text/plain",
+        user_id=user_id
+    )
+    return _to_job_response(job)
+
+
+@router.put("/{document_id}", response_model=IngestionJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def update_document(
+    document_id: str,
+    file: UploadFile = File(...),
+    user_id: Optional[str] = Form(None, description="Owner of the document"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Upload a new version of a document; only changed chunks are re-embedded."""
+    job = await ingestion_job_queue.submit(
+        db,
+        source_path=await _spool_upload(file),
+        filename=file.filename,
+        content_type=file.content_type or "text/plain",
+        document_id=document_id,
+        user_id=user_id
+    )
+    return _to_job_response(job)
+
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_ingestion_job(job_id: str, db: AsyncSession = Depends(get_db)):
+    """Get the status and progress of an ingestion job."""
+    job = await ingestion_job_queue.get(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job not found: {job_id}")
+    return _to_job_response(job)
 
 
 @router.delete("/{document_id}", response_model=DocumentDeleteResponse)
-async def delete_document(document_id: str):
+async def delete_document(
+    document_id: str,
+    user_id: Optional[str] = Query(None, description="Owner of the document")
+):
     """Delete a document from the vector store."""
-    success = await ingestion_service.delete_document(document_id)
+    success = await ingestion_service.delete_document(document_id, user_id=user_id)
     return DocumentDeleteResponse(
         success=success,
         document_id=document_id,
         message="Document deleted" if success else "Delete failed"
     )
+
+
+async def _spool_upload(file: UploadFile) -> str:
+    """Stream the upload into a spool file owned by the ingestion job"""
+    if file.size is not None and file.size > settings.MAX_UPLOAD_BYTES:
+        raise DocumentTooLargeException(f"Upload exceeds the {settings.MAX_UPLOAD_BYTES} byte limit")
+    return await spool_stream(
+        file.read,
+        max_bytes=settings.MAX_UPLOAD_BYTES,
+        suffix=os.path.splitext(file.filename or "")[1],
+        directory=settings.UPLOAD_SPOOL_DIR
+    )
+
+
+def _to_job_response(job: IngestionJob) -> IngestionJobResponse:
+    return IngestionJobResponse(
+        job_id=job.id,
+        status=job.status.value if isinstance(job.status, JobStatus) else job.status,
+        filename=job.filename,
+        document_id=job.document_id,
+        result_status=job.result_status,
+        error=job.error,
+        bytes_total=job.bytes_total,
+        bytes_processed=job.bytes_processed,
+        chunks_total=job.chunks_total,
+        chunks_embedded=job.chunks_embedded,
+        created_at=job.created_at,
+        updated_at=job.updated_at
+    )
@@ -22,23 +22,79 @@ class Settings(BaseSettings):
     
     @property
     def DATABASE_URL(self) -> str:
-        return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+    
+    # Connection pool (async engine)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800  # Seconds before a pooled connection is replaced
     
     # LLM Settings
     DEFAULT_LLM_PROVIDER: str = "gemini"  # gemini, groq, or openai
     DEFAULT_MODEL: str = "gemini-1.5-flash"
     
+    # Shared HTTP client (REST-based LLM providers)
+    HTTP2_ENABLED: bool = True
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_TIMEOUT: float = 60.0
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    
     # Context Management Settings
     MAX_CONTEXT_TOKENS: int = 4096
     MAX_RESPONSE_TOKENS: int = 1024
     SLIDING_WINDOW_MESSAGES: int = 20
+    CONTEXT_STRATEGY: str = "sliding_window"  # sliding_window, truncate_oldest, or summarize
+    SUMMARY_TRIGGER_TOKENS: int = 1000  # Evicted tokens needed before a rolling summary runs
+    SUMMARY_MAX_INPUT_TOKENS: int = 3000  # Transcript tokens folded into one summary pass
+    
+    # Embeddings
+    EMBEDDING_BATCH_SIZE: int = 100  # Texts per provider request
+    EMBEDDING_MAX_CONCURRENCY: int = 4  # Batch requests in flight at once
+    EMBEDDING_CACHE_ENABLED: bool = True  # Cache query embeddings in RAGService
+    EMBEDDING_CACHE_SIZE: int = 1024
+    EMBEDDING_CACHE_TTL: float = 86400.0  # Seconds; 0 disables expiry
+    EMBEDDING_CACHE_PATH: Optional[str] = None  # SQLite file for a persistent cache tier
     
     # Vector Store
+    VECTOR_STORE_TYPE: str = "chroma"  # "chroma" or "numpy"
     CHROMA_PERSIST_DIR: str = "./chroma_db"
+    NUMPY_STORE_DIR: str = "./numpy_store"
+    CHROMA_TENANT_COLLECTIONS: bool = False  # One Chroma collection per uploading user_id
+    CHROMA_EXECUTOR_WORKERS: int = 8  # Threads running blocking chromadb calls
+    CHROMA_MAX_CONCURRENT_WRITES: int = 2  # Writes in flight at once; the other workers stay free for searches
+    CHROMA_MAX_BATCH_SIZE: int = 5000  # Chunks per upsert; capped at the client's own limit
+    
+    # Retrieval
+    RAG_TOP_K: int = 20  # Candidates fetched before packing into the context token budget
+    RAG_MIN_SCORE: float = 0.0  # Candidates scoring below this are never sent to the LLM
+    RAG_TENANT_ISOLATION: bool = False  # Only retrieve documents uploaded by the conversation's user_id
+    LEXICAL_INDEX_ENABLED: bool = True  # BM25 index for hybrid (lexical + vector) retrieval
+    LEXICAL_INDEX_PATH: str = "./bm25_index.db"
+    LEXICAL_MIN_SCORE: float = 0.1  # Lexical hits below this fraction of the query's best possible BM25 score are dropped
+    HYBRID_RRF_K: int = 60  # Reciprocal-rank fusion constant
+    
+    # Response cache
+    RESPONSE_CACHE_MODES: str = ""  # Comma-separated conversation modes ("open_chat", "rag") whose first answers are cached
+    RESPONSE_CACHE_SIZE: int = 1024
+    RESPONSE_CACHE_TTL: float = 3600.0  # Seconds; 0 disables expiry
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD: Optional[float] = None  # Cosine similarity for reusing a similar message's answer
+    
+    # Background ingestion
+    INGESTION_WORKERS: int = 2  # Documents ingested concurrently
+    MAX_UPLOAD_BYTES: int = 100 * 1024 * 1024
+    UPLOAD_SPOOL_DIR: Optional[str] = None  # Where uploads wait for ingestion (default: system temp dir)
+    PDF_EXTRACT_PROCESSES: int = 2  # Worker processes for large PDFs; 0 extracts in a thread
+    PDF_PAGES_PER_TASK: int = 16  # Page range handed to each worker process
     
     # Chunking
+    CHUNK_UNIT: str = "characters"  # "characters" or "tokens" (counted like ContextManager)
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
+    CHUNK_SIZE_TOKENS: int = 256  # Used when CHUNK_UNIT is "tokens"
+    CHUNK_OVERLAP_TOKENS: int = 32
     
     class Config:
         env_file = ".env"
@@ -1,23 +1,127 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
-from typing import Generator
+from sqlalchemy import Connection, and_, case, func, inspect, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from typing import AsyncGenerator, Dict, List, Tuple
 
 from app.core.config import settings
 from app.models.base import Base
+from app.models.conversation import Conversation, Message
+from app.repositories.conversation import PREVIEW_LENGTH
 
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+engine = create_async_engine(
+    settings.DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay usable after commit without a re-SELECT per row
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
 
 
-def init_db() -> None:
-    """Initialize database by creating all tables"""
-    Base.metadata.create_all(bind=engine)
+# Columns added to existing tables after their first release: (name, DDL type and default)
+ADDED_COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    "conversations": [
+        ("summarized_until", "INTEGER NOT NULL DEFAULT 0"),
+        ("message_sequence", "INTEGER NOT NULL DEFAULT 0"),
+        ("message_count", "INTEGER NOT NULL DEFAULT 0"),
+        ("last_message_preview", "VARCHAR(255)"),
+    ],
+    "ingestion_jobs": [
+        ("user_id", "VARCHAR"),
+    ],
+}
 
 
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
-    try:
+async def init_db() -> None:
+    """Initialize database by creating all tables and upgrading existing ones"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+
+
+def upgrade_schema(conn: Connection) -> None:
+    """
+    Bring tables created by earlier versions up to date.
+    
+    create_all only creates missing tables, so columns added later are
+    added here, and indexes declared on existing tables are created. When
+    the conversation counters are new, they are backfilled from the stored
+    messages; duplicate sequence numbers left by the old MAX()+1 allocation
+    are renumbered first so the unique sequence index can be built.
+    """
+    inspector = inspect(conn)
+    added = set()
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {column["name"] for column in inspector.get_columns(table)}
+        for name, ddl in columns:
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+                added.add((table, name))
+    
+    if ("conversations", "message_sequence") in added:
+        _renumber_duplicate_sequences(conn)
+        _backfill_conversation_counters(conn)
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _renumber_duplicate_sequences(conn: Connection) -> None:
+    messages = Message.__table__
+    duplicates = conn.execute(
+        select(messages.c.conversation_id)
+        .group_by(messages.c.conversation_id, messages.c.sequence_number)
+        .having(func.count() > 1)
+        .limit(1)
+    ).first()
+    if duplicates is None:
+        return
+    
+    ranked = select(
+        messages.c.id,
+        func.row_number().over(
+            partition_by=messages.c.conversation_id,
+            order_by=(messages.c.sequence_number, messages.c.created_at, messages.c.id)
+        ).label("position")
+    ).subquery()
+    conn.execute(
+        update(messages).values(
+            sequence_number=select(ranked.c.position).where(ranked.c.id == messages.c.id).scalar_subquery()
+        )
+    )
+
+
+def _backfill_conversation_counters(conn: Connection) -> None:
+    conversations = Conversation.__table__
+    messages = Message.__table__
+    own = messages.c.conversation_id == conversations.c.id
+    visible = and_(own, messages.c.is_summary.isnot(True))
+    last_content = (
+        select(messages.c.content).where(visible)
+        .order_by(messages.c.sequence_number.desc()).limit(1).scalar_subquery()
+    )
+    conn.execute(
+        update(conversations).values(
+            message_sequence=select(func.coalesce(func.max(messages.c.sequence_number), 0)).where(own).scalar_subquery(),
+            message_count=select(func.count()).select_from(messages).where(visible).scalar_subquery(),
+            last_message_preview=case(
+                (func.length(last_content) > PREVIEW_LENGTH, func.substr(last_content, 1, PREVIEW_LENGTH) + "..."),
+                else_=last_content
+            ),
+            # Keep listing order; the counters are not user activity
+            updated_at=conversations.c.updated_at
+        )
+    )
+
+
+async def close_db() -> None:
+    """Release pooled connections"""
+    await engine.dispose()
+
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
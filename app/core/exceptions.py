@@ -20,3 +20,15 @@ class DocumentException(HTTPException):
     """Exception raised for document processing errors"""
     def __init__(self, detail: str):
         super().__init__(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=detail)
+
+
+class DocumentNotFoundException(HTTPException):
+    """Exception raised when a document is not in the vector store"""
+    def __init__(self, detail: str):
+        super().__init__(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+class DocumentTooLargeException(HTTPException):
+    """Exception raised when an upload exceeds the configured size limit"""
+    def __init__(self, detail: str):
+        super().__init__(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
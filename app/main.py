@@ -5,7 +5,13 @@ import logging
 
 from app.api.v1.router import api_router
 from app.core.config import settings
-from app.core.database import init_db
+from app.core.database import close_db, init_db
+from app.services.ingestion_jobs import ingestion_job_queue
+from app.services.ingestion_service import ingestion_service
+from app.services.llm.http_client import http_client_manager
+from app.services.rag_service import rag_service
+from app.services.response_cache import response_cache
+from app.services.vectorstore.factory import VectorStoreFactory
 
 # logging setting
 logging.basicConfig(
@@ -20,11 +26,26 @@ async def lifespan(app: FastAPI):
     """Application lifespan handler for startup and shutdown events"""
     # startup
     logger.info("Starting Bot GPT API...")
-    init_db()
+    await init_db()
     logger.info("Database initialized successfully")
+    await http_client_manager.start()
+    await ingestion_job_queue.start()
+    if settings.LEXICAL_INDEX_ENABLED:
+        try:
+            indexed = await ingestion_service.rebuild_lexical_index(only_if_empty=True)
+            if indexed:
+                logger.info(f"Backfilled the lexical index with {indexed} stored chunks")
+        except Exception as e:
+            logger.warning(f"Lexical index backfill skipped: {e}")
     yield
     # shutdown
     logger.info("Shutting down Bot GPT API...")
+    await ingestion_job_queue.stop()
+    ingestion_service.close()
+    rag_service.close()
+    VectorStoreFactory.close()
+    await http_client_manager.close()
+    await close_db()
 
 
 app = FastAPI(
@@ -78,5 +99,7 @@ async def health_check():
     return {
         "status": "healthy",
         "app": settings.APP_NAME,
-        "debug": settings.DEBUG
+        "debug": settings.DEBUG,
+        "embedding_cache": rag_service.embedding_cache_info(),
+        "response_cache": response_cache.cache_info()
     }
@@ -3,6 +3,7 @@ Base Model - SQLAlchemy Declarative Base
 """
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy import Column, DateTime, func
+from sqlalchemy.dialects import sqlite
 
 
 class Base(DeclarativeBase):
@@ -10,7 +11,17 @@ class Base(DeclarativeBase):
     pass
 
 
+# SQLite's CURRENT_TIMESTAMP has no fractional seconds; bind parameters must use
+# the same text format or keyset comparisons on timestamps break.
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite"
+)
+
+
 class TimestampMixin:
     """Mixin for adding timestamp columns"""
-    created_at = Column(DateTime, server_default=func.now(), nullable=False)
-    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+    created_at = Column(Timestamp, server_default=func.now(), nullable=False)
+    updated_at = Column(Timestamp, server_default=func.now(), onupdate=func.now(), nullable=False)
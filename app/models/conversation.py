@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, ForeignKey, Enum, Integer, Boolean
+from sqlalchemy import Column, String, Text, ForeignKey, Enum, Integer, Boolean, Index
 from sqlalchemy.orm import relationship
 import enum
 import uuid
@@ -37,6 +37,14 @@ class Conversation(Base, TimestampMixin):
     # Context management metadata
     total_tokens = Column(Integer, default=0)
     is_active = Column(Boolean, default=True)
+    # Highest sequence number folded into the latest rolling summary
+    summarized_until = Column(Integer, default=0, nullable=False)
+    # Last allocated message sequence number (atomic counter)
+    message_sequence = Column(Integer, default=0, nullable=False)
+    
+    # Listing metadata, maintained on write (summaries are not counted)
+    message_count = Column(Integer, default=0, nullable=False)
+    last_message_preview = Column(String(255), nullable=True)
     
     # Relationships
     messages = relationship(
@@ -46,6 +54,12 @@ class Conversation(Base, TimestampMixin):
         order_by="Message.sequence_number"  # Ensure proper ordering
     )
     
+    # Keyset pagination of a user's conversations on (updated_at, id)
+    __table_args__ = (
+        Index("ix_conversations_user_updated", "user_id", "updated_at", "id"),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self) -> str:
         return f"<Conversation(id={self.id}, user_id={self.user_id}, title={self.title})>"
 
@@ -70,6 +84,13 @@ class Message(Base, TimestampMixin):
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
     
+    # Newest-first window scans per conversation; unique to stay race-safe
+    __table_args__ = (
+        Index("ix_messages_conversation_sequence", "conversation_id", "sequence_number", unique=True),
+    )
+    # Fetch server-side timestamps in the INSERT itself (RETURNING)
+    __mapper_args__ = {"eager_defaults": True}
+    
     def __repr__(self) -> str:
         return f"<Message(id={self.id}, role={self.role}, sequence={self.sequence_number})>"
     
@@ -0,0 +1,49 @@
+from sqlalchemy import Column, String, Text, Enum, Integer
+import enum
+import uuid
+
+from app.models.base import Base, TimestampMixin
+
+
+class JobStatus(str, enum.Enum):
+    """Lifecycle states of a background ingestion job"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class IngestionJob(Base, TimestampMixin):
+    """
+    IngestionJob table - tracks a document upload processed in the background.
+    
+    Progress counters are updated by the worker as the ingestion stages run,
+    so clients can poll for status instead of holding the upload request open.
+    """
+    __tablename__ = "ingestion_jobs"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    status = Column(Enum(JobStatus), default=JobStatus.QUEUED, nullable=False, index=True)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(255), nullable=False)
+    # Spooled upload on local disk, removed once the job finishes
+    source_path = Column(String, nullable=True)
+    # Uploading user; owns the resulting document
+    user_id = Column(String, nullable=True, index=True)
+    
+    # Set up front for document updates, otherwise once ingestion finishes
+    document_id = Column(String, nullable=True)
+    # IngestionResult status: completed, updated, unchanged, duplicate or empty
+    result_status = Column(String(32), nullable=True)
+    error = Column(Text, nullable=True)
+    
+    # Progress
+    bytes_total = Column(Integer, default=0, nullable=False)
+    bytes_processed = Column(Integer, default=0, nullable=False)
+    chunks_total = Column(Integer, default=0, nullable=False)
+    chunks_embedded = Column(Integer, default=0, nullable=False)
+    
+    __mapper_args__ = {"eager_defaults": True}
+    
+    def __repr__(self) -> str:
+        return f"<IngestionJob(id={self.id}, status={self.status}, filename={self.filename})>"
@@ -5,6 +5,7 @@ from app.repositories.conversation import (
     conversation_repository,
     message_repository,
 )
+from app.repositories.ingestion_job import IngestionJobRepository, ingestion_job_repository
 
 __all__ = [
     "CRUDBase",
@@ -13,4 +14,6 @@ __all__ = [
     "MessageRepository",
     "conversation_repository",
     "message_repository",
+    "IngestionJobRepository",
+    "ingestion_job_repository",
 ]
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 from typing import TypeVar, Generic, Type, List, Optional, Tuple
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.base import Base
 
@@ -9,84 +10,84 @@ ModelType = TypeVar("ModelType", bound=Base)
 
 class IRepository(ABC, Generic[ModelType]):
 
-    
+
     @abstractmethod
-    def get(self, db: Session, id: str) -> Optional[ModelType]:
+    async def get(self, db: AsyncSession, id: str) -> Optional[ModelType]:
         """Get a single record by ID"""
         pass
-    
+
     @abstractmethod
-    def get_all(self, db: Session, skip: int = 0, limit: int = 100) -> List[ModelType]:
+    async def get_all(self, db: AsyncSession, skip: int = 0, limit: int = 100) -> List[ModelType]:
         """Get all records with pagination"""
         pass
-    
+
     @abstractmethod
-    def create(self, db: Session, obj_in: dict) -> ModelType:
+    async def create(self, db: AsyncSession, obj_in: dict) -> ModelType:
         """Create a new record"""
         pass
-    
+
     @abstractmethod
-    def update(self, db: Session, id: str, obj_in: dict) -> Optional[ModelType]:
+    async def update(self, db: AsyncSession, id: str, obj_in: dict) -> Optional[ModelType]:
         """Update an existing record"""
         pass
-    
+
     @abstractmethod
-    def delete(self, db: Session, id: str) -> bool:
+    async def delete(self, db: AsyncSession, id: str) -> bool:
         """Delete a record by ID"""
         pass
 
 
 class CRUDBase(IRepository[ModelType]):
-    
+
     def __init__(self, model: Type[ModelType]):
         self.model = model
-    
-    def get(self, db: Session, id: str) -> Optional[ModelType]:
+
+    async def get(self, db: AsyncSession, id: str) -> Optional[ModelType]:
         """Get a single record by ID"""
-        return db.query(self.model).filter(self.model.id == id).first()
-    
-    def get_all(self, db: Session, skip: int = 0, limit: int = 100) -> List[ModelType]:
+        return await db.get(self.model, id)
+
+    async def get_all(self, db: AsyncSession, skip: int = 0, limit: int = 100) -> List[ModelType]:
         """Get all records with pagination"""
-        return db.query(self.model).offset(skip).limit(limit).all()
-    
-    def get_with_count(self, db: Session, skip: int = 0, limit: int = 100) -> Tuple[List[ModelType], int]:
+        result = await db.scalars(select(self.model).offset(skip).limit(limit))
+        return list(result)
+
+    async def get_with_count(self, db: AsyncSession, skip: int = 0, limit: int = 100) -> Tuple[List[ModelType], int]:
         """Get all records with pagination and total count"""
-        query = db.query(self.model)
-        total = query.count()
-        items = query.offset(skip).limit(limit).all()
+        total = await db.scalar(select(func.count()).select_from(self.model))
+        items = await self.get_all(db, skip, limit)
         return items, total
-    
-    def create(self, db: Session, obj_in: dict) -> ModelType:
+
+    async def create(self, db: AsyncSession, obj_in: dict) -> ModelType:
         """Create a new record"""
         db_obj = self.model(**obj_in)
         db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
         return db_obj
-    
-    def update(self, db: Session, id: str, obj_in: dict) -> Optional[ModelType]:
+
+    async def update(self, db: AsyncSession, id: str, obj_in: dict) -> Optional[ModelType]:
         """Update an existing record"""
-        db_obj = self.get(db, id)
+        db_obj = await self.get(db, id)
         if db_obj is None:
             return None
-        
+
         for field, value in obj_in.items():
             if hasattr(db_obj, field):
                 setattr(db_obj, field, value)
-        
-        db.commit()
-        db.refresh(db_obj)
+
+        await db.commit()
+        await db.refresh(db_obj)
         return db_obj
-    
-    def delete(self, db: Session, id: str) -> bool:
+
+    async def delete(self, db: AsyncSession, id: str) -> bool:
         """Delete a record by ID"""
-        obj = db.query(self.model).filter(self.model.id == id).first()
+        obj = await self.get(db, id)
         if obj:
-            db.delete(obj)
-            db.commit()
+            await db.delete(obj)
+            await db.commit()
             return True
         return False
-    
-    def exists(self, db: Session, id: str) -> bool:
+
+    async def exists(self, db: AsyncSession, id: str) -> bool:
         """Check if a record exists"""
-        return db.query(self.model).filter(self.model.id == id).first() is not None
+        return await self.get(db, id) is not None
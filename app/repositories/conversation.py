@@ -1,49 +1,91 @@
 from abc import ABC, abstractmethod
+from datetime import datetime
 from typing import List, Optional, Tuple
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+import base64
+from sqlalchemy import and_, desc, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from app.repositories.base import CRUDBase
 from app.models.conversation import Conversation, Message, MessageRole
 
+PREVIEW_LENGTH = 100
+
+
+def message_preview(content: str) -> str:
+    """Shorten message content for conversation listings"""
+    if len(content) > PREVIEW_LENGTH:
+        return content[:PREVIEW_LENGTH] + "..."
+    return content
+
+
+def encode_cursor(conversation: Conversation) -> str:
+    """Encode a conversation's (updated_at, id) keyset position as an opaque cursor"""
+    raw = f"{conversation.updated_at.isoformat()}|{conversation.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode a cursor produced by encode_cursor; raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        updated_at, conversation_id = raw.split("|", 1)
+        return datetime.fromisoformat(updated_at), conversation_id
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
 
 class IConversationRepository(ABC):
     
     @abstractmethod
-    def get_by_user(self, db: Session, user_id: str, skip: int = 0, limit: int = 20) -> Tuple[List[Conversation], int]:
-        """Get all conversations for a specific user with pagination"""
+    async def get_by_user(
+        self, db: AsyncSession, user_id: str, limit: int = 20, cursor: Optional[str] = None
+    ) -> Tuple[List[Conversation], Optional[str]]:
+        """Get a page of a user's conversations and the cursor of the next page"""
         pass
     
     @abstractmethod
-    def get_messages(self, db: Session, conversation_id: str, skip: int = 0, limit: int = 100) -> List[Message]:
+    async def get_messages(self, db: AsyncSession, conversation_id: str, skip: int = 0, limit: int = 100) -> List[Message]:
         """Get all messages for a conversation"""
         pass
     
     @abstractmethod
-    def get_recent_messages(self, db: Session, conversation_id: str, limit: int = 10) -> List[Message]:
+    async def get_recent_messages(self, db: AsyncSession, conversation_id: str, limit: int = 10) -> List[Message]:
         """Get most recent messages for a conversation"""
         pass
     
     @abstractmethod
-    def add_message(self, db: Session, conversation_id: str, role: MessageRole, content: str, token_count: int = 0) -> Message:
+    async def add_message(self, db: AsyncSession, conversation_id: str, role: MessageRole, content: str, token_count: int = 0) -> Message:
         """Add a message to a conversation"""
         pass
     
     @abstractmethod
-    def get_next_sequence_number(self, db: Session, conversation_id: str) -> int:
+    async def get_next_sequence_number(self, db: AsyncSession, conversation_id: str) -> int:
         """Get the next sequence number for a conversation"""
         pass
+    
+    @abstractmethod
+    async def add_turn(self, db: AsyncSession, conversation_id: str, messages: List[Message]) -> List[Message]:
+        """Persist several messages and their token usage in one transaction"""
+        pass
 
 
 class IMessageRepository(ABC):
     """Interface for message-specific operations"""
     
     @abstractmethod
-    def get_messages_within_token_limit(self, db: Session, conversation_id: str, max_tokens: int) -> List[Message]:
+    async def get_messages_within_token_limit(
+        self,
+        db: AsyncSession,
+        conversation_id: str,
+        max_tokens: int,
+        max_messages: Optional[int] = None,
+        per_message_overhead: int = 0
+    ) -> List[Message]:
         """Get messages within token limit (for sliding window)"""
         pass
     
     @abstractmethod
-    def update_token_count(self, db: Session, message_id: str, token_count: int) -> Optional[Message]:
+    async def update_token_count(self, db: AsyncSession, message_id: str, token_count: int) -> Optional[Message]:
         """Update token count for a message"""
         pass
 
@@ -54,47 +96,164 @@ class ConversationRepository(CRUDBase[Conversation], IConversationRepository):
     def __init__(self):
         super().__init__(Conversation)
     
-    def get_by_user(self, db: Session, user_id: str, skip: int = 0, limit: int = 20) -> Tuple[List[Conversation], int]:
-        """Get all conversations for a specific user with pagination"""
-        query = db.query(Conversation).filter(Conversation.user_id == user_id)
-        total = query.count()
-        conversations = query.order_by(desc(Conversation.updated_at)).offset(skip).limit(limit).all()
-        return conversations, total
+    async def get_by_user(
+        self, db: AsyncSession, user_id: str, limit: int = 20, cursor: Optional[str] = None
+    ) -> Tuple[List[Conversation], Optional[str]]:
+        """
+        Get a page of a user's conversations, most recently updated first.
+        
+        Uses keyset pagination on (updated_at, id): each page is an index range
+        scan starting after the cursor, so deep pages cost the same as the first.
+        Listing fields are denormalized on the conversation row, so the whole
+        page is one query.
+        
+        Returns:
+            Tuple of (conversations, next_cursor); next_cursor is None on the last page
+        """
+        query = select(Conversation).filter(Conversation.user_id == user_id)
+        if cursor:
+            updated_at, conversation_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                Conversation.updated_at < updated_at,
+                and_(Conversation.updated_at == updated_at, Conversation.id < conversation_id)
+            ))
+        conversations = list(await db.scalars(
+            query.order_by(desc(Conversation.updated_at), desc(Conversation.id)).limit(limit + 1)
+        ))
+        
+        if len(conversations) > limit:
+            conversations = conversations[:limit]
+            return conversations, encode_cursor(conversations[-1])
+        return conversations, None
     
-    def get_with_messages(self, db: Session, conversation_id: str) -> Optional[Conversation]:
+    async def get_with_messages(self, db: AsyncSession, conversation_id: str) -> Optional[Conversation]:
         """Get conversation with all its messages"""
-        return db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        return await db.scalar(
+            select(Conversation)
+            .options(selectinload(Conversation.messages))
+            .filter(Conversation.id == conversation_id)
+        )
     
-    def get_messages(self, db: Session, conversation_id: str, skip: int = 0, limit: int = 100) -> List[Message]:
+    async def get_messages(self, db: AsyncSession, conversation_id: str, skip: int = 0, limit: int = 100) -> List[Message]:
         """Get all messages for a conversation ordered by sequence"""
-        return db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.sequence_number).offset(skip).limit(limit).all()
+        result = await db.scalars(
+            select(Message).filter(
+                Message.conversation_id == conversation_id
+            ).order_by(Message.sequence_number).offset(skip).limit(limit)
+        )
+        return list(result)
     
-    def get_recent_messages(self, db: Session, conversation_id: str, limit: int = 10) -> List[Message]:
+    async def get_recent_messages(self, db: AsyncSession, conversation_id: str, limit: int = 10) -> List[Message]:
         """Get most recent messages for a conversation"""
-        messages = db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(desc(Message.sequence_number)).limit(limit).all()
-        return list(reversed(messages))
+        result = await db.scalars(
+            select(Message).filter(
+                Message.conversation_id == conversation_id
+            ).order_by(desc(Message.sequence_number)).limit(limit)
+        )
+        return list(reversed(result.all()))
     
-    def get_next_sequence_number(self, db: Session, conversation_id: str) -> int:
+    async def get_next_sequence_number(self, db: AsyncSession, conversation_id: str) -> int:
         """Get the next sequence number for a conversation"""
-        result = db.query(func.max(Message.sequence_number)).filter(
-            Message.conversation_id == conversation_id
-        ).scalar()
+        result = await db.scalar(
+            select(Conversation.message_sequence).filter(Conversation.id == conversation_id)
+        )
         return (result or 0) + 1
     
-    def add_message(
+    async def allocate_sequence_numbers(
+        self,
+        db: AsyncSession,
+        conversation_id: str,
+        count: int,
+        tokens_to_add: int = 0,
+        last_message: Optional[str] = None,
+        messages_added: int = 0,
+        touch: bool = True
+    ) -> int:
+        """
+        Atomically reserve `count` sequence numbers and add to the token total.
+        
+        Uses a single UPDATE ... RETURNING on the conversation's counter, so
+        concurrent writers never receive the same numbers. The listing fields
+        (message_count, last_message_preview) are maintained in the same
+        statement. With touch=False, updated_at is left unchanged, so
+        background writes do not reorder the conversation listing. Does not
+        commit.
+        
+        Returns:
+            The first reserved sequence number
+        """
+        values = {
+            "message_sequence": Conversation.message_sequence + count,
+            "total_tokens": func.coalesce(Conversation.total_tokens, 0) + tokens_to_add,
+        }
+        if messages_added:
+            values["message_count"] = Conversation.message_count + messages_added
+        if last_message is not None:
+            values["last_message_preview"] = message_preview(last_message)
+        if not touch:
+            values["updated_at"] = Conversation.updated_at
+        result = await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(**values)
+            .returning(Conversation.message_sequence)
+        )
+        last = result.scalar_one_or_none()
+        if last is None:
+            raise ValueError(f"Conversation not found: {conversation_id}")
+        return last - count + 1
+    
+    async def add_turn(self, db: AsyncSession, conversation_id: str, messages: List[Message]) -> List[Message]:
+        """
+        Persist a chat turn (e.g. user + assistant message) in one transaction.
+        
+        Sequence numbers and the conversation's total_tokens increment come
+        from one atomic UPDATE; the messages are inserted and committed once.
+        """
+        visible = [m for m in messages if not m.is_summary]
+        first = await self.allocate_sequence_numbers(
+            db,
+            conversation_id,
+            count=len(messages),
+            tokens_to_add=sum(m.token_count or 0 for m in visible),
+            last_message=visible[-1].content if visible else None,
+            messages_added=len(visible)
+        )
+        for offset, message in enumerate(messages):
+            message.conversation_id = conversation_id
+            message.sequence_number = first + offset
+        db.add_all(messages)
+        await db.commit()
+        return messages
+    
+    async def create_with_turn(self, db: AsyncSession, obj_in: dict, messages: List[Message]) -> Conversation:
+        """Create a conversation together with its first messages in one transaction"""
+        conversation = Conversation(
+            **obj_in,
+            message_sequence=len(messages),
+            total_tokens=sum(m.token_count or 0 for m in messages),
+            message_count=len(messages),
+            last_message_preview=message_preview(messages[-1].content) if messages else None
+        )
+        for offset, message in enumerate(messages, start=1):
+            message.sequence_number = offset
+            conversation.messages.append(message)
+        db.add(conversation)
+        await db.commit()
+        return conversation
+    
+    async def add_message(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         conversation_id: str, 
         role: MessageRole, 
         content: str, 
         token_count: int = 0
     ) -> Message:
         """Add a message to a conversation with proper sequencing"""
-        sequence_number = self.get_next_sequence_number(db, conversation_id)
+        sequence_number = await self.allocate_sequence_numbers(
+            db, conversation_id, count=1, last_message=content, messages_added=1
+        )
         
         message = Message(
             conversation_id=conversation_id,
@@ -104,65 +263,142 @@ class ConversationRepository(CRUDBase[Conversation], IConversationRepository):
             token_count=token_count
         )
         db.add(message)
-        db.commit()
-        db.refresh(message)
+        await db.commit()
         return message
     
-    def update_total_tokens(self, db: Session, conversation_id: str, tokens_to_add: int) -> None:
+    async def update_total_tokens(self, db: AsyncSession, conversation_id: str, tokens_to_add: int) -> None:
         """Update total token count for a conversation"""
-        conversation = self.get(db, conversation_id)
-        if conversation:
-            conversation.total_tokens += tokens_to_add
-            db.commit()
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(total_tokens=func.coalesce(Conversation.total_tokens, 0) + tokens_to_add)
+        )
+        await db.commit()
+    
+    async def get_latest_summary(self, db: AsyncSession, conversation_id: str) -> Optional[Message]:
+        """Get the most recent rolling summary message of a conversation"""
+        return await db.scalar(
+            select(Message).filter(
+                Message.conversation_id == conversation_id,
+                Message.is_summary.is_(True)
+            ).order_by(desc(Message.sequence_number)).limit(1)
+        )
+    
+    async def get_unsummarized_messages(
+        self,
+        db: AsyncSession,
+        conversation_id: str,
+        after_sequence: int,
+        before_sequence: int
+    ) -> List[Message]:
+        """Get non-summary messages strictly between two sequence numbers"""
+        result = await db.scalars(
+            select(Message).filter(
+                Message.conversation_id == conversation_id,
+                Message.is_summary.isnot(True),
+                Message.sequence_number > after_sequence,
+                Message.sequence_number < before_sequence
+            ).order_by(Message.sequence_number)
+        )
+        return list(result)
     
-    def get_message_count(self, db: Session, conversation_id: str) -> int:
+    async def add_summary(
+        self,
+        db: AsyncSession,
+        conversation_id: str,
+        content: str,
+        token_count: int,
+        summarized_until: int
+    ) -> Message:
+        """
+        Store a rolling summary and mark the messages it covers.
+        
+        Summaries are written in the background, so the conversation's
+        updated_at (the listing order and keyset cursor position) is kept.
+        """
+        summary = Message(
+            conversation_id=conversation_id,
+            role=MessageRole.SYSTEM,
+            content=content,
+            sequence_number=await self.allocate_sequence_numbers(db, conversation_id, count=1, touch=False),
+            token_count=token_count,
+            is_summary=True
+        )
+        db.add(summary)
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(summarized_until=summarized_until, updated_at=Conversation.updated_at)
+        )
+        await db.commit()
+        return summary
+    
+    async def get_message_count(self, db: AsyncSession, conversation_id: str) -> int:
         """Get total message count for a conversation"""
-        return db.query(Message).filter(Message.conversation_id == conversation_id).count()
+        return await db.scalar(
+            select(func.count()).select_from(Message).filter(Message.conversation_id == conversation_id)
+        )
     
-    def get_last_message(self, db: Session, conversation_id: str) -> Optional[Message]:
+    async def get_last_message(self, db: AsyncSession, conversation_id: str) -> Optional[Message]:
         """Get the last message in a conversation"""
-        return db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(desc(Message.sequence_number)).first()
+        return await db.scalar(
+            select(Message).filter(
+                Message.conversation_id == conversation_id
+            ).order_by(desc(Message.sequence_number)).limit(1)
+        )
 
 
 class MessageRepository(CRUDBase[Message], IMessageRepository):   
     def __init__(self):
         super().__init__(Message)
     
-    def get_messages_within_token_limit(
+    async def get_messages_within_token_limit(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         conversation_id: str, 
-        max_tokens: int
+        max_tokens: int,
+        max_messages: Optional[int] = None,
+        per_message_overhead: int = 0
     ) -> List[Message]:
         """
         Get messages within token limit using sliding window approach.
         Returns most recent messages that fit within the token budget.
+        Rolling summary messages are never part of the window.
+        
+        The budget is applied in SQL: only the newest `max_messages` rows are
+        scanned (backed by the conversation/sequence index) and a running sum of
+        the persisted token counts selects the newest prefix that fits, so the
+        cost is proportional to the window rather than the conversation length.
         """
-        all_messages = db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(desc(Message.sequence_number)).all()
+        recent = select(Message.id, Message.sequence_number, Message.token_count).filter(
+            Message.conversation_id == conversation_id,
+            Message.is_summary.isnot(True)
+        ).order_by(desc(Message.sequence_number))
+        if max_messages is not None:
+            recent = recent.limit(max_messages)
+        recent = recent.subquery()
         
-        selected_messages = []
-        current_tokens = 0
+        running_tokens = func.sum(
+            func.coalesce(recent.c.token_count, 0) + per_message_overhead
+        ).over(order_by=desc(recent.c.sequence_number)).label("running_tokens")
+        windowed = select(recent.c.id, running_tokens).subquery()
         
-        for message in all_messages:
-            if current_tokens + message.token_count <= max_tokens:
-                selected_messages.append(message)
-                current_tokens += message.token_count
-            else:
-                break
+        selected_ids = select(windowed.c.id).filter(windowed.c.running_tokens <= max_tokens)
         
-        return list(reversed(selected_messages))
+        result = await db.scalars(
+            select(Message).filter(
+                Message.id.in_(selected_ids)
+            ).order_by(Message.sequence_number)
+        )
+        return list(result)
     
-    def update_token_count(self, db: Session, message_id: str, token_count: int) -> Optional[Message]:
+    async def update_token_count(self, db: AsyncSession, message_id: str, token_count: int) -> Optional[Message]:
         """Update token count for a message"""
-        message = self.get(db, message_id)
+        message = await self.get(db, message_id)
         if message:
             message.token_count = token_count
-            db.commit()
-            db.refresh(message)
+            await db.commit()
+            await db.refresh(message)
         return message
 
 
@@ -0,0 +1,27 @@
+from typing import List
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.repositories.base import CRUDBase
+from app.models.ingestion_job import IngestionJob, JobStatus
+
+
+class IngestionJobRepository(CRUDBase[IngestionJob]):
+    
+    def __init__(self):
+        super().__init__(IngestionJob)
+    
+    async def update_fields(self, db: AsyncSession, job_id: str, **values) -> None:
+        """Update job columns with a single UPDATE (no load) and commit"""
+        await db.execute(update(IngestionJob).where(IngestionJob.id == job_id).values(**values))
+        await db.commit()
+    
+    async def get_unfinished(self, db: AsyncSession) -> List[IngestionJob]:
+        """Get jobs that are still queued or running"""
+        result = await db.scalars(
+            select(IngestionJob).filter(IngestionJob.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]))
+        )
+        return list(result)
+
+
+# singleton instance
+ingestion_job_repository = IngestionJobRepository()
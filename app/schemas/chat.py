@@ -108,7 +108,6 @@ class PaginationParams(BaseModel):
 class PaginatedConversations(BaseModel):
     """Paginated list of conversations"""
     items: List[ConversationSummary]
-    total: int
-    skip: int
     limit: int
+    next_cursor: Optional[str] = None
     has_more: bool
@@ -1,12 +1,22 @@
+from datetime import datetime
+from typing import Optional
 from pydantic import BaseModel
 
 
-class DocumentUploadResponse(BaseModel):
-    """Response after document upload and ingestion"""
-    document_id: str
-    filename: str
-    chunk_count: int
+class IngestionJobResponse(BaseModel):
+    """Status and progress of a background document ingestion job"""
+    job_id: str
     status: str
+    filename: str
+    document_id: Optional[str] = None
+    result_status: Optional[str] = None
+    error: Optional[str] = None
+    bytes_total: int
+    bytes_processed: int
+    chunks_total: int
+    chunks_embedded: int
+    created_at: datetime
+    updated_at: datetime
 
 
 class DocumentDeleteResponse(BaseModel):
@@ -4,10 +4,12 @@
 from app.services.chat_service import ChatService, chat_service, LLMProviderFactory
 from app.services.context_manager import ContextManager, create_context_manager
 from app.services.prompt_manager import PromptManager, PromptType, prompt_manager
+from app.services.summarizer import ConversationSummarizer
 
 # From master
 from app.services.ingestion_service import IngestionService, ingestion_service
 from app.services.rag_service import RAGService
+from app.services.ingestion_jobs import IngestionJobQueue, ingestion_job_queue
 
 __all__ = [
     "ChatService",
@@ -18,8 +20,11 @@ __all__ = [
     "PromptManager",
     "PromptType",
     "prompt_manager",
+    "ConversationSummarizer",
 
     "IngestionService",
     "ingestion_service",
     "RAGService",
+    "IngestionJobQueue",
+    "ingestion_job_queue",
 ]
@@ -0,0 +1,276 @@
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+import asyncio
+import heapq
+import json
+import math
+import re
+import sqlite3
+import threading
+
+from app.services.vectorstore.base import DocumentChunk, SearchFilter, SearchResult
+
+# Words, keeping codes such as "ERR-1042" or "v2.3.1" together
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+
+# Function words that would otherwise make almost any chunk a (weak) match
+STOPWORDS = frozenset("""
+    a about above after again all am an and any are as at be because been before being below between both but by
+    can could did do does doing down during each few for from further had has have having he her here hers herself
+    him himself his how i if in into is it its itself just me more most my myself no nor not now of off on once only
+    or other our ours ourselves out over own same she should so some such than that the their theirs them themselves
+    then there these they this those through to too under until up very was we were what when where which while who
+    whom why will with would you your yours yourself yourselves
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased terms of a text, without stopwords.
+
+    Compound codes are indexed whole and by their parts, so "ERR-1042"
+    matches queries for "err-1042" as well as "1042".
+    """
+    terms = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in re.split(r"[-./]", token) if part and part not in STOPWORDS)
+    return terms
+
+
+class BM25Index:
+    """
+    Okapi BM25 over document chunks, backed by an SQLite inverted index.
+
+    Postings (term, chunk, term frequency) are updated incrementally as
+    chunks are added or deleted, and corpus statistics are kept alongside,
+    so the index survives restarts and several processes can share the
+    file. Chunk text and metadata are stored too, so lexical hits can be
+    returned without a vector store lookup.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                document_id TEXT,
+                user_id TEXT,
+                file_type TEXT,
+                length INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_chunks_document ON chunks (document_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS ix_postings_chunk ON postings (chunk_id);
+            CREATE TABLE IF NOT EXISTS stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                chunk_count INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stats VALUES (0, 0, 0);
+            """
+        )
+        self._db.commit()
+
+    async def add(self, chunks: List[DocumentChunk]) -> None:
+        """Index chunks; chunks already indexed under the same id are replaced"""
+        if chunks:
+            await asyncio.to_thread(self._add, chunks)
+
+    def _add(self, chunks: List[DocumentChunk]) -> None:
+        with self._lock, self._db:
+            self._delete([chunk.id for chunk in chunks])
+            total_length = 0
+            for chunk in chunks:
+                metadata = chunk.metadata or {}
+                terms = Counter(tokenize(chunk.content))
+                length = sum(terms.values())
+                total_length += length
+                self._db.execute(
+                    "INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        chunk.id,
+                        metadata.get("document_id"),
+                        metadata.get("user_id"),
+                        metadata.get("file_type"),
+                        length,
+                        chunk.content,
+                        json.dumps(metadata)
+                    )
+                )
+                self._db.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?)",
+                    [(term, chunk.id, tf) for term, tf in terms.items()]
+                )
+            self._db.execute(
+                "UPDATE stats SET chunk_count = chunk_count + ?, total_length = total_length + ?",
+                (len(chunks), total_length)
+            )
+
+    async def delete_chunks(self, chunk_ids: List[str]) -> None:
+        if chunk_ids:
+            await asyncio.to_thread(self._delete_committed, chunk_ids)
+
+    async def delete_document(self, document_id: str) -> None:
+        def delete() -> None:
+            with self._lock:
+                rows = self._db.execute("SELECT chunk_id FROM chunks WHERE document_id = ?", (document_id,))
+                chunk_ids = [row[0] for row in rows]
+            self._delete_committed(chunk_ids)
+
+        await asyncio.to_thread(delete)
+
+    def _delete_committed(self, chunk_ids: List[str]) -> None:
+        with self._lock, self._db:
+            self._delete(chunk_ids)
+
+    def _delete(self, chunk_ids: List[str]) -> None:
+        """Remove chunks and their postings; the caller holds the lock and transaction"""
+        for chunk_id in chunk_ids:
+            row = self._db.execute("SELECT length FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            if row is None:
+                continue
+            self._db.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+            self._db.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id,))
+            self._db.execute(
+                "UPDATE stats SET chunk_count = chunk_count - 1, total_length = total_length - ?", (row[0],)
+            )
+
+    async def update_metadata(self, chunks: List[DocumentChunk]) -> None:
+        """Replace stored metadata of indexed chunks; their postings are unchanged"""
+        if not chunks:
+            return
+
+        def update() -> None:
+            with self._lock, self._db:
+                self._db.executemany(
+                    "UPDATE chunks SET metadata = ?, document_id = ?, user_id = ?, file_type = ? WHERE chunk_id = ?",
+                    [
+                        (
+                            json.dumps(chunk.metadata or {}),
+                            (chunk.metadata or {}).get("document_id"),
+                            (chunk.metadata or {}).get("user_id"),
+                            (chunk.metadata or {}).get("file_type"),
+                            chunk.id
+                        )
+                        for chunk in chunks
+                    ]
+                )
+
+        await asyncio.to_thread(update)
+
+    async def count(self) -> int:
+        """Number of indexed chunks"""
+        def count() -> int:
+            with self._lock:
+                return self._db.execute("SELECT chunk_count FROM stats").fetchone()[0]
+
+        return await asyncio.to_thread(count)
+
+    async def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[SearchFilter] = None,
+        min_score: float = 0.0
+    ) -> List[SearchResult]:
+        """
+        Top-k chunks by BM25 score for the query terms, among chunks matching filters.
+
+        min_score drops weak matches. It is compared with a chunk's score
+        relative to the most any chunk could score for the query's indexed
+        terms (all of them, at saturating frequency), so it lies in [0, 1);
+        terms that occur nowhere in the index do not count against a chunk.
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms or top_k <= 0:
+            return []
+        return await asyncio.to_thread(self._search, terms, top_k, filters, min_score)
+
+    def _search(
+        self,
+        terms: List[str],
+        top_k: int,
+        filters: Optional[SearchFilter],
+        min_score: float
+    ) -> List[SearchResult]:
+        placeholders = ", ".join("?" * len(terms))
+        conditions, params = self._filter_sql(filters)
+        with self._lock:
+            chunk_count, total_length = self._db.execute("SELECT chunk_count, total_length FROM stats").fetchone()
+            if chunk_count == 0:
+                return []
+            document_frequency = dict(self._db.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ))
+            postings = self._db.execute(
+                "SELECT p.chunk_id, p.term, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id "
+                f"WHERE p.term IN ({placeholders}){conditions}",
+                terms + params
+            ).fetchall()
+
+        average_length = total_length / chunk_count
+        idf = {
+            term: math.log(1 + (chunk_count - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+        scores: Dict[str, float] = {}
+        for chunk_id, term, tf, length in postings:
+            norm = self.k1 * (1 - self.b + self.b * length / average_length)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf[term] * tf * (self.k1 + 1) / (tf + norm)
+        if min_score > 0:
+            cutoff = min_score * (self.k1 + 1) * sum(idf.values())
+            scores = {chunk_id: score for chunk_id, score in scores.items() if score >= cutoff}
+
+        top = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return self._results(top)
+
+    @staticmethod
+    def _filter_sql(filters: Optional[SearchFilter]) -> Tuple[str, list]:
+        if filters is None:
+            return "", []
+        conditions, params = [], []
+        if filters.document_ids is not None:
+            conditions.append(f"c.document_id IN ({', '.join('?' * len(filters.document_ids))})")
+            params.extend(filters.document_ids)
+        if filters.user_id is not None:
+            conditions.append("c.user_id = ?")
+            params.append(filters.user_id)
+        if filters.file_type is not None:
+            conditions.append("c.file_type = ?")
+            params.append(filters.file_type)
+        return "".join(f" AND {condition}" for condition in conditions), params
+
+    def _results(self, top: List[Tuple[str, float]]) -> List[SearchResult]:
+        if not top:
+            return []
+        with self._lock:
+            rows = {
+                chunk_id: (content, metadata)
+                for chunk_id, content, metadata in self._db.execute(
+                    f"SELECT chunk_id, content, metadata FROM chunks WHERE chunk_id IN ({', '.join('?' * len(top))})",
+                    [chunk_id for chunk_id, _ in top]
+                )
+            }
+        return [
+            SearchResult(chunk_id=chunk_id, content=rows[chunk_id][0], score=score, metadata=json.loads(rows[chunk_id][1]))
+            for chunk_id, score in top
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -1,7 +1,10 @@
-from typing import List, Optional, Dict
-from sqlalchemy.orm import Session
+from typing import AsyncIterator, Callable, List, Optional, Dict, Any, Set
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 import logging
 
+import anyio
+
 from app.services.llm.base import BaseLLMProvider
 from app.services.llm.gemini import GeminiProvider
 from app.services.llm.groq import GroqProvider
@@ -9,6 +12,9 @@ from app.services.llm.openai import OpenAIProvider
 from app.services.context_manager import ContextManager, ContextWindowStrategy, create_context_manager
 from app.services.prompt_manager import PromptManager, PromptType, prompt_manager
 from app.services.rag_service import RAGService, rag_service
+from app.services.response_cache import ResponseCache, response_cache
+from app.services.summarizer import ConversationSummarizer
+from app.services.vectorstore.base import SearchFilter
 from app.repositories.conversation import ConversationRepository, MessageRepository
 from app.models.conversation import Conversation, Message, MessageRole, ConversationMode
 from app.schemas.chat import (
@@ -71,6 +77,7 @@ class ChatService:
     - LLM provider calls
     - Context window management
     - System prompt management via PromptManager
+    - Reuse of cached answers to first messages via ResponseCache
     """
     
     def __init__(
@@ -81,6 +88,10 @@ class ChatService:
         context_manager: Optional[ContextManager] = None,
         prompt_mgr: Optional[PromptManager] = None,
         rag_svc: Optional[RAGService] = None,
+        context_strategy: Optional[ContextWindowStrategy] = None,
+        summarizer: Optional[ConversationSummarizer] = None,
+        answer_cache: Optional[ResponseCache] = None,
+        session_factory: Optional[Callable[[], AsyncSession]] = None,
     ):
         self.conversation_repo = conversation_repo or ConversationRepository()
         self.message_repo = message_repo or MessageRepository()
@@ -88,6 +99,24 @@ class ChatService:
         self.context_manager = context_manager or create_context_manager()
         self.prompt_manager = prompt_mgr or prompt_manager
         self.rag_service = rag_svc or rag_service
+        self.context_strategy = context_strategy or ContextWindowStrategy(settings.CONTEXT_STRATEGY)
+        self._session_factory = session_factory
+        self.summarizer = summarizer or ConversationSummarizer(
+            llm_provider_getter=lambda: self.llm_provider,
+            context_manager=self.context_manager,
+            conversation_repo=self.conversation_repo,
+            prompt_mgr=self.prompt_manager,
+            session_factory=session_factory
+        )
+        self.response_cache = answer_cache or response_cache
+        self._write_tasks: Set[asyncio.Task] = set()
+    
+    def _open_session(self) -> AsyncSession:
+        if self._session_factory is None:
+            # Deferred so importing services does not require a configured database
+            from app.core.database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
     
     @property
     def llm_provider(self) -> BaseLLMProvider:
@@ -105,13 +134,48 @@ class ChatService:
         mode_value = mode.value if isinstance(mode, ConversationMode) else mode
         return self.prompt_manager.get_prompt_for_mode(mode_value, **kwargs)
     
+    async def _build_system_prompt(self, mode: ConversationMode, query: str, user_id: Optional[str] = None) -> str:
+        """
+        Build the system prompt for a turn.
+        
+        In RAG mode, RAGService packs the best retrieved chunks into what is
+        left of the system prompt token budget, so low-ranked chunks are
+        dropped rather than the prompt being truncated mid-chunk. With
+        RAG_TENANT_ISOLATION, only documents uploaded by user_id are searched.
+        """
+        if mode != ConversationMode.RAG:
+            return self._get_system_prompt_for_mode(mode)
+        
+        # Tokens used by the prompt around the document context
+        prompt_overhead = self.context_manager.count_tokens(
+            self._get_system_prompt_for_mode(mode, document_context="-")
+        )
+        budget = min(
+            self.context_manager.config.system_prompt_token_budget,
+            self.context_manager.available_context_tokens
+        ) - prompt_overhead
+        
+        filters = SearchFilter(user_id=user_id) if settings.RAG_TENANT_ISOLATION else None
+        context = await self.rag_service.retrieve_context(
+            query, top_k=settings.RAG_TOP_K, max_tokens=budget, filters=filters
+        )
+        return self._get_system_prompt_for_mode(mode, document_context=context.text)
+    
     async def create_conversation(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         request: CreateConversationRequest
     ) -> CreateConversationResponse:
         """
         Create a new conversation with the first message.
+        
+        The conversation and the user message are written before the LLM is
+        called, so a failed call does not lose what the user typed; the
+        reply and its token usage follow in a second transaction. For modes
+        with response caching enabled,
+        a cached answer to the same message under the same system prompt
+        (or, with a similarity threshold, a similar message) is returned
+        instead of calling the LLM.
         """
         try:
             conv_mode = ConversationMode.OPEN_CHAT if request.mode.value == "open_chat" else ConversationMode.RAG
@@ -121,42 +185,30 @@ class ChatService:
                 "title": request.title or self._generate_title(request.message),
                 "mode": conv_mode,
             }
-            conversation = self.conversation_repo.create(db, conversation_data)
             
-            user_token_count = self.context_manager.count_tokens(request.message)
-            user_message = self.conversation_repo.add_message(
-                db=db,
-                conversation_id=conversation.id,
-                role=MessageRole.USER,
-                content=request.message,
-                token_count=user_token_count
-            )
+            user_message = self._new_message(MessageRole.USER, request.message)
+            conversation = await self.conversation_repo.create_with_turn(db, conversation_data, [user_message])
+            cache_generation = self.response_cache.generation(conv_mode.value)
             
             # Get system prompt - with document context for RAG mode
-            if conv_mode == ConversationMode.RAG:
-                document_context = await self.rag_service.retrieve_context(request.message)
-                system_prompt = self._get_system_prompt_for_mode(conv_mode, document_context=document_context)
-            else:
-                system_prompt = self._get_system_prompt_for_mode(conv_mode)
-            
-            messages_for_llm = self._build_llm_messages(
-                messages=[user_message],
-                system_prompt=system_prompt
-            )
-            
-            assistant_content = await self._call_llm(messages_for_llm)
+            system_prompt = await self._build_system_prompt(conv_mode, request.message, request.user_id)
             
-            assistant_token_count = self.context_manager.count_tokens(assistant_content)
-            assistant_message = self.conversation_repo.add_message(
-                db=db,
-                conversation_id=conversation.id,
-                role=MessageRole.ASSISTANT,
-                content=assistant_content,
-                token_count=assistant_token_count
+            cache_embedding = await self._message_embedding(conv_mode, request.message)
+            assistant_content = self.response_cache.get(
+                conv_mode.value, system_prompt, request.message, embedding=cache_embedding
             )
-            
-            total_tokens = user_token_count + assistant_token_count
-            self.conversation_repo.update_total_tokens(db, conversation.id, total_tokens)
+            if assistant_content is None:
+                messages_for_llm = self._build_llm_messages(
+                    messages=[user_message],
+                    system_prompt=system_prompt
+                )
+                assistant_content = await self._call_llm(messages_for_llm)
+                self.response_cache.put(
+                    conv_mode.value, system_prompt, request.message, assistant_content,
+                    embedding=cache_embedding, generation=cache_generation
+                )
+            assistant_message = self._new_message(MessageRole.ASSISTANT, assistant_content)
+            await self.conversation_repo.add_turn(db, conversation.id, [assistant_message])
             
             return CreateConversationResponse(
                 conversation_id=conversation.id,
@@ -173,55 +225,44 @@ class ChatService:
     
     async def add_message(
         self,
-        db: Session,
+        db: AsyncSession,
         conversation_id: str,
         request: AddMessageRequest
     ) -> AddMessageResponse:
         """
         Add a message to an existing conversation.
+        
+        The user message is persisted before the LLM call, as in the
+        streaming variant; the assistant message and its token usage are
+        written in a second transaction once the LLM has answered.
         """
-        conversation = self.conversation_repo.get(db, conversation_id)
+        conversation = await self.conversation_repo.get(db, conversation_id)
         if not conversation:
             raise ChatException(f"Conversation not found: {conversation_id}")
         
         try:
-            existing_messages = self.conversation_repo.get_messages(db, conversation_id)
-            
-            user_token_count = self.context_manager.count_tokens(request.message)
-            user_message = self.conversation_repo.add_message(
-                db=db,
-                conversation_id=conversation_id,
-                role=MessageRole.USER,
-                content=request.message,
-                token_count=user_token_count
+            user_message = self._new_message(MessageRole.USER, request.message)
+            summary = await self._get_context_summary(db, conversation_id)
+            existing_messages = await self._load_context_history(
+                db, conversation_id, reserved_tokens=user_message.token_count + (summary.token_count if summary else 0)
             )
+            await self.conversation_repo.add_turn(db, conversation_id, [user_message])
             
             # Get system prompt - with document context for RAG mode
-            if conversation.mode == ConversationMode.RAG:
-                document_context = await self.rag_service.retrieve_context(request.message)
-                system_prompt = self._get_system_prompt_for_mode(conversation.mode, document_context=document_context)
-            else:
-                system_prompt = self._get_system_prompt_for_mode(conversation.mode)
+            system_prompt = await self._build_system_prompt(conversation.mode, request.message, conversation.user_id)
             
-            all_messages = existing_messages + [user_message]
             messages_for_llm = self._build_llm_messages(
-                messages=all_messages,
-                system_prompt=system_prompt
+                messages=existing_messages + [user_message],
+                system_prompt=system_prompt,
+                summary=summary
             )
             
             assistant_content = await self._call_llm(messages_for_llm)
+            assistant_message = self._new_message(MessageRole.ASSISTANT, assistant_content)
             
-            assistant_token_count = self.context_manager.count_tokens(assistant_content)
-            assistant_message = self.conversation_repo.add_message(
-                db=db,
-                conversation_id=conversation_id,
-                role=MessageRole.ASSISTANT,
-                content=assistant_content,
-                token_count=assistant_token_count
-            )
+            await self.conversation_repo.add_turn(db, conversation_id, [assistant_message])
             
-            total_tokens = user_token_count + assistant_token_count
-            self.conversation_repo.update_total_tokens(db, conversation_id, total_tokens)
+            self._schedule_summary(conversation_id, existing_messages)
             
             return AddMessageResponse(
                 conversation_id=conversation_id,
@@ -235,67 +276,211 @@ class ChatService:
             logger.error(f"Error adding message: {e}")
             raise ChatException(f"Failed to add message: {str(e)}")
     
-    def get_conversation(self, db: Session, conversation_id: str) -> ConversationDetail:
+    async def add_message_stream(
+        self,
+        db: AsyncSession,
+        conversation_id: str,
+        request: AddMessageRequest
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Add a message to an existing conversation and stream the AI response.
+        
+        Validation and context building happen eagerly so errors surface
+        before the response starts, and the user message is stored before
+        the first token, so it is kept even if the LLM fails or the client
+        disconnects. The returned iterator yields events of the form
+        {"event": ..., "data": {...}}:
+        - token: a chunk of the assistant response as soon as it is generated
+        - done: the persisted user and assistant messages
+        - error: the LLM call failed mid-stream
+        """
+        conversation = await self.conversation_repo.get(db, conversation_id)
+        if not conversation:
+            raise ChatException(f"Conversation not found: {conversation_id}")
+        
+        try:
+            user_message = self._new_message(MessageRole.USER, request.message)
+            summary = await self._get_context_summary(db, conversation_id)
+            existing_messages = await self._load_context_history(
+                db, conversation_id, reserved_tokens=user_message.token_count + (summary.token_count if summary else 0)
+            )
+            
+            system_prompt = await self._build_system_prompt(conversation.mode, request.message, conversation.user_id)
+            
+            messages_for_llm = self._build_llm_messages(
+                messages=existing_messages + [user_message],
+                system_prompt=system_prompt,
+                summary=summary
+            )
+            await self.conversation_repo.add_turn(db, conversation_id, [user_message])
+            self._schedule_summary(conversation_id, existing_messages)
+        except Exception as e:
+            logger.error(f"Error preparing streamed message: {e}")
+            raise ChatException(f"Failed to add message: {str(e)}")
+        
+        return self._stream_assistant_reply(conversation_id, user_message, messages_for_llm)
+    
+    async def _stream_assistant_reply(
+        self,
+        conversation_id: str,
+        user_message: Message,
+        messages_for_llm: List[Dict[str, str]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Relay LLM tokens and persist the assistant message once the stream ends.
+        
+        The reply is stored when the stream completes, or fails / is cancelled
+        by the client after producing output, so partial answers are never lost.
+        The write uses its own session, since the request's session may be
+        closed by the time a disconnected stream is finalized, and runs as a
+        separate task awaited under a shielded cancel scope, so cancelling the
+        stream does not cancel the write.
+        """
+        chunks: List[str] = []
+        error: Optional[Exception] = None
+        completed = False
+        assistant_message: Optional[Message] = None
+        try:
+            async for token in self.llm_provider.generate_stream(messages_for_llm):
+                chunks.append(token)
+                yield {"event": "token", "data": {"content": token}}
+            completed = True
+        except Exception as e:
+            logger.error(f"LLM stream failed: {e}")
+            error = e
+        finally:
+            assistant_content = "".join(chunks)
+            if completed or assistant_content:
+                assistant_message = self._new_message(MessageRole.ASSISTANT, assistant_content)
+                await self._persist_detached(conversation_id, [assistant_message])
+        
+        if error is not None:
+            yield {"event": "error", "data": {"detail": f"LLM service error: {str(error)}"}}
+            return
+        
+        response = AddMessageResponse(
+            conversation_id=conversation_id,
+            user_message=self._message_to_response(user_message),
+            assistant_message=self._message_to_response(assistant_message)
+        )
+        yield {"event": "done", "data": response.model_dump(mode="json")}
+    
+    async def _persist_detached(self, conversation_id: str, messages: List[Message]) -> None:
+        """Store messages in a task of their own that outlives cancellation of the caller"""
+        async def write() -> None:
+            async with self._open_session() as db:
+                await self.conversation_repo.add_turn(db, conversation_id, messages)
+        
+        task = asyncio.create_task(write())
+        self._write_tasks.add(task)
+        task.add_done_callback(self._write_tasks.discard)
+        with anyio.CancelScope(shield=True):
+            await asyncio.shield(task)
+    
+    def _new_message(self, role: MessageRole, content: str) -> Message:
+        """Create an unsaved message with its token count"""
+        return Message(role=role, content=content, token_count=self.context_manager.count_tokens(content))
+    
+    async def get_conversation(self, db: AsyncSession, conversation_id: str) -> ConversationDetail:
         """Get detailed conversation with all messages"""
-        conversation = self.conversation_repo.get_with_messages(db, conversation_id)
+        conversation = await self.conversation_repo.get_with_messages(db, conversation_id)
         if not conversation:
             raise ChatException(f"Conversation not found: {conversation_id}")
         
         return self._conversation_to_detail(conversation)
     
-    def list_conversations(
+    async def list_conversations(
         self,
-        db: Session,
+        db: AsyncSession,
         user_id: str,
-        skip: int = 0,
-        limit: int = 20
+        limit: int = 20,
+        cursor: Optional[str] = None
     ) -> PaginatedConversations:
-        """List all conversations for a user with pagination"""
-        conversations, total = self.conversation_repo.get_by_user(db, user_id, skip, limit)
+        """List conversations for a user, one cursor-paginated page at a time"""
+        try:
+            conversations, next_cursor = await self.conversation_repo.get_by_user(db, user_id, limit, cursor)
+        except ValueError as e:
+            raise ChatException(str(e))
         
-        items = [self._conversation_to_summary(db, conv) for conv in conversations]
+        items = [self._conversation_to_summary(conv) for conv in conversations]
         
         return PaginatedConversations(
             items=items,
-            total=total,
-            skip=skip,
             limit=limit,
-            has_more=(skip + len(items)) < total
+            next_cursor=next_cursor,
+            has_more=next_cursor is not None
         )
     
-    def delete_conversation(self, db: Session, conversation_id: str) -> bool:
+    async def delete_conversation(self, db: AsyncSession, conversation_id: str) -> bool:
         """Delete a conversation and all its messages"""
-        conversation = self.conversation_repo.get(db, conversation_id)
+        conversation = await self.conversation_repo.get(db, conversation_id)
         if not conversation:
             raise ChatException(f"Conversation not found: {conversation_id}")
         
-        return self.conversation_repo.delete(db, conversation_id)
+        return await self.conversation_repo.delete(db, conversation_id)
     
-    def get_conversation_history(
+    async def get_conversation_history(
         self, 
-        db: Session, 
+        db: AsyncSession, 
         conversation_id: str,
         skip: int = 0,
         limit: int = 100
     ) -> List[MessageResponse]:
         """Get message history for a conversation"""
-        conversation = self.conversation_repo.get(db, conversation_id)
+        conversation = await self.conversation_repo.get(db, conversation_id)
         if not conversation:
             raise ChatException(f"Conversation not found: {conversation_id}")
         
-        messages = self.conversation_repo.get_messages(db, conversation_id, skip, limit)
+        messages = await self.conversation_repo.get_messages(db, conversation_id, skip, limit)
         return [self._message_to_response(msg) for msg in messages]
     
+    async def _load_context_history(self, db: AsyncSession, conversation_id: str, reserved_tokens: int = 0) -> List[Message]:
+        """
+        Load only the newest messages that can fit in the context window.
+        
+        The token budget is applied by the repository using persisted token
+        counts, so per-turn cost depends on the window size, not the
+        conversation length. The message cap only applies to the strategies
+        that keep a fixed window; TRUNCATE_OLDEST is bounded by tokens alone.
+        """
+        overhead = self.context_manager.max_message_overhead_tokens
+        max_messages = (
+            None if self.context_strategy == ContextWindowStrategy.TRUNCATE_OLDEST
+            else self.context_manager.config.sliding_window_messages
+        )
+        return await self.message_repo.get_messages_within_token_limit(
+            db,
+            conversation_id,
+            max_tokens=self.context_manager.available_context_tokens - reserved_tokens - overhead,
+            max_messages=max_messages,
+            per_message_overhead=overhead
+        )
+    
+    async def _get_context_summary(self, db: AsyncSession, conversation_id: str) -> Optional[Message]:
+        """Latest rolling summary, when the SUMMARIZE strategy is active"""
+        if self.context_strategy != ContextWindowStrategy.SUMMARIZE:
+            return None
+        return await self.conversation_repo.get_latest_summary(db, conversation_id)
+    
+    def _schedule_summary(self, conversation_id: str, history: List[Message]) -> None:
+        """Queue a background summary of the messages older than this turn's history window"""
+        if self.context_strategy != ContextWindowStrategy.SUMMARIZE or not history:
+            return
+        self.summarizer.schedule(conversation_id, before_sequence=history[0].sequence_number)
+    
     def _build_llm_messages(
         self, 
         messages: List[Message], 
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        summary: Optional[Message] = None
     ) -> List[Dict[str, str]]:
         """
         Build messages for LLM with sliding window context management.
         Converts Message models to LLM-compatible format.
         """
         message_dicts = [msg.to_llm_format() for msg in messages]
+        # Reuse persisted counts; rows without one are counted on the fly
+        token_counts = [msg.token_count or None for msg in messages]
         
         # Debug logging
         if system_prompt:
@@ -305,7 +490,9 @@ class ChatService:
         context = self.context_manager.build_context(
             messages=message_dicts,
             system_prompt=system_prompt,
-            strategy=ContextWindowStrategy.SLIDING_WINDOW
+            strategy=self.context_strategy,
+            token_counts=token_counts,
+            summary=summary.content if summary else None
         )
         
         # Log what's being sent to LLM
@@ -315,6 +502,19 @@ class ChatService:
         
         return context
     
+    async def _message_embedding(self, mode: ConversationMode, message: str) -> Optional[List[float]]:
+        """
+        Query embedding for the cache's similarity tier, computed once per
+        message and shared by the lookup and the store after a miss.
+        """
+        if not self.response_cache.enabled_for(mode.value) or not self.response_cache.semantic:
+            return None
+        try:
+            return await self.rag_service.embed_query(message)
+        except Exception as e:
+            logger.warning(f"Response cache similarity lookup skipped: {e}")
+            return None
+    
     async def _call_llm(self, messages: List[Dict[str, str]]) -> str:
         """Call the LLM provider with error handling"""
         try:
@@ -357,17 +557,8 @@ class ChatService:
             updated_at=conversation.updated_at
         )
     
-    def _conversation_to_summary(self, db: Session, conversation: Conversation) -> ConversationSummary:
+    def _conversation_to_summary(self, conversation: Conversation) -> ConversationSummary:
         """Convert Conversation model to ConversationSummary schema"""
-        message_count = self.conversation_repo.get_message_count(db, conversation.id)
-        last_message = self.conversation_repo.get_last_message(db, conversation.id)
-        
-        last_message_preview = None
-        if last_message:
-            last_message_preview = last_message.content[:100]
-            if len(last_message.content) > 100:
-                last_message_preview += "..."
-        
         return ConversationSummary(
             id=conversation.id,
             user_id=conversation.user_id,
@@ -375,8 +566,8 @@ class ChatService:
             mode=conversation.mode.value if isinstance(conversation.mode, ConversationMode) else conversation.mode,
             total_tokens=conversation.total_tokens,
             is_active=conversation.is_active,
-            message_count=message_count,
-            last_message_preview=last_message_preview,
+            message_count=conversation.message_count,
+            last_message_preview=conversation.last_message_preview,
             created_at=conversation.created_at,
             updated_at=conversation.updated_at
         )
@@ -1,8 +1,14 @@
 from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
 from typing import List, Dict, Optional
 from dataclasses import dataclass
 from enum import Enum
+import hashlib
 import logging
+import threading
 import tiktoken
 
 
@@ -11,6 +17,11 @@ logger = logging.getLogger(__name__)
 
 class TokenCounterStrategy(ABC):
     
+    # Token overhead per message (role, content separators, etc.)
+    tokens_per_message: int = 4
+    # Tokens priming the assistant reply, counted once per message list
+    tokens_per_reply: int = 3
+    
     @abstractmethod
     def count_tokens(self, text: str) -> int:
         """Count tokens in a text string"""
@@ -20,6 +31,32 @@ class TokenCounterStrategy(ABC):
     def count_messages_tokens(self, messages: List[Dict[str, str]]) -> int:
         """Count total tokens in a list of messages"""
         pass
+    
+    def count_message_tokens(self, message: Dict[str, str], content_tokens: Optional[int] = None) -> int:
+        """Count tokens for a single message, reusing a precomputed content count if given"""
+        if content_tokens is None:
+            content_tokens = self.count_tokens(message.get("content", ""))
+        return self.tokens_per_message + self.count_tokens(message.get("role", "")) + content_tokens
+    
+    def count_many(self, texts: List[str]) -> List[int]:
+        """Count tokens for several texts at once"""
+        return [self.count_tokens(text) for text in texts]
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Truncate text to at most max_tokens tokens"""
+        if max_tokens <= 0:
+            return ""
+        
+        # Generic fallback: binary search for the right length
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count_tokens(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        
+        return text[:low]
 
 
 class TiktokenCounter(TokenCounterStrategy):
@@ -27,7 +64,12 @@ class TiktokenCounter(TokenCounterStrategy):
     Token counter using tiktoken library (for OpenAI-compatible models).
     """
     
-    def __init__(self, model: str = "gpt-3.5-turbo"):
+    ROLES = ("user", "assistant", "system")
+    
+    # Fewer cache misses than this are encoded inline; thread hand-off costs more
+    PARALLEL_MIN_BATCH = 32
+    
+    def __init__(self, model: str = "gpt-3.5-turbo", cache_size: int = 4096, num_threads: int = 8):
         try:
             self.encoding = tiktoken.encoding_for_model(model)
         except KeyError:
@@ -35,20 +77,134 @@ class TiktokenCounter(TokenCounterStrategy):
         
         # Token overhead per message (role, content separators, etc.)
         self.tokens_per_message = 4  # Approximate overhead per message
+        self._role_tokens = {role: len(self.encoding.encode(role)) for role in self.ROLES}
+        
+        # Bounded LRU of content hash -> token count
+        self.num_threads = num_threads
+        self._cache_size = cache_size
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    @staticmethod
+    def _cache_key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    
+    def _cache_get(self, key: bytes) -> Optional[int]:
+        with self._cache_lock:
+            count = self._cache.get(key)
+            if count is None:
+                self.cache_misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return count
+    
+    def _cache_put(self, key: bytes, count: int) -> None:
+        if self._cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = count
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
     
     def count_tokens(self, text: str) -> int:
         """Count tokens in a text string"""
-        return len(self.encoding.encode(text))
+        if not text:
+            return 0
+        key = self._cache_key(text)
+        count = self._cache_get(key)
+        if count is None:
+            count = len(self.encoding.encode(text))
+            self._cache_put(key, count)
+        return count
+    
+    def count_many(self, texts: List[str]) -> List[int]:
+        """
+        Count tokens for several texts.
+        
+        Cache misses are encoded inline, or, from PARALLEL_MIN_BATCH misses
+        on, in parallel on one executor shared by all calls (tiktoken releases
+        the GIL while encoding).
+        """
+        counts: List[int] = [0] * len(texts)
+        misses: Dict[bytes, List[int]] = {}
+        for i, text in enumerate(texts):
+            if not text:
+                continue
+            key = self._cache_key(text)
+            if key in misses:
+                misses[key].append(i)
+                continue
+            count = self._cache_get(key)
+            if count is None:
+                misses[key] = [i]
+            else:
+                counts[i] = count
+        
+        if misses:
+            keys = list(misses)
+            batch = [texts[misses[key][0]] for key in keys]
+            if len(batch) < self.PARALLEL_MIN_BATCH or self.num_threads <= 1:
+                encoded = [self.encoding.encode(text) for text in batch]
+            else:
+                encoded = list(self._get_executor().map(self.encoding.encode, batch))
+            for key, tokens in zip(keys, encoded):
+                self._cache_put(key, len(tokens))
+                for i in misses[key]:
+                    counts[i] = len(tokens)
+        return counts
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._cache_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.num_threads, thread_name_prefix="tiktoken")
+            return self._executor
+    
+    def _count_role(self, role: str) -> int:
+        count = self._role_tokens.get(role)
+        return count if count is not None else self.count_tokens(role)
+    
+    def count_message_tokens(self, message: Dict[str, str], content_tokens: Optional[int] = None) -> int:
+        """Count tokens for a single message, reusing a precomputed content count if given"""
+        if content_tokens is None:
+            content_tokens = self.count_tokens(message.get("content", ""))
+        return self.tokens_per_message + self._count_role(message.get("role", "")) + content_tokens
     
     def count_messages_tokens(self, messages: List[Dict[str, str]]) -> int:
         """Count total tokens in a list of messages"""
         total = 0
-        for message in messages:
+        content_counts = self.count_many([message.get("content", "") for message in messages])
+        for message, content_tokens in zip(messages, content_counts):
             total += self.tokens_per_message
-            total += self.count_tokens(message.get("role", ""))
-            total += self.count_tokens(message.get("content", ""))
-        total += 3  
+            total += self._count_role(message.get("role", ""))
+            total += content_tokens
+        total += self.tokens_per_reply
         return total
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Truncate text by encoding once and decoding the kept token prefix"""
+        if max_tokens <= 0:
+            return ""
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        # Drop a multi-byte character split at the cut instead of emitting U+FFFD
+        return self.encoding.decode_bytes(tokens[:max_tokens]).decode("utf-8", errors="ignore")
+    
+    def cache_info(self) -> Dict:
+        """Get token-count cache statistics"""
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "size": len(self._cache),
+            "max_size": self._cache_size,
+            "hit_rate": self.cache_hits / lookups if lookups else 0.0
+        }
 
 
 class SimpleTokenCounter(TokenCounterStrategy):
@@ -57,14 +213,20 @@ class SimpleTokenCounter(TokenCounterStrategy):
         """Approximate tokens using character count / 4"""
         return len(text) // 4 + 1
     
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Truncate directly by the inverse of the character estimate"""
+        if max_tokens <= 0:
+            return ""
+        return text[:4 * max_tokens - 1]
+    
     def count_messages_tokens(self, messages: List[Dict[str, str]]) -> int:
         """Count total tokens in a list of messages"""
         total = 0
         for message in messages:
-            total += 4  # Overhead per message
+            total += self.tokens_per_message
             total += self.count_tokens(message.get("role", ""))
             total += self.count_tokens(message.get("content", ""))
-        return total + 3
+        return total + self.tokens_per_reply
 
 
 @dataclass
@@ -87,6 +249,8 @@ class ContextManager:
     Manages LLM context with sliding window approach.
     """
     
+    SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+    
     def __init__(
         self, 
         config: Optional[ContextConfig] = None,
@@ -115,11 +279,21 @@ class ContextManager:
         """Count total tokens in messages"""
         return self.token_counter.count_messages_tokens(messages)
     
+    @property
+    def max_message_overhead_tokens(self) -> int:
+        """Upper bound of per-message tokens not covered by the content count"""
+        return max(
+            self.token_counter.count_message_tokens({"role": role, "content": ""}, content_tokens=0)
+            for role in ("user", "assistant", "system")
+        )
+    
     def build_context(
         self,
         messages: List[Dict[str, str]],
         system_prompt: Optional[str] = None,
-        strategy: ContextWindowStrategy = ContextWindowStrategy.SLIDING_WINDOW
+        strategy: ContextWindowStrategy = ContextWindowStrategy.SLIDING_WINDOW,
+        token_counts: Optional[List[Optional[int]]] = None,
+        summary: Optional[str] = None
     ) -> List[Dict[str, str]]:
         """
         Build context for LLM call with sliding window approach.
@@ -128,6 +302,9 @@ class ContextManager:
             messages: List of messages in conversation
             system_prompt: Optional system prompt to include
             strategy: Strategy for handling context limits
+            token_counts: Optional persisted content token counts aligned with
+                messages; None entries are counted on the fly
+            summary: Rolling summary of older turns, used by the SUMMARIZE strategy
             
         Returns:
             List of messages that fit within token limits
@@ -162,38 +339,95 @@ class ContextManager:
                     context.append(system_message)
                     available_tokens -= system_tokens
         
+        # Summary of turns that fell out of the window, followed by the recent tail
+        if strategy == ContextWindowStrategy.SUMMARIZE and summary:
+            summary_message = {"role": "system", "content": f"{self.SUMMARY_PREFIX}{summary}"}
+            summary_tokens = self.token_counter.count_message_tokens(summary_message)
+            if summary_tokens <= available_tokens:
+                context.append(summary_message)
+                available_tokens -= summary_tokens
+            else:
+                logger.warning(f"Conversation summary too large ({summary_tokens} tokens), skipping it")
+        
         if strategy == ContextWindowStrategy.SLIDING_WINDOW:
-            context.extend(self._apply_sliding_window(messages, available_tokens))
+            context.extend(self._apply_sliding_window(messages, available_tokens, token_counts))
         elif strategy == ContextWindowStrategy.TRUNCATE_OLDEST:
-            context.extend(self._truncate_oldest(messages, available_tokens))
+            context.extend(self._truncate_oldest(messages, available_tokens, token_counts))
         else:
-            # Default to sliding window
-            context.extend(self._apply_sliding_window(messages, available_tokens))
+            # Default to sliding window (SUMMARIZE keeps the recent tail this way)
+            context.extend(self._apply_sliding_window(messages, available_tokens, token_counts))
         
         return context
     
     def _truncate_to_fit(self, text: str, max_tokens: int) -> str:
         """Truncate text to fit within token limit"""
-        if max_tokens <= 0:
-            return ""
+        return self.token_counter.truncate(text, max_tokens)
+    
+    def select_chunks(
+        self,
+        chunks: List[str],
+        max_tokens: int,
+        separator: str = "\n\n---\n\n"
+    ) -> List[int]:
+        """
+        Select whole document chunks that fit within a token budget.
         
-        # Binary search for the right length
-        low, high = 0, len(text)
-        while low < high:
-            mid = (low + high + 1) // 2
-            truncated = text[:mid]
-            tokens = self.token_counter.count_tokens(truncated)
-            if tokens <= max_tokens:
-                low = mid
-            else:
-                high = mid - 1
+        Chunks are expected in priority order (highest retrieval score first).
+        Each chunk is kept if it still fits, otherwise skipped, so lower-scoring
+        chunks are dropped instead of the context being cut mid-sentence.
         
-        return text[:low]
+        Returns:
+            Indices of the kept chunks, in input order
+        """
+        if max_tokens <= 0 or not chunks:
+            return []
+        
+        separator_tokens = self.token_counter.count_tokens(separator)
+        chunk_tokens = self.token_counter.count_many(chunks)
+        
+        selected = []
+        used_tokens = 0
+        for i, tokens in enumerate(chunk_tokens):
+            cost = tokens + (separator_tokens if selected else 0)
+            if used_tokens + cost <= max_tokens:
+                selected.append(i)
+                used_tokens += cost
+        
+        return selected
+    
+    def _message_token_counts(
+        self,
+        messages: List[Dict[str, str]],
+        token_counts: Optional[List[Optional[int]]] = None
+    ) -> List[int]:
+        """
+        Per-message token cost (overhead + role + content).
+        
+        Persisted content counts are reused; the rest are counted in one batch.
+        """
+        content_counts = list(token_counts) if token_counts else [None] * len(messages)
+        missing = [i for i, count in enumerate(content_counts) if count is None]
+        if missing:
+            counted = self.token_counter.count_many([messages[i].get("content", "") for i in missing])
+            for i, count in zip(missing, counted):
+                content_counts[i] = count
+        
+        return [
+            self.token_counter.count_message_tokens(message, count)
+            for message, count in zip(messages, content_counts)
+        ]
+    
+    @staticmethod
+    def _window_start(costs: List[int], max_tokens: int) -> int:
+        """Index where the longest newest suffix of costs fitting max_tokens begins"""
+        suffix_sums = list(accumulate(reversed(costs)))
+        return len(costs) - bisect_right(suffix_sums, max_tokens)
     
     def _apply_sliding_window(
         self, 
         messages: List[Dict[str, str]], 
-        max_tokens: int
+        max_tokens: int,
+        token_counts: Optional[List[Optional[int]]] = None
     ) -> List[Dict[str, str]]:
         """
         Apply sliding window to keep most recent messages within token limit.
@@ -202,28 +436,18 @@ class ContextManager:
             return []
         
         # Limit to max sliding window size first
-        recent_messages = messages[-self.config.sliding_window_messages:]
-        
-        selected = []
-        current_tokens = 0
-        
-        for message in reversed(recent_messages):
-            message_tokens = self.token_counter.count_messages_tokens([message])
-            
-            if current_tokens + message_tokens <= max_tokens:
-                selected.insert(0, message) 
-                current_tokens += message_tokens
-            else:
-                if not selected and messages:
-                    selected = [messages[-1]]
-                break
+        window = self.config.sliding_window_messages
+        recent_messages = messages[-window:]
+        costs = self._message_token_counts(recent_messages, token_counts[-window:] if token_counts else None)
         
-        return selected
+        # Always keep at least the latest message
+        return recent_messages[self._window_start(costs, max_tokens):] or [messages[-1]]
     
     def _truncate_oldest(
         self, 
         messages: List[Dict[str, str]], 
-        max_tokens: int
+        max_tokens: int,
+        token_counts: Optional[List[Optional[int]]] = None
     ) -> List[Dict[str, str]]:
         """
         Truncate oldest messages to fit within token limit.
@@ -231,12 +455,13 @@ class ContextManager:
         if not messages:
             return []
         
-        result = list(messages)
+        costs = self._message_token_counts(messages, token_counts)
+        # prefix_sums[i] is the cost of the i oldest messages
+        prefix_sums = [0, *accumulate(costs)]
+        total = prefix_sums[-1] + self.token_counter.tokens_per_reply
         
-        while result and self.token_counter.count_messages_tokens(result) > max_tokens:
-            result.pop(0)
-        
-        return result
+        start = bisect_left(prefix_sums, total - max_tokens)
+        return messages[start:]
     
     def add_message_to_context(
         self,
@@ -250,22 +475,23 @@ class ContextManager:
         new_message = {"role": role, "content": content}
         updated_context = context + [new_message]
         
-        total_tokens = self.token_counter.count_messages_tokens(updated_context)
+        costs = self._message_token_counts(updated_context)
+        total_tokens = sum(costs) + self.token_counter.tokens_per_reply
         
         if total_tokens > self.available_context_tokens:
             system_message = None
+            available_tokens = self.available_context_tokens
             if updated_context and updated_context[0].get("role") == "system":
                 system_message = updated_context[0]
+                available_tokens -= costs[0] + self.token_counter.tokens_per_reply
                 updated_context = updated_context[1:]
+                costs = costs[1:]
             
-            # Apply sliding window
-            updated_context = self._apply_sliding_window(
-                updated_context, 
-                self.available_context_tokens - (
-                    self.token_counter.count_messages_tokens([system_message]) 
-                    if system_message else 0
-                )
-            )
+            # Apply sliding window over the already computed costs
+            window = self.config.sliding_window_messages
+            recent_messages = updated_context[-window:]
+            start = self._window_start(costs[-window:], available_tokens)
+            updated_context = recent_messages[start:] or [updated_context[-1]]
             
             # Prepend system message if it existed
             if system_message:
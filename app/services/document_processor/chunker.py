@@ -1,7 +1,9 @@
-from typing import List
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, List, Optional
 from dataclasses import dataclass
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from app.services.context_manager import TokenCounterStrategy
+
 
 @dataclass
 class TextChunk:
@@ -12,14 +14,33 @@ class TextChunk:
 
 
 class TextChunker:
-    """Text chunking service using LangChain splitters"""
+    """
+    Text chunking service using LangChain splitters.
+    
+    chunk_size and chunk_overlap are measured in characters, or in tokens
+    when a token_counter is given. Sharing the ContextManager's counter
+    makes chunks fit prompt token budgets predictably; its LRU cache keeps
+    the splitter's repeated length checks on recurring pieces cheap.
+    """
+    
+    # Chunks held back at the end of the buffer, since more text may still change them
+    HOLDBACK_CHUNKS = 2
+    # Rough characters per token, to size the streaming buffer in token mode
+    CHARS_PER_TOKEN = 4
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        token_counter: Optional[TokenCounterStrategy] = None
+    ):
+        self.chunk_size = chunk_size
+        self.token_counter = token_counter
         self._splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             add_start_index=True,
-            length_function=len,
+            length_function=token_counter.count_tokens if token_counter else len,
         )
     
     def chunk_text(self, text: str) -> List[TextChunk]:
@@ -32,3 +53,69 @@ class TextChunker:
             )
             for i, doc in enumerate(docs)
         ]
+    
+    def iter_chunks(self, segments: Iterable[str]) -> Iterator[TextChunk]:
+        """
+        Chunk a document given as consecutive text segments (pages, blocks).
+        
+        Only a few chunks' worth of text is buffered: whenever the buffer
+        holds enough text, every chunk but the last HOLDBACK_CHUNKS is
+        emitted and the buffer restarts at the first held-back chunk, so
+        overlap carries across segment boundaries. start_index is relative
+        to the whole document.
+        """
+        stream = _ChunkStream(self)
+        for segment in segments:
+            yield from stream.push(segment)
+        yield from stream.finish()
+    
+    async def aiter_chunks(self, segments: AsyncIterable[str]) -> AsyncIterator[TextChunk]:
+        """Async variant of iter_chunks, e.g. over DocumentProcessor.iter_text"""
+        stream = _ChunkStream(self)
+        async for segment in segments:
+            for chunk in stream.push(segment):
+                yield chunk
+        for chunk in stream.finish():
+            yield chunk
+
+
+class _ChunkStream:
+    """Buffer state of one iter_chunks/aiter_chunks call"""
+    
+    def __init__(self, chunker: TextChunker):
+        self._chunker = chunker
+        chars_per_unit = TextChunker.CHARS_PER_TOKEN if chunker.token_counter else 1
+        self._buffer_size = 4 * chunker.chunk_size * chars_per_unit
+        self._buffer = ""
+        self._offset = 0  # Document position of the buffer start
+        self._next_index = 0
+    
+    def push(self, segment: str) -> List[TextChunk]:
+        self._buffer += segment
+        if len(self._buffer) < self._buffer_size:
+            return []
+        chunks = self._chunker.chunk_text(self._buffer)
+        ready = len(chunks) - TextChunker.HOLDBACK_CHUNKS
+        if ready <= 0:
+            return []
+        emitted = self._emit(chunks[:ready])
+        restart = chunks[ready].start_index
+        self._buffer = self._buffer[restart:]
+        self._offset += restart
+        return emitted
+    
+    def finish(self) -> List[TextChunk]:
+        emitted = self._emit(self._chunker.chunk_text(self._buffer)) if self._buffer else []
+        self._buffer = ""
+        return emitted
+    
+    def _emit(self, chunks: List[TextChunk]) -> List[TextChunk]:
+        emitted = []
+        for chunk in chunks:
+            emitted.append(TextChunk(
+                content=chunk.content,
+                start_index=self._offset + chunk.start_index,
+                chunk_index=self._next_index
+            ))
+            self._next_index += 1
+        return emitted
@@ -1,11 +1,131 @@
-from typing import Tuple
-from langchain_community.document_loaders import PyPDFLoader
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Optional, Tuple, Union
+from pypdf import PdfReader
+import asyncio
+import codecs
+import hashlib
+import io
+import multiprocessing
 import tempfile
 import os
 
+from app.core.config import settings
+from app.core.exceptions import DocumentTooLargeException
+
+# Raw document bytes, or the path of a file holding them (e.g. a spooled upload)
+DocumentSource = Union[bytes, str, os.PathLike]
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Joins the text of consecutive PDF pages
+PAGE_SEPARATOR = "\n\n"
+
+# A text segment and how far into the source it reaches, as (done, total) in any unit
+_Segment = Tuple[str, int, int]
+
+
+@dataclass
+class ExtractionProgress:
+    """Bytes of the source consumed by DocumentProcessor.iter_text so far"""
+    bytes_processed: int = 0
+
+
+def source_size(source: DocumentSource) -> int:
+    """Size of a document source in bytes"""
+    if isinstance(source, bytes):
+        return len(source)
+    return os.path.getsize(source)
+
+
+async def source_sha256(source: DocumentSource) -> str:
+    """SHA-256 of a document source; files are hashed block by block off the event loop"""
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    
+    def hash_file() -> str:
+        digest = hashlib.sha256()
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    return await asyncio.to_thread(hash_file)
+
+
+async def spool_stream(
+    read: Callable[[int], Awaitable[bytes]],
+    max_bytes: int,
+    suffix: str = "",
+    directory: Optional[str] = None
+) -> str:
+    """
+    Copy an async byte stream (e.g. UploadFile.read) into a temporary file.
+    
+    Data is moved block by block, so memory use does not depend on the
+    upload size. Raises DocumentTooLargeException, leaving no file behind,
+    once more than max_bytes have been read. Returns the file path; the
+    caller owns the file.
+    """
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=directory)
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while block := await read(READ_BLOCK_SIZE):
+                written += len(block)
+                if written > max_bytes:
+                    raise DocumentTooLargeException(f"Upload exceeds the {max_bytes} byte limit")
+                await asyncio.to_thread(out.write, block)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+
+def extract_pdf_pages(path: str, start: int = 0, stop: Optional[int] = None) -> List[str]:
+    """Extract the text of pages [start, stop); module-level so worker processes can run it"""
+    reader = PdfReader(path)
+    return [page.extract_text() for page in reader.pages[start:stop]]
+
+
+def _iter_pdf_pages(path: str) -> Iterator[_Segment]:
+    reader = PdfReader(path)
+    page_count = len(reader.pages)
+    for number, page in enumerate(reader.pages, start=1):
+        yield page.extract_text(), number, page_count
+
+
+def _iter_text_blocks(path: str) -> Iterator[_Segment]:
+    """Decode a UTF-8 file block by block, tracking the byte offset (newlines translated like text mode)"""
+    size = os.path.getsize(path)
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+    offset = 0
+    with open(path, "rb") as f:
+        while block := f.read(READ_BLOCK_SIZE):
+            offset += len(block)
+            yield decoder.decode(block), offset, size
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail, offset, size
+
+
+async def _iterate_in_thread(iterator: Iterator[_Segment]) -> AsyncIterator[_Segment]:
+    """Drive a blocking iterator from a worker thread, one item at a time"""
+    done = object()
+    while (item := await asyncio.to_thread(next, iterator, done)) is not done:
+        yield item
+
 
 class DocumentProcessor:
-    """Process different document types and extract text"""
+    """
+    Process different document types and extract text.
+    
+    Text is produced lazily as segments (PDF pages, blocks of a text file)
+    whose concatenation is the document text. PDFs are parsed off the event
+    loop: page by page in a thread, or, for documents longer than
+    pages_per_task, as page ranges spread over a process pool.
+    """
     
     SUPPORTED_TYPES = {
         "application/pdf": "pdf",
@@ -13,21 +133,24 @@ class DocumentProcessor:
         "text/markdown": "md",
     }
     
-    async def process(self, content: bytes, filename: str, content_type: str) -> Tuple[str, str]:
+    def __init__(self, pdf_processes: Optional[int] = None, pages_per_task: Optional[int] = None):
+        self.pdf_processes = pdf_processes if pdf_processes is not None else settings.PDF_EXTRACT_PROCESSES
+        self.pages_per_task = pages_per_task or settings.PDF_PAGES_PER_TASK
+        self._pool: Optional[ProcessPoolExecutor] = None
+    
+    async def process(self, source: DocumentSource, filename: str, content_type: str) -> Tuple[str, str]:
         """
         Process document and extract text.
+        
+        The source may be raw bytes or a file path; files are read in place
+        rather than copied into memory.
         Returns (extracted_text, file_type)
         """
-        file_type = self._get_file_type(filename, content_type)
-        
-        if file_type == "pdf":
-            text = await self._process_pdf(content)
-        else:
-            text = await self._process_text(content)
-        
-        return text, file_type
+        file_type = self.get_file_type(filename, content_type)
+        segments = [segment async for segment in self.iter_text(source, file_type)]
+        return "".join(segments), file_type
     
-    def _get_file_type(self, filename: str, content_type: str) -> str:
+    def get_file_type(self, filename: str, content_type: str) -> str:
         if content_type in self.SUPPORTED_TYPES:
             return self.SUPPORTED_TYPES[content_type]
         
@@ -36,17 +159,109 @@ class DocumentProcessor:
             return "pdf"
         return "txt"
     
-    async def _process_pdf(self, content: bytes) -> str:
+    async def iter_text(
+        self,
+        source: DocumentSource,
+        file_type: str,
+        progress: Optional[ExtractionProgress] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield the document text in segments as they are extracted.
+        
+        progress, if given, is updated before each segment with the bytes
+        of the source read so far: exact for text files, and in proportion
+        to the pages extracted for PDFs.
+        """
+        if file_type == "pdf":
+            pages = self._iter_pdf(source)
+        else:
+            pages = self._iter_plain_text(source)
+        size = source_size(source) if progress is not None else 0
+        first = True
+        async for segment, done, total in pages:
+            if progress is not None:
+                progress.bytes_processed = size * done // total if total else size
+            if file_type == "pdf" and not first:
+                segment = PAGE_SEPARATOR + segment
+            first = False
+            yield segment
+    
+    async def _iter_pdf(self, source: DocumentSource) -> AsyncIterator[_Segment]:
+        if not isinstance(source, bytes):
+            async for page in self._iter_pdf_file(os.fspath(source)):
+                yield page
+            return
+        
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(content)
+            tmp.write(source)
             tmp_path = tmp.name
         
         try:
-            loader = PyPDFLoader(tmp_path)
-            pages = loader.load()
-            return "\n\n".join(page.page_content for page in pages)
+            async for page in self._iter_pdf_file(tmp_path):
+                yield page
         finally:
             os.unlink(tmp_path)
     
-    async def _process_text(self, content: bytes) -> str:
-        return content.decode("utf-8")
+    async def _iter_pdf_file(self, path: str) -> AsyncIterator[_Segment]:
+        if self.pdf_processes > 0:
+            page_count = await asyncio.to_thread(lambda: len(PdfReader(path).pages))
+            if page_count > self.pages_per_task:
+                async for page in self._iter_pdf_parallel(path, page_count):
+                    yield page
+                return
+        
+        async for page in _iterate_in_thread(_iter_pdf_pages(path)):
+            yield page
+    
+    async def _iter_pdf_parallel(self, path: str, page_count: int) -> AsyncIterator[_Segment]:
+        """
+        Extract page ranges in worker processes and yield pages in order.
+        
+        At most two ranges per process are in flight, so pages are handed
+        downstream while later ranges are still being parsed.
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        starts = iter(range(0, page_count, self.pages_per_task))
+        pending: deque = deque()
+        
+        def submit_next() -> None:
+            start = next(starts, None)
+            if start is not None:
+                pending.append(loop.run_in_executor(pool, extract_pdf_pages, path, start, start + self.pages_per_task))
+        
+        done = 0
+        try:
+            for _ in range(2 * self.pdf_processes):
+                submit_next()
+            while pending:
+                pages = await pending.popleft()
+                submit_next()
+                for page in pages:
+                    done += 1
+                    yield page, done, page_count
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn rather than fork: the server process runs threads (event loop executors, Chroma)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.pdf_processes,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+    
+    async def _iter_plain_text(self, source: DocumentSource) -> AsyncIterator[_Segment]:
+        if isinstance(source, bytes):
+            yield source.decode("utf-8"), len(source), len(source)
+            return
+        async for block in _iterate_in_thread(_iter_text_blocks(os.fspath(source))):
+            yield block
+    
+    def close(self) -> None:
+        """Shut down the PDF worker processes, if any were started"""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
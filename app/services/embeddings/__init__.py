@@ -2,10 +2,12 @@ from app.services.embeddings.base import BaseEmbeddingProvider
 from app.services.embeddings.gemini import GeminiEmbeddingProvider
 from app.services.embeddings.openai import OpenAIEmbeddingProvider
 from app.services.embeddings.factory import EmbeddingFactory
+from app.services.embeddings.cache import CachedEmbeddingProvider
 
 __all__ = [
     "BaseEmbeddingProvider",
     "GeminiEmbeddingProvider", 
     "OpenAIEmbeddingProvider",
     "EmbeddingFactory",
+    "CachedEmbeddingProvider",
 ]
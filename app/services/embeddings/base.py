@@ -1,20 +1,53 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional
+import asyncio
+
+from app.core.config import settings
 
 
 class BaseEmbeddingProvider(ABC):
     """Abstract base class for embedding providers (Strategy Pattern)"""
     
+    def __init__(self, batch_size: Optional[int] = None, max_concurrency: Optional[int] = None):
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        self.max_concurrency = max_concurrency or settings.EMBEDDING_MAX_CONCURRENCY
+    
     @abstractmethod
     async def embed_text(self, text: str) -> List[float]:
         """Generate embedding for a single text"""
         pass
     
-    @abstractmethod
     async def embed_texts(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts"""
+        """
+        Generate embeddings for multiple texts.
+        
+        Texts are split into batches of `batch_size` that are embedded
+        concurrently (at most `max_concurrency` requests in flight); the
+        result keeps the input order.
+        """
+        if not texts:
+            return []
+        
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def run(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self._embed_batch(batch)
+        
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        return [embedding for batch_result in results for embedding in batch_result]
+    
+    @abstractmethod
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch of texts with a single provider request"""
         pass
     
+    @property
+    def model_name(self) -> str:
+        """Identifier of the embedding model (vectors from different models are incompatible)"""
+        return getattr(self, "MODEL_NAME", type(self).__name__)
+    
     @property
     @abstractmethod
     def dimension(self) -> int:
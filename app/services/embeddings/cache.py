@@ -0,0 +1,163 @@
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+from app.core.config import settings
+from app.services.embeddings.base import BaseEmbeddingProvider
+
+logger = logging.getLogger(__name__)
+
+
+class CachedEmbeddingProvider(BaseEmbeddingProvider):
+    """
+    Caching decorator around an embedding provider for query embeddings.
+
+    embed_text results are kept in an in-process LRU with a TTL and, when a
+    path is given, in a SQLite tier that survives restarts. Keys combine the
+    provider's model name with the whitespace-normalized text, which is also
+    what gets embedded, so a cached vector always matches its key and
+    switching models never returns stale vectors. Case is kept: "AB-7731"
+    and "ab-7731" may embed differently. Bulk embed_texts calls (ingestion)
+    pass through.
+    """
+
+    # Bumped when the key derivation changes, so old SQLite rows are not reused
+    KEY_VERSION = 2
+
+    def __init__(
+        self,
+        provider: BaseEmbeddingProvider,
+        max_size: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        super().__init__(provider.batch_size, provider.max_concurrency)
+        self.provider = provider
+        self.max_size = max_size if max_size is not None else settings.EMBEDDING_CACHE_SIZE
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.EMBEDDING_CACHE_TTL
+        self._clock = clock
+        self._cache: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @property
+    def model_name(self) -> str:
+        return self.provider.model_name
+
+    @property
+    def dimension(self) -> int:
+        return self.provider.dimension
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Whitespace-insensitive form of a query"""
+        return " ".join(text.split())
+
+    def cache_key(self, text: str) -> str:
+        raw = f"{self.model_name}\x00{self.KEY_VERSION}\x00{self.normalize(text)}"
+        return hashlib.blake2b(raw.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+    async def embed_text(self, text: str) -> List[float]:
+        text = self.normalize(text)
+        key = self.cache_key(text)
+
+        embedding = self._memory_get(key)
+        if embedding is not None:
+            self.hits += 1
+            return embedding
+
+        if self._db is not None:
+            embedding = await asyncio.to_thread(self._disk_get, key)
+            if embedding is not None:
+                self.disk_hits += 1
+                self._memory_put(key, embedding)
+                return embedding
+
+        self.misses += 1
+        embedding = await self.provider.embed_text(text)
+        self._memory_put(key, embedding)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_put, key, embedding)
+        return embedding
+
+    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        return await self.provider.embed_texts(texts)
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return await self.provider._embed_batch(texts)
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and self._clock() - created_at > self.ttl_seconds
+
+    def _memory_get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            created_at, embedding = entry
+            if self._expired(created_at):
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return embedding
+
+    def _memory_put(self, key: str, embedding: List[float]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = (self._clock(), embedding)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT vector, created_at FROM embedding_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or self._expired(row[1]):
+            return None
+        return array("d", row[0]).tolist()
+
+    def _disk_put(self, key: str, embedding: List[float]) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO embedding_cache (key, vector, created_at) VALUES (?, ?, ?)",
+                (key, array("d", embedding).tobytes(), self._clock())
+            )
+            self._db.commit()
+
+    def cache_info(self) -> Dict:
+        """Get query-embedding cache statistics"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "size": len(self._cache),
+            "max_size": self.max_size,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
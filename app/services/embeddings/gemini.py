@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
 from app.core.config import settings
@@ -11,17 +11,18 @@ class GeminiEmbeddingProvider(BaseEmbeddingProvider):
     MODEL_NAME = "models/embedding-001"
     DIMENSION = 768
     
-    def __init__(self):
+    def __init__(self, batch_size: Optional[int] = None, max_concurrency: Optional[int] = None):
+        super().__init__(batch_size, max_concurrency)
         self._client = GoogleGenerativeAIEmbeddings(
             model=self.MODEL_NAME,
             google_api_key=settings.GOOGLE_API_KEY
         )
     
     async def embed_text(self, text: str) -> List[float]:
-        return self._client.embed_query(text)
+        return await self._client.aembed_query(text)
     
-    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
-        return self._client.embed_documents(texts)
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return await self._client.aembed_documents(texts, batch_size=len(texts))
     
     @property
     def dimension(self) -> int:
@@ -0,0 +1,202 @@
+from dataclasses import dataclass
+from typing import Callable, Optional, Set
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import logging
+import os
+
+from app.core.config import settings
+from app.models.ingestion_job import IngestionJob, JobStatus
+from app.repositories.ingestion_job import IngestionJobRepository
+from app.services.ingestion_service import IngestionService, ingestion_service
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _QueuedUpload:
+    """Queued job; the upload itself waits in a spool file on disk"""
+    job_id: str
+    source_path: str
+    filename: str
+    content_type: str
+    document_id: Optional[str] = None
+    user_id: Optional[str] = None
+
+
+class IngestionJobQueue:
+    """
+    Runs document ingestion in the background with a bounded worker pool.
+
+    Uploads are spooled to disk, recorded as IngestionJob rows and put on an
+    in-process queue; `concurrency` workers pick them up and run
+    IngestionService on the spool file, writing status and progress counters
+    back to the database for clients to poll.
+    """
+
+    def __init__(
+        self,
+        ingestion: Optional[IngestionService] = None,
+        job_repo: Optional[IngestionJobRepository] = None,
+        session_factory: Optional[Callable[[], AsyncSession]] = None,
+        concurrency: Optional[int] = None,
+    ):
+        self.ingestion = ingestion or ingestion_service
+        self.job_repo = job_repo or IngestionJobRepository()
+        self._session_factory = session_factory
+        self.concurrency = concurrency or settings.INGESTION_WORKERS
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: Set[asyncio.Task] = set()
+
+    def _open_session(self) -> AsyncSession:
+        if self._session_factory is None:
+            # Deferred so importing services does not require a configured database
+            from app.core.database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    async def start(self) -> None:
+        """
+        Start the worker pool.
+
+        Jobs left unfinished by a previous process are queued again when
+        their spool file still exists, and failed otherwise.
+        """
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        async with self._open_session() as db:
+            for job in await self.job_repo.get_unfinished(db):
+                if job.source_path and os.path.exists(job.source_path):
+                    await self.job_repo.update_fields(db, job.id, status=JobStatus.QUEUED)
+                    self._queue.put_nowait(self._to_upload(job))
+                else:
+                    await self.job_repo.update_fields(
+                        db, job.id, status=JobStatus.FAILED, error="Interrupted by a server restart"
+                    )
+        for _ in range(self.concurrency):
+            self._workers.add(asyncio.create_task(self._worker()))
+        logger.info(f"Ingestion job queue started with {self.concurrency} workers")
+
+    async def stop(self) -> None:
+        """Cancel the workers; unfinished jobs are resumed on the next start"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def submit(
+        self,
+        db: AsyncSession,
+        source_path: str,
+        filename: str,
+        content_type: str,
+        document_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> IngestionJob:
+        """
+        Record a job for a spooled upload and queue it; returns immediately.
+
+        The queue takes ownership of the file at source_path and deletes it
+        once the job has finished.
+        """
+        if not self._workers:
+            await self.start()
+        try:
+            job = await self.job_repo.create(db, {
+                "filename": filename,
+                "content_type": content_type,
+                "source_path": source_path,
+                "document_id": document_id,
+                "user_id": user_id,
+                "bytes_total": os.path.getsize(source_path),
+            })
+        except Exception:
+            self._discard_source(source_path)
+            raise
+        self._queue.put_nowait(self._to_upload(job))
+        return job
+
+    @staticmethod
+    def _to_upload(job: IngestionJob) -> _QueuedUpload:
+        return _QueuedUpload(job.id, job.source_path, job.filename, job.content_type, job.document_id, job.user_id)
+
+    async def get(self, db: AsyncSession, job_id: str) -> Optional[IngestionJob]:
+        return await self.job_repo.get(db, job_id)
+
+    async def join(self) -> None:
+        """Wait until every queued job has been processed"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def _worker(self) -> None:
+        while True:
+            upload = await self._queue.get()
+            cancelled = False
+            try:
+                await self._run(upload)
+            except asyncio.CancelledError:
+                cancelled = True  # Stopped: keep the spool file so the job resumes on the next start
+                raise
+            except Exception as e:
+                # Failures outside ingest() (e.g. job status writes) must not kill the worker
+                logger.error(f"Ingestion job {upload.job_id} failed: {e}")
+                await self._mark_failed(upload.job_id, e)
+            finally:
+                if not cancelled:
+                    self._discard_source(upload.source_path)
+                self._queue.task_done()
+
+    async def _mark_failed(self, job_id: str, error: Exception) -> None:
+        """Record a failure in a fresh session; the job's own session may be unusable"""
+        try:
+            async with self._open_session() as db:
+                await self.job_repo.update_fields(
+                    db, job_id, status=JobStatus.FAILED, error=str(getattr(error, "detail", error))
+                )
+        except Exception as e:
+            logger.error(f"Could not mark ingestion job {job_id} failed: {e}")
+
+    async def _run(self, upload: _QueuedUpload) -> None:
+        async with self._open_session() as db:
+            async def on_progress(**counters) -> None:
+                await self.job_repo.update_fields(db, upload.job_id, **counters)
+
+            await self.job_repo.update_fields(db, upload.job_id, status=JobStatus.RUNNING)
+            try:
+                result = await self.ingestion.ingest(
+                    upload.source_path,
+                    upload.filename,
+                    upload.content_type,
+                    document_id=upload.document_id,
+                    on_progress=on_progress,
+                    user_id=upload.user_id
+                )
+            except Exception as e:
+                logger.error(f"Ingestion job {upload.job_id} failed: {e}")
+                await db.rollback()
+                await self.job_repo.update_fields(
+                    db, upload.job_id, status=JobStatus.FAILED, error=str(getattr(e, "detail", e))
+                )
+                return
+
+            await self.job_repo.update_fields(
+                db,
+                upload.job_id,
+                status=JobStatus.COMPLETED,
+                document_id=result.document_id,
+                result_status=result.status,
+                chunks_total=result.chunk_count,
+                chunks_embedded=result.embedded_count,
+                bytes_processed=os.path.getsize(upload.source_path)
+            )
+
+    @staticmethod
+    def _discard_source(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+ingestion_job_queue = IngestionJobQueue()
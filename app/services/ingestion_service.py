@@ -1,12 +1,24 @@
+import hashlib
 import uuid
 from dataclasses import dataclass
-from typing import Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
 
 from app.core.config import settings
+from app.core.exceptions import DocumentNotFoundException
+from app.models.conversation import ConversationMode
+from app.services.bm25_index import BM25Index
+from app.services.context_manager import default_context_manager
 from app.services.embeddings import EmbeddingFactory, BaseEmbeddingProvider
+from app.services.response_cache import ResponseCache, response_cache
 from app.services.vectorstore import VectorStoreFactory, BaseVectorStore
 from app.services.vectorstore.base import DocumentChunk
 from app.services.document_processor import DocumentProcessor, TextChunker
+from app.services.document_processor.chunker import TextChunk
+from app.services.document_processor.processor import DocumentSource, ExtractionProgress, source_sha256, source_size
+
+
+# Receives progress counters as keyword arguments (bytes_processed, chunks_total, chunks_embedded)
+ProgressCallback = Callable[..., Awaitable[None]]
 
 
 @dataclass
@@ -16,6 +28,8 @@ class IngestionResult:
     filename: str
     chunk_count: int
     status: str
+    embedded_count: int = 0
+    reused_count: int = 0
 
 
 class IngestionService:
@@ -26,17 +40,36 @@ class IngestionService:
         embedding_provider: BaseEmbeddingProvider = None,
         vector_store: BaseVectorStore = None,
         chunk_size: int = None,
-        chunk_overlap: int = None
+        chunk_overlap: int = None,
+        chunk_unit: str = None,
+        lexical_index: Optional[BM25Index] = None,
+        answer_cache: Optional[ResponseCache] = None
     ):
         # Lazy initialization - don't create providers if not explicitly passed
         self._embedding_provider = embedding_provider
         self._vector_store = vector_store
+        self._lexical_index = lexical_index
+        self._owns_lexical_index = False
+        self._response_cache = answer_cache or response_cache
         self._document_processor = DocumentProcessor()
-        self._chunker = TextChunker(
+        self._chunker = self._create_chunker(chunk_size, chunk_overlap, chunk_unit or settings.CHUNK_UNIT)
+        self._initialized = embedding_provider is not None and vector_store is not None
+    
+    @staticmethod
+    def _create_chunker(chunk_size: Optional[int], chunk_overlap: Optional[int], chunk_unit: str) -> TextChunker:
+        """Chunk by characters, or by tokens counted with the shared ContextManager counter"""
+        if chunk_unit == "tokens":
+            return TextChunker(
+                chunk_size=chunk_size or settings.CHUNK_SIZE_TOKENS,
+                chunk_overlap=chunk_overlap or settings.CHUNK_OVERLAP_TOKENS,
+                token_counter=default_context_manager.token_counter
+            )
+        if chunk_unit != "characters":
+            raise ValueError(f"Unknown chunk unit: {chunk_unit}")
+        return TextChunker(
             chunk_size=chunk_size or settings.CHUNK_SIZE,
             chunk_overlap=chunk_overlap or settings.CHUNK_OVERLAP
         )
-        self._initialized = embedding_provider is not None and vector_store is not None
     
     def _ensure_initialized(self):
         """Lazy initialization of embedding provider and vector store"""
@@ -47,55 +80,274 @@ class IngestionService:
                     raise ValueError("No API key configured for embedding provider. Set GOOGLE_API_KEY or OPENAI_API_KEY.")
             if self._vector_store is None:
                 self._vector_store = VectorStoreFactory.create()
+            if self._lexical_index is None and settings.LEXICAL_INDEX_ENABLED:
+                self._lexical_index = BM25Index(settings.LEXICAL_INDEX_PATH)
+                self._owns_lexical_index = True
             self._initialized = True
     
-    async def ingest(self, content: bytes, filename: str, content_type: str) -> IngestionResult:
+    async def ingest(
+        self,
+        source: DocumentSource,
+        filename: str,
+        content_type: str,
+        document_id: Optional[str] = None,
+        on_progress: Optional[ProgressCallback] = None,
+        user_id: Optional[str] = None
+    ) -> IngestionResult:
+        """
+        Ingest a document, or re-ingest an existing one when document_id is given.
+        
+        Chunks are content-addressed: their ids derive from a hash of the chunk
+        text, and embeddings already stored for a hash are reused instead of
+        re-computed. A new upload whose bytes match a stored document returns
+        that document unchanged. Re-ingesting only adds changed chunks, deletes
+        removed ones and refreshes the metadata of the rest.
+        
+        The source is raw bytes or the path of a (spooled) file, which is
+        hashed and parsed in place. Extraction, chunking, embedding and vector
+        writes are pipelined: chunks are processed in windows of one embedding
+        fan-out (batch_size * max_concurrency) as pages arrive, so memory use
+        does not grow with the document. Each window is also indexed in the
+        BM25 lexical index, when one is configured. on_progress, if given, is
+        awaited with updated counters (chunks, and bytes of the source
+        extracted so far) as windows finish. Cached RAG answers
+        are invalidated once the new version is complete.
+        
+        user_id, if given, owns the document: it is stored on every chunk for
+        filtered (tenant-scoped) search, duplicates are only looked up among
+        that user's documents, and other users' documents cannot be updated.
+        """
         self._ensure_initialized()
-        document_id = str(uuid.uuid4())
+        document_hash = await source_sha256(source)
         
-        text, file_type = await self._document_processor.process(content, filename, content_type)
+        existing_chunks: List[DocumentChunk] = []
+        if document_id is None:
+            duplicate_id = await self._vector_store.find_document_by_hash(document_hash, user_id=user_id)
+            if duplicate_id is not None:
+                duplicate_chunks = await self._vector_store.get_document_chunks(duplicate_id)
+                return IngestionResult(
+                    document_id=duplicate_id,
+                    filename=filename,
+                    chunk_count=len(duplicate_chunks),
+                    status="duplicate"
+                )
+            document_id = str(uuid.uuid4())
+        else:
+            existing_chunks = await self._owned_chunks(document_id, user_id)
+            if all((c.metadata or {}).get("document_hash") == document_hash for c in existing_chunks):
+                return IngestionResult(
+                    document_id=document_id,
+                    filename=filename,
+                    chunk_count=len(existing_chunks),
+                    status="unchanged"
+                )
         
-        text_chunks = self._chunker.chunk_text(text)
-        if not text_chunks:
+        file_type = self._document_processor.get_file_type(filename, content_type)
+        extraction = ExtractionProgress()
+        segments = self._document_processor.iter_text(source, file_type, progress=extraction)
+        window = self._embedding_provider.batch_size * self._embedding_provider.max_concurrency
+        
+        existing_ids = {chunk.id for chunk in existing_chunks}
+        current_ids: Set[str] = set()
+        added_ids: List[str] = []
+        occurrences: Dict[str, int] = {}
+        chunk_count = embedded_count = 0
+        try:
+            async for text_chunks in self._windows(self._chunker.aiter_chunks(segments), window):
+                document_chunks = self._build_chunks(
+                    document_id, document_hash, filename, file_type, text_chunks, occurrences, user_id
+                )
+                chunk_count += len(document_chunks)
+                await self._report(on_progress, chunks_total=chunk_count, bytes_processed=extraction.bytes_processed)
+                
+                added = [chunk for chunk in document_chunks if chunk.id not in existing_ids]
+                kept = [chunk for chunk in document_chunks if chunk.id in existing_ids]
+                current_ids.update(chunk.id for chunk in document_chunks)
+                
+                embedded_count += await self._attach_embeddings(added)
+                await self._report(on_progress, chunks_embedded=embedded_count)
+                
+                await self._vector_store.add_documents(added)
+                added_ids.extend(chunk.id for chunk in added)
+                await self._vector_store.update_metadata(kept)
+                if self._lexical_index is not None:
+                    await self._lexical_index.add(added)
+                    await self._lexical_index.update_metadata(kept)
+        except BaseException:
+            # Do not leave a half-written version behind
+            await self._delete_chunks(added_ids)
+            raise
+        await self._report(on_progress, bytes_processed=source_size(source))
+        
+        # Delete only after the new version is complete so the document never disappears from search
+        await self._delete_chunks(sorted(existing_ids - current_ids))
+        self._response_cache.invalidate(ConversationMode.RAG.value)
+        
+        if chunk_count == 0:
             return IngestionResult(
                 document_id=document_id,
                 filename=filename,
                 chunk_count=0,
                 status="empty"
             )
-        
-        embeddings = await self._embedding_provider.embed_texts(
-            [chunk.content for chunk in text_chunks]
+        return IngestionResult(
+            document_id=document_id,
+            filename=filename,
+            chunk_count=chunk_count,
+            status="updated" if existing_chunks else "completed",
+            embedded_count=embedded_count,
+            reused_count=chunk_count - embedded_count
+        )
+    
+    async def update_document(
+        self,
+        document_id: str,
+        source: DocumentSource,
+        filename: str,
+        content_type: str,
+        on_progress: Optional[ProgressCallback] = None,
+        user_id: Optional[str] = None
+    ) -> IngestionResult:
+        """Re-ingest a new version of a stored document, re-embedding only changed chunks"""
+        return await self.ingest(
+            source, filename, content_type, document_id=document_id, on_progress=on_progress, user_id=user_id
         )
+    
+    def _build_chunks(
+        self,
+        document_id: str,
+        document_hash: str,
+        filename: str,
+        file_type: str,
+        text_chunks: List[TextChunk],
+        occurrences: Dict[str, int],
+        user_id: Optional[str] = None
+    ) -> List[DocumentChunk]:
+        """
+        Create content-addressed chunks; repeated text within a document gets an occurrence suffix.
         
-        document_chunks = [
-            DocumentChunk(
-                id=f"{document_id}_{chunk.chunk_index}",
+        occurrences counts the hashes seen so far and is shared across the
+        windows of one document.
+        """
+        chunks = []
+        for chunk in text_chunks:
+            content_hash = self._hash(chunk.content.encode("utf-8"))
+            occurrence = occurrences.get(content_hash, 0)
+            occurrences[content_hash] = occurrence + 1
+            metadata = {
+                "document_id": document_id,
+                "filename": filename,
+                "chunk_index": chunk.chunk_index,
+                "start_index": chunk.start_index,
+                "file_type": file_type,
+                "content_hash": content_hash,
+                "document_hash": document_hash
+            }
+            if user_id is not None:
+                metadata["user_id"] = user_id
+            chunks.append(DocumentChunk(
+                id=f"{document_id}_{content_hash[:32]}_{occurrence}",
                 content=chunk.content,
-                embedding=embeddings[i],
-                metadata={
-                    "document_id": document_id,
-                    "filename": filename,
-                    "chunk_index": chunk.chunk_index,
-                    "start_index": chunk.start_index,
-                    "file_type": file_type
-                }
-            )
-            for i, chunk in enumerate(text_chunks)
-        ]
+                metadata=metadata
+            ))
+        return chunks
+    
+    async def _attach_embeddings(self, chunks: List[DocumentChunk]) -> int:
+        """
+        Fill in chunk embeddings, reusing stored vectors for known content.
         
-        await self._vector_store.add_documents(document_chunks)
+        Returns:
+            Number of distinct texts sent to the embedding provider
+        """
+        if not chunks:
+            return 0
+        hashes = {chunk.metadata["content_hash"]: chunk.content for chunk in chunks}
+        embeddings = await self._vector_store.get_embeddings_by_hash(list(hashes))
         
-        return IngestionResult(
-            document_id=document_id,
-            filename=filename,
-            chunk_count=len(document_chunks),
-            status="completed"
-        )
+        missing = [h for h in hashes if h not in embeddings]
+        if missing:
+            vectors = await self._embedding_provider.embed_texts([hashes[h] for h in missing])
+            embeddings.update(zip(missing, vectors))
+        
+        for chunk in chunks:
+            chunk.embedding = embeddings[chunk.metadata["content_hash"]]
+        return len(missing)
+    
+    @staticmethod
+    async def _windows(chunks: AsyncIterator[TextChunk], size: int) -> AsyncIterator[List[TextChunk]]:
+        """Group streamed chunks into lists of up to size"""
+        window: List[TextChunk] = []
+        async for chunk in chunks:
+            window.append(chunk)
+            if len(window) >= size:
+                yield window
+                window = []
+        if window:
+            yield window
     
-    async def delete_document(self, document_id: str) -> bool:
+    @staticmethod
+    async def _report(on_progress: Optional[ProgressCallback], **counters) -> None:
+        if on_progress is not None:
+            await on_progress(**counters)
+    
+    @staticmethod
+    def _hash(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+    
+    async def _delete_chunks(self, chunk_ids: List[str]) -> None:
+        await self._vector_store.delete_chunks(chunk_ids)
+        if self._lexical_index is not None:
+            await self._lexical_index.delete_chunks(chunk_ids)
+    
+    async def _owned_chunks(self, document_id: str, user_id: Optional[str]) -> List[DocumentChunk]:
+        """
+        Chunks of a document owned by user_id.
+        
+        A request without a user_id only reaches unowned documents; another
+        tenant's document is reported as missing rather than forbidden.
+        """
+        chunks = await self._vector_store.get_document_chunks(document_id)
+        owners = {(c.metadata or {}).get("user_id") for c in chunks}
+        if not chunks or owners != {user_id}:
+            raise DocumentNotFoundException(f"Document not found: {document_id}")
+        return chunks
+    
+    async def delete_document(self, document_id: str, user_id: Optional[str] = None) -> bool:
         self._ensure_initialized()
-        return await self._vector_store.delete_by_document_id(document_id)
+        await self._owned_chunks(document_id, user_id)
+        if self._lexical_index is not None:
+            await self._lexical_index.delete_document(document_id)
+        deleted = await self._vector_store.delete_by_document_id(document_id)
+        self._response_cache.invalidate(ConversationMode.RAG.value)
+        return deleted
+    
+    async def rebuild_lexical_index(self, only_if_empty: bool = False) -> int:
+        """
+        Index every chunk of the vector store in the BM25 index.
+        
+        Documents ingested before the lexical index was enabled are only
+        found by vector search until this runs. With only_if_empty, an index
+        that already holds chunks is left alone, which makes it cheap to call
+        on every startup. Returns the number of chunks indexed.
+        """
+        self._ensure_initialized()
+        if self._lexical_index is None:
+            return 0
+        if only_if_empty and await self._lexical_index.count() > 0:
+            return 0
+        indexed = 0
+        async for chunks in self._vector_store.iter_chunks():
+            await self._lexical_index.add(chunks)
+            indexed += len(chunks)
+        return indexed
+    
+    def close(self) -> None:
+        """Stop document extraction worker processes and close the lexical index this service opened"""
+        self._document_processor.close()
+        if self._owns_lexical_index:
+            self._lexical_index.close()
+            self._lexical_index = None
+            self._owns_lexical_index = False
 
 
 ingestion_service = IngestionService()
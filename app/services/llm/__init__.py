@@ -2,10 +2,13 @@ from app.services.llm.base import BaseLLMProvider
 from app.services.llm.gemini import GeminiProvider
 from app.services.llm.groq import GroqProvider
 from app.services.llm.openai import OpenAIProvider
+from app.services.llm.http_client import HTTPClientManager, http_client_manager
 
 __all__ = [
     "BaseLLMProvider",
     "GeminiProvider",
     "GroqProvider",
     "OpenAIProvider",
+    "HTTPClientManager",
+    "http_client_manager",
 ]
@@ -1,40 +1,90 @@
 """
 Groq LLM Provider Implementation
 """
-from typing import List, Dict
+from typing import List, Dict, Optional
+import json
 import httpx
 
 from app.services.llm.base import BaseLLMProvider
+from app.services.llm.http_client import http_client_manager
 from app.core.config import settings
 
 
 class GroqProvider(BaseLLMProvider):
     """Groq LLM provider implementation"""
     
-    def __init__(self, model: str = "llama-3.1-70b-versatile"):
+    SSE_DONE = "[DONE]"
+    
+    def __init__(self, model: str = "llama-3.1-70b-versatile", client: Optional[httpx.AsyncClient] = None):
         self.api_key = settings.GROQ_API_KEY
         self.model = model
         self.base_url = "https://api.groq.com/openai/v1"
+        self._client = client
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Injected client, or the shared pooled client opened in the app lifespan"""
+        return self._client or http_client_manager.client
+    
+    @property
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
     
     async def generate(self, messages: List[Dict[str, str]], **kwargs) -> str:
         """Generate a response using Groq API"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": self.model,
-                    "messages": messages,
-                    **kwargs
-                }
-            )
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
+        response = await self.client.post(
+            f"{self.base_url}/chat/completions",
+            headers=self._headers,
+            json={
+                "model": self.model,
+                "messages": messages,
+                **kwargs
+            }
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
     
     async def generate_stream(self, messages: List[Dict[str, str]], **kwargs):
         """Generate a streaming response using Groq API"""
-        # TODO: Implement streaming
-        pass
+        async with self.client.stream(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            headers=self._headers,
+            json={
+                "model": self.model,
+                "messages": messages,
+                "stream": True,
+                **kwargs
+            }
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                data = self._parse_sse_line(line)
+                if data is None:
+                    continue
+                if data == self.SSE_DONE:
+                    break
+                content = self._extract_delta_content(data)
+                if content:
+                    yield content
+    
+    @staticmethod
+    def _parse_sse_line(line: str) -> Optional[str]:
+        """Return the payload of an SSE `data:` line, or None for any other line"""
+        if not line.startswith("data:"):
+            return None
+        return line[len("data:"):].strip()
+    
+    @staticmethod
+    def _extract_delta_content(data: str) -> Optional[str]:
+        """Extract the content delta from an OpenAI-compatible stream chunk"""
+        chunk = json.loads(data)
+        if "error" in chunk:
+            raise RuntimeError(chunk["error"].get("message", "Groq stream error"))
+        choices = chunk.get("choices") or []
+        if not choices:
+            return None
+        return (choices[0].get("delta") or {}).get("content")
@@ -0,0 +1,58 @@
+"""
+Shared HTTP client for REST-based LLM providers
+"""
+from typing import Optional
+import importlib.util
+import logging
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClientManager:
+    """
+    Owns a long-lived, connection-pooled httpx.AsyncClient.
+    
+    Opened in the application lifespan and closed on shutdown so providers
+    reuse TCP/TLS connections instead of paying a handshake per request.
+    """
+    
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.http2 = False
+    
+    def _create_client(self) -> httpx.AsyncClient:
+        """Create a pooled client, using HTTP/2 when the h2 package is installed"""
+        self.http2 = settings.HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+        )
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared client, created on first use if the lifespan has not opened it"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+    
+    async def start(self) -> None:
+        """Open the shared client"""
+        self.client
+        logger.info(f"Shared HTTP client opened (max_connections={settings.HTTP_MAX_CONNECTIONS}, http2={self.http2})")
+    
+    async def close(self) -> None:
+        """Close the shared client and release pooled connections"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+http_client_manager = HTTPClientManager()
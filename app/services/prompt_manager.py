@@ -9,6 +9,7 @@ class PromptType(str, Enum):
     RAG = "rag"
     CODING_ASSISTANT = "coding_assistant"
     CUSTOMER_SUPPORT = "customer_support"
+    SUMMARY = "summary"
 
 
 class BasePromptTemplate(ABC):
@@ -138,6 +139,32 @@ Guidelines:
 You are here to help customers with their questions and concerns. Your goal is customer satisfaction."""
 
 
+class SummaryPrompt(BasePromptTemplate):
+    """System prompt for compressing older conversation turns into a rolling summary"""
+    
+    def get_prompt_type(self) -> PromptType:
+        return PromptType.SUMMARY
+    
+    def get_system_prompt(self, previous_summary: str = "", **kwargs) -> str:
+        base_prompt = """You maintain a running summary of a conversation between a user and BOT GPT.
+
+Guidelines:
+1. Merge the existing summary (if any) with the new transcript into one updated summary
+2. Keep facts, decisions, user preferences, open questions and names
+3. Drop greetings, filler and repeated content
+4. Write in the third person, as concise prose or short bullet points
+5. Output only the updated summary
+"""
+        if previous_summary:
+            base_prompt += f"""
+Existing Summary:
+---
+{previous_summary}
+---
+"""
+        return base_prompt
+
+
 class PromptManager:
     """
     Centralized manager for all system prompts.
@@ -160,6 +187,7 @@ class PromptManager:
         self.register_template(RAGPrompt())
         self.register_template(CodingAssistantPrompt())
         self.register_template(CustomerSupportPrompt())
+        self.register_template(SummaryPrompt())
     
     def register_template(self, template: BasePromptTemplate) -> None:
         """Register a new prompt template"""
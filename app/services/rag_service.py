@@ -1,23 +1,46 @@
-from typing import List, Optional
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import logging
 
-from app.services.embeddings import EmbeddingFactory, BaseEmbeddingProvider
+from app.core.config import settings
+from app.services.bm25_index import BM25Index
+from app.services.context_manager import TokenCounterStrategy, default_context_manager
+from app.services.embeddings import EmbeddingFactory, BaseEmbeddingProvider, CachedEmbeddingProvider
 from app.services.vectorstore import VectorStoreFactory, BaseVectorStore
+from app.services.vectorstore.base import SearchFilter, SearchResult
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class RetrievedContext:
+    """Document context packed for a prompt, with the chunks it was built from"""
+    text: str = ""
+    chunks: List[dict] = field(default_factory=list)
+    token_count: int = 0
+
+
 class RAGService:
     """Service for RAG operations - retrieves relevant document context"""
     
+    CHUNK_SEPARATOR = "\n\n---\n\n"
+    
     def __init__(
         self,
         embedding_provider: BaseEmbeddingProvider = None,
-        vector_store: BaseVectorStore = None
+        vector_store: BaseVectorStore = None,
+        token_counter: Optional[TokenCounterStrategy] = None,
+        lexical_index: Optional[BM25Index] = None
     ):
         self._embedding_provider = embedding_provider
         self._vector_store = vector_store
+        self._lexical_index = lexical_index
+        self.token_counter = token_counter or default_context_manager.token_counter
         self._initialized = embedding_provider is not None and vector_store is not None
+        self._owns_embedding_provider = embedding_provider is None
+        # Only the default wiring opens the shared on-disk lexical index
+        self._default_lexical = embedding_provider is None and vector_store is None and lexical_index is None
     
     def _ensure_initialized(self):
         """Lazy initialization of embedding provider and vector store"""
@@ -26,52 +49,249 @@ class RAGService:
                 self._embedding_provider = EmbeddingFactory.create()
                 if self._embedding_provider is None:
                     raise ValueError("No API key configured for embedding provider.")
+                if settings.EMBEDDING_CACHE_ENABLED:
+                    self._embedding_provider = CachedEmbeddingProvider(
+                        self._embedding_provider, path=settings.EMBEDDING_CACHE_PATH
+                    )
             if self._vector_store is None:
                 self._vector_store = VectorStoreFactory.create()
             self._initialized = True
     
-    async def retrieve_context(self, query: str, top_k: int = 5) -> str:
+    @property
+    def lexical_index(self) -> Optional[BM25Index]:
+        if self._lexical_index is None and self._default_lexical and settings.LEXICAL_INDEX_ENABLED:
+            self._lexical_index = BM25Index(settings.LEXICAL_INDEX_PATH)
+        return self._lexical_index
+    
+    def close(self) -> None:
+        """Close the SQLite files opened by the default wiring (lexical index, embedding cache)"""
+        if self._default_lexical and self._lexical_index is not None:
+            self._lexical_index.close()
+            self._lexical_index = None
+        if self._owns_embedding_provider and isinstance(self._embedding_provider, CachedEmbeddingProvider):
+            self._embedding_provider.close()
+    
+    def _vector_search_available(self) -> bool:
+        try:
+            self._ensure_initialized()
+            return True
+        except ValueError as e:
+            logger.warning(f"Vector search unavailable: {e}")
+            return False
+    
+    async def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        min_score: Optional[float] = None,
+        filters: Optional[SearchFilter] = None,
+        lexical_min_score: Optional[float] = None
+    ) -> List[SearchResult]:
+        """
+        Hybrid retrieval of the top_k chunks for a query.
+        
+        With a lexical index, BM25 and vector search run concurrently and
+        their rankings are fused with reciprocal-rank fusion, so exact-term
+        matches (error codes, SKUs) surface even when embeddings miss them.
+        When no embedding provider is configured, or the vector search fails,
+        the lexical results are used alone. min_score applies to vector
+        similarity and lexical_min_score to the normalized BM25 score (see
+        BM25Index.search), each before fusion.
+        """
+        min_score = settings.RAG_MIN_SCORE if min_score is None else min_score
+        lexical_min_score = settings.LEXICAL_MIN_SCORE if lexical_min_score is None else lexical_min_score
+        lexical = self.lexical_index
+        if lexical is None:
+            return await self._vector_search(query, top_k, min_score, filters)
+        if not self._vector_search_available():
+            return await lexical.search(query, top_k=top_k, filters=filters, min_score=lexical_min_score)
+        
+        vector_results, lexical_results = await asyncio.gather(
+            self._vector_search(query, top_k, min_score, filters),
+            lexical.search(query, top_k=top_k, filters=filters, min_score=lexical_min_score),
+            return_exceptions=True
+        )
+        if isinstance(vector_results, BaseException):
+            if not isinstance(vector_results, Exception):
+                raise vector_results
+            logger.warning(f"Vector search failed, using lexical results only: {vector_results}")
+            vector_results = []
+        if isinstance(lexical_results, BaseException):
+            if not isinstance(lexical_results, Exception):
+                raise lexical_results
+            logger.warning(f"Lexical search failed, using vector results only: {lexical_results}")
+            lexical_results = []
+        return self.fuse([vector_results, lexical_results], top_k=top_k)
+    
+    async def _vector_search(
+        self,
+        query: str,
+        top_k: int,
+        min_score: float,
+        filters: Optional[SearchFilter]
+    ) -> List[SearchResult]:
+        self._ensure_initialized()
+        query_embedding = await self._embedding_provider.embed_text(query)
+        results = await self._vector_store.search(query_embedding, top_k=top_k, filters=filters)
+        return [result for result in results if result.score >= min_score]
+    
+    @staticmethod
+    def fuse(rankings: List[List[SearchResult]], top_k: int, k: Optional[int] = None) -> List[SearchResult]:
+        """
+        Reciprocal-rank fusion: a chunk scores sum(1 / (k + rank)) over the rankings it appears in.
+        
+        Results carry the fused score, best first.
+        """
+        k = settings.HYBRID_RRF_K if k is None else k
+        fused: Dict[str, float] = {}
+        first_seen: Dict[str, SearchResult] = {}
+        for ranking in rankings:
+            for rank, result in enumerate(ranking, start=1):
+                fused[result.chunk_id] = fused.get(result.chunk_id, 0.0) + 1 / (k + rank)
+                first_seen.setdefault(result.chunk_id, result)
+        best = sorted(fused, key=fused.get, reverse=True)[:top_k]
+        return [replace(first_seen[chunk_id], score=fused[chunk_id]) for chunk_id in best]
+    
+    async def retrieve_context(
+        self,
+        query: str,
+        top_k: int = 5,
+        max_tokens: Optional[int] = None,
+        min_score: Optional[float] = None,
+        filters: Optional[SearchFilter] = None
+    ) -> RetrievedContext:
         """
         Retrieve relevant document context for a query.
         
         Args:
             query: The user's query to find relevant context for
-            top_k: Number of top results to retrieve
+            top_k: Number of candidate chunks to retrieve
+            max_tokens: Token budget for the rendered context (None for no limit)
+            min_score: Drop vector candidates scoring below this (default RAG_MIN_SCORE)
+            filters: Metadata restrictions pushed down into the stores
             
         Returns:
-            Formatted string containing relevant document chunks
+            The rendered context and metadata of the chunks packed into it
         """
         try:
-            self._ensure_initialized()
-            
-            # Generate embedding for the query
-            query_embedding = await self._embedding_provider.embed_text(query)
-            
-            # Search vector store for relevant chunks
-            results = await self._vector_store.search(query_embedding, top_k=top_k)
+            results = await self.search(query, top_k=top_k, min_score=min_score, filters=filters)
             
             if not results:
                 logger.info(f"No relevant documents found for query: {query[:50]}...")
-                return ""
-            
-            # Format the context from retrieved chunks
-            context_parts = []
-            for i, result in enumerate(results, 1):
-                source = result.metadata.get("filename", "Unknown") if result.metadata else "Unknown"
-                context_parts.append(f"[Source: {source}]\n{result.content}")
+                return RetrievedContext()
             
-            context = "\n\n---\n\n".join(context_parts)
-            logger.info(f"Retrieved {len(results)} relevant chunks for query")
-            logger.debug(f"Retrieved context length: {len(context)} chars")
-            logger.debug(f"Context preview: {context[:500]}...")
+            context = self.pack_context(results, max_tokens=max_tokens)
+            logger.info(f"Packed {len(context.chunks)} of {len(results)} retrieved chunks ({context.token_count} tokens)")
+            logger.debug(f"Context preview: {context.text[:500]}...")
             
             return context
             
         except Exception as e:
             logger.error(f"Error retrieving context: {e}")
-            return ""
+            return RetrievedContext()
     
-    async def retrieve_context_chunks(self, query: str, top_k: int = 5) -> List[dict]:
+    def pack_context(
+        self,
+        results: List[SearchResult],
+        max_tokens: Optional[int] = None,
+        min_score: Optional[float] = None
+    ) -> RetrievedContext:
+        """
+        Greedily pack the highest-scoring chunks into a token budget.
+        
+        Text a chunk shares with an already packed neighbor of the same
+        document (the chunker's overlap) is cut, and chunks left with nothing
+        new are skipped. A chunk that does not fit is skipped rather than
+        truncated, so a smaller lower-ranked chunk may still fill the gap.
+        """
+        separator_tokens = self.token_counter.count_tokens(self.CHUNK_SEPARATOR)
+        packed: Dict[str, List[Tuple[int, int]]] = {}  # document_id -> packed [start, end) spans
+        rendered: List[str] = []
+        chunks: List[dict] = []
+        used_tokens = 0
+        
+        for result in sorted(results, key=lambda r: r.score, reverse=True):
+            if min_score is not None and result.score < min_score:
+                break
+            metadata = result.metadata or {}
+            content, span = self._without_overlap(result.content, metadata, packed)
+            if not content.strip():
+                continue
+            
+            text = self.format_chunk(content, metadata)
+            tokens = self.token_counter.count_tokens(text)
+            cost = tokens + (separator_tokens if rendered else 0)
+            if max_tokens is not None and used_tokens + cost > max_tokens:
+                continue
+            
+            used_tokens += cost
+            rendered.append(text)
+            chunks.append({
+                "content": content,
+                "score": result.score,
+                "metadata": metadata,
+                "token_count": tokens
+            })
+            if span is not None:
+                packed.setdefault(metadata.get("document_id"), []).append(span)
+        
+        return RetrievedContext(text=self.CHUNK_SEPARATOR.join(rendered), chunks=chunks, token_count=used_tokens)
+    
+    @staticmethod
+    def _without_overlap(
+        content: str,
+        metadata: dict,
+        packed: Dict[str, List[Tuple[int, int]]]
+    ) -> Tuple[str, Optional[Tuple[int, int]]]:
+        """
+        Cut the parts of a chunk already covered by packed chunks of its document.
+        
+        Returns the remaining text (the longest uncovered run) and its span in
+        the document, or the chunk unchanged with no span if its position is unknown.
+        """
+        start = metadata.get("start_index")
+        if start is None:
+            return content, None
+        end = start + len(content)
+        
+        # Uncovered runs of [start, end)
+        runs = [(start, end)]
+        for covered_start, covered_end in packed.get(metadata.get("document_id"), []):
+            runs = [
+                piece
+                for run_start, run_end in runs
+                for piece in ((run_start, min(run_end, covered_start)), (max(run_start, covered_end), run_end))
+                if piece[0] < piece[1]
+            ]
+        if not runs:
+            return "", None
+        
+        run_start, run_end = max(runs, key=lambda run: run[1] - run[0])
+        return content[run_start - start:run_end - start], (run_start, run_end)
+    
+    async def embed_query(self, query: str) -> List[float]:
+        """Embedding of a query, through the query-embedding cache when enabled"""
+        self._ensure_initialized()
+        return await self._embedding_provider.embed_text(query)
+    
+    def embedding_cache_info(self) -> Optional[Dict]:
+        """Query-embedding cache statistics, if the provider is cached"""
+        if isinstance(self._embedding_provider, CachedEmbeddingProvider):
+            return self._embedding_provider.cache_info()
+        return None
+    
+    @staticmethod
+    def format_chunk(content: str, metadata: Optional[dict] = None) -> str:
+        """Render a retrieved chunk with its source for the system prompt"""
+        source = metadata.get("filename", "Unknown") if metadata else "Unknown"
+        return f"[Source: {source}]\n{content}"
+    
+    async def retrieve_context_chunks(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[SearchFilter] = None
+    ) -> List[dict]:
         """
         Retrieve relevant document chunks with metadata.
         
@@ -82,20 +302,55 @@ class RAGService:
             self._ensure_initialized()
             
             query_embedding = await self._embedding_provider.embed_text(query)
-            results = await self._vector_store.search(query_embedding, top_k=top_k)
+            results = await self._vector_store.search(query_embedding, top_k=top_k, filters=filters)
             
-            return [
-                {
-                    "content": r.content,
-                    "score": r.score,
-                    "metadata": r.metadata
-                }
-                for r in results
-            ]
+            return self._to_dicts(results)
             
         except Exception as e:
             logger.error(f"Error retrieving context chunks: {e}")
             return []
+    
+    async def search_many(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        filters: Optional[SearchFilter] = None
+    ) -> List[List[dict]]:
+        """
+        Retrieve chunks for several queries (e.g. query expansions) with one vector search.
+        
+        Query embeddings go through the cache concurrently; the vector store
+        then answers every query in a single call.
+        
+        Returns:
+            One list of chunk dicts (content, score, metadata) per query, in query order
+        """
+        if not queries:
+            return []
+        try:
+            self._ensure_initialized()
+            
+            query_embeddings = await asyncio.gather(
+                *(self._embedding_provider.embed_text(query) for query in queries)
+            )
+            results = await self._vector_store.search_many(list(query_embeddings), top_k=top_k, filters=filters)
+            
+            return [self._to_dicts(query_results) for query_results in results]
+            
+        except Exception as e:
+            logger.error(f"Error retrieving context chunks: {e}")
+            return [[] for _ in queries]
+    
+    @staticmethod
+    def _to_dicts(results: List[SearchResult]) -> List[dict]:
+        return [
+            {
+                "content": r.content,
+                "score": r.score,
+                "metadata": r.metadata
+            }
+            for r in results
+        ]
 
 
 # Singleton instance - lazy initialized
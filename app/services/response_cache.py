@@ -0,0 +1,204 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+from app.core.config import settings
+
+
+@dataclass
+class _CachedAnswer:
+    answer: str
+    created_at: float
+    bucket: Tuple[str, str]
+    embedding: Optional[np.ndarray] = None
+
+
+class ResponseCache:
+    """
+    Cache of LLM answers to the first message of a conversation.
+
+    The exact tier is keyed on (mode, system prompt hash, normalized
+    message); the system prompt carries any retrieved document context, so
+    a RAG answer is only reused for the same context. With a
+    similarity_threshold, a miss falls back to the cached message in the
+    same (mode, system prompt) bucket whose embedding has the highest cosine
+    similarity, if it reaches the threshold.
+
+    Only modes listed in `modes` are cached. Entries expire after
+    ttl_seconds and the least recently used are evicted beyond max_size.
+    invalidate() drops a mode's entries and bumps a generation counter, so
+    answers computed from the old documents are not stored afterwards.
+
+    The cache and its invalidation are local to the process. Other workers
+    keep their RAG entries after an ingestion, but since a RAG key includes
+    the retrieved context, those entries only hit while retrieval still
+    returns the same chunks; entries from before the change otherwise age
+    out with ttl_seconds.
+    """
+
+    def __init__(
+        self,
+        modes: Optional[Iterable[str]] = None,
+        max_size: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        similarity_threshold: Optional[float] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        if modes is None:
+            modes = [mode.strip() for mode in settings.RESPONSE_CACHE_MODES.split(",") if mode.strip()]
+        self.modes = frozenset(modes)
+        self.max_size = max_size if max_size is not None else settings.RESPONSE_CACHE_SIZE
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.RESPONSE_CACHE_TTL
+        self.similarity_threshold = (
+            similarity_threshold if similarity_threshold is not None else settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD
+        )
+        self._clock = clock
+        self._entries: "OrderedDict[str, _CachedAnswer]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, str], Dict[str, np.ndarray]] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def enabled_for(self, mode: str) -> bool:
+        return mode in self.modes and self.max_size > 0
+
+    @property
+    def semantic(self) -> bool:
+        """Whether lookups also match similar messages (and so need an embedding)"""
+        return self.similarity_threshold is not None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Case- and whitespace-insensitive form of a message"""
+        return " ".join(text.split()).lower()
+
+    @staticmethod
+    def _bucket(mode: str, system_prompt: str) -> Tuple[str, str]:
+        return mode, hashlib.blake2b(system_prompt.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+    def cache_key(self, mode: str, system_prompt: str, message: str) -> str:
+        _, prompt_hash = self._bucket(mode, system_prompt)
+        raw = f"{mode}\x00{prompt_hash}\x00{self.normalize(message)}"
+        return hashlib.blake2b(raw.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+    def generation(self, mode: str) -> int:
+        """Counter bumped by invalidate(); read it before building the prompt and pass it to put()"""
+        return self._generations.get(mode, 0)
+
+    def get(
+        self,
+        mode: str,
+        system_prompt: str,
+        message: str,
+        embedding: Optional[List[float]] = None
+    ) -> Optional[str]:
+        """Cached answer for an identical (or, given an embedding, similar enough) message"""
+        if not self.enabled_for(mode):
+            return None
+        key = self.cache_key(mode, system_prompt, message)
+        with self._lock:
+            answer = self._lookup(key)
+            if answer is not None:
+                self.hits += 1
+                return answer
+
+            if self.semantic and embedding is not None:
+                key = self._most_similar(self._bucket(mode, system_prompt), self._unit(embedding))
+                answer = self._lookup(key) if key is not None else None
+                if answer is not None:
+                    self.semantic_hits += 1
+                    return answer
+
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        mode: str,
+        system_prompt: str,
+        message: str,
+        answer: str,
+        embedding: Optional[List[float]] = None,
+        generation: Optional[int] = None
+    ) -> None:
+        """Store an answer, unless the mode was invalidated since `generation` was read"""
+        if not self.enabled_for(mode):
+            return
+        key = self.cache_key(mode, system_prompt, message)
+        bucket = self._bucket(mode, system_prompt)
+        vector = self._unit(embedding) if self.semantic and embedding is not None else None
+        with self._lock:
+            if generation is not None and generation != self.generation(mode):
+                return
+            self._remove(key)
+            self._entries[key] = _CachedAnswer(answer=answer, created_at=self._clock(), bucket=bucket, embedding=vector)
+            if vector is not None:
+                self._buckets.setdefault(bucket, {})[key] = vector
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, mode: Optional[str] = None) -> None:
+        """Drop the cached answers of one mode, or of all modes"""
+        with self._lock:
+            modes = [mode] if mode is not None else list(self.modes | set(self._generations))
+            for name in modes:
+                self._generations[name] = self._generations.get(name, 0) + 1
+            for key in [key for key, entry in self._entries.items() if mode is None or entry.bucket[0] == mode]:
+                self._remove(key)
+
+    def _lookup(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl_seconds > 0 and self._clock() - entry.created_at > self.ttl_seconds:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry.answer
+
+    def _most_similar(self, bucket: Tuple[str, str], query: np.ndarray) -> Optional[str]:
+        vectors = self._buckets.get(bucket)
+        if not vectors:
+            return None
+        keys = list(vectors)
+        scores = np.stack([vectors[key] for key in keys]) @ query
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity_threshold else None
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry.embedding is not None:
+            vectors = self._buckets.get(entry.bucket)
+            vectors.pop(key, None)
+            if not vectors:
+                del self._buckets[entry.bucket]
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def cache_info(self) -> Dict:
+        """Get response cache statistics"""
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "modes": sorted(self.modes),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0
+        }
+
+
+# singleton instance
+response_cache = ResponseCache()
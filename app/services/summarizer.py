@@ -0,0 +1,130 @@
+from typing import Callable, List, Optional, Set
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import logging
+
+from app.core.config import settings
+from app.models.conversation import Message, MessageRole
+from app.repositories.conversation import ConversationRepository
+from app.services.context_manager import ContextManager
+from app.services.llm.base import BaseLLMProvider
+from app.services.prompt_manager import PromptManager, PromptType, prompt_manager
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationSummarizer:
+    """
+    Maintains rolling summaries for the SUMMARIZE context strategy.
+    
+    Messages that fall out of the context window are folded, together with the
+    previous summary, into a new summary message (is_summary=True). This runs
+    as a background task after the response has been produced, so context
+    assembly only ever reads one summary row plus the recent tail.
+    """
+    
+    def __init__(
+        self,
+        llm_provider_getter: Callable[[], BaseLLMProvider],
+        context_manager: ContextManager,
+        conversation_repo: Optional[ConversationRepository] = None,
+        prompt_mgr: Optional[PromptManager] = None,
+        session_factory: Optional[Callable[[], AsyncSession]] = None,
+        trigger_tokens: Optional[int] = None,
+        max_input_tokens: Optional[int] = None,
+    ):
+        self._llm_provider_getter = llm_provider_getter
+        self.context_manager = context_manager
+        self.conversation_repo = conversation_repo or ConversationRepository()
+        self.prompt_manager = prompt_mgr or prompt_manager
+        self._session_factory = session_factory
+        self.trigger_tokens = trigger_tokens if trigger_tokens is not None else settings.SUMMARY_TRIGGER_TOKENS
+        self.max_input_tokens = max_input_tokens or settings.SUMMARY_MAX_INPUT_TOKENS
+        self._in_progress: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+    
+    def _open_session(self) -> AsyncSession:
+        if self._session_factory is None:
+            # Deferred so importing services does not require a configured database
+            from app.core.database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+    
+    def schedule(self, conversation_id: str, before_sequence: int) -> None:
+        """
+        Summarize messages older than `before_sequence` off the request path.
+        
+        At most one summarization runs per conversation at a time.
+        """
+        if conversation_id in self._in_progress:
+            return
+        self._in_progress.add(conversation_id)
+        task = asyncio.create_task(self._run(conversation_id, before_sequence))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, conversation_id: str, before_sequence: int) -> None:
+        try:
+            async with self._open_session() as db:
+                await self.summarize(db, conversation_id, before_sequence)
+        except Exception as e:
+            logger.error(f"Rolling summary failed for conversation {conversation_id}: {e}")
+        finally:
+            self._in_progress.discard(conversation_id)
+    
+    async def summarize(self, db: AsyncSession, conversation_id: str, before_sequence: int) -> Optional[Message]:
+        """
+        Fold evicted messages into a new rolling summary.
+        
+        Returns the new summary message, or None if not enough tokens have
+        fallen out of the window since the last summary.
+        """
+        conversation = await self.conversation_repo.get(db, conversation_id)
+        if not conversation:
+            return None
+        
+        pending = await self.conversation_repo.get_unsummarized_messages(
+            db, conversation_id, after_sequence=conversation.summarized_until, before_sequence=before_sequence
+        )
+        if sum(m.token_count or 0 for m in pending) < self.trigger_tokens:
+            return None
+        
+        batch = self._take_batch(pending)
+        previous = await self.conversation_repo.get_latest_summary(db, conversation_id)
+        prompt = self.prompt_manager.get_system_prompt(
+            PromptType.SUMMARY,
+            previous_summary=previous.content if previous else ""
+        )
+        transcript = "\n".join(f"{self._role_label(m)}: {m.content}" for m in batch)
+        
+        content = await self._llm_provider_getter().generate([
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": transcript},
+        ])
+        
+        summary = await self.conversation_repo.add_summary(
+            db,
+            conversation_id,
+            content=content,
+            token_count=self.context_manager.count_tokens(content),
+            summarized_until=batch[-1].sequence_number
+        )
+        logger.info(f"Summarized {len(batch)} messages of conversation {conversation_id}")
+        return summary
+    
+    def _take_batch(self, pending: List[Message]) -> List[Message]:
+        """Oldest messages fitting the summary input budget (at least one)"""
+        batch, used = [], 0
+        for message in pending:
+            tokens = message.token_count or 0
+            if batch and used + tokens > self.max_input_tokens:
+                break
+            batch.append(message)
+            used += tokens
+        return batch
+    
+    @staticmethod
+    def _role_label(message: Message) -> str:
+        role = message.role.value if isinstance(message.role, MessageRole) else message.role
+        return role.capitalize()
@@ -1,9 +1,11 @@
 from app.services.vectorstore.base import BaseVectorStore
 from app.services.vectorstore.chroma import ChromaVectorStore
+from app.services.vectorstore.numpy_store import NumpyVectorStore
 from app.services.vectorstore.factory import VectorStoreFactory
 
 __all__ = [
     "BaseVectorStore",
     "ChromaVectorStore",
+    "NumpyVectorStore",
     "VectorStoreFactory",
 ]
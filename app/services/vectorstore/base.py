@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 from dataclasses import dataclass
 
 
@@ -12,6 +12,14 @@ class DocumentChunk:
     metadata: Optional[dict] = None
 
 
+@dataclass
+class SearchFilter:
+    """Metadata restrictions for a vector search; unset fields do not filter"""
+    document_ids: Optional[List[str]] = None
+    user_id: Optional[str] = None
+    file_type: Optional[str] = None
+
+
 @dataclass
 class SearchResult:
     """Search result from vector store"""
@@ -26,15 +34,71 @@ class BaseVectorStore(ABC):
     
     @abstractmethod
     async def add_documents(self, chunks: List[DocumentChunk]) -> List[str]:
-        """Add document chunks with embeddings to the store"""
+        """Add document chunks with embeddings to the store (existing ids are overwritten)"""
         pass
     
     @abstractmethod
-    async def search(self, query_embedding: List[float], top_k: int = 5) -> List[SearchResult]:
-        """Search for similar documents"""
+    async def search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        filters: Optional[SearchFilter] = None
+    ) -> List[SearchResult]:
+        """Search for similar documents among the chunks matching filters"""
         pass
     
+    async def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        filters: Optional[SearchFilter] = None
+    ) -> List[List[SearchResult]]:
+        """
+        Search for several queries at once; results are aligned with query_embeddings.
+        
+        Stores that can answer many queries in one call should override this
+        sequential fallback.
+        """
+        return [
+            await self.search(query_embedding, top_k=top_k, filters=filters)
+            for query_embedding in query_embeddings
+        ]
+    
     @abstractmethod
     async def delete_by_document_id(self, document_id: str) -> bool:
         """Delete all chunks for a document"""
         pass
+    
+    @abstractmethod
+    async def delete_chunks(self, chunk_ids: List[str]) -> None:
+        """Delete chunks by id"""
+        pass
+    
+    @abstractmethod
+    async def get_document_chunks(self, document_id: str) -> List[DocumentChunk]:
+        """Get the ids and metadata (no embeddings) of all chunks of a document"""
+        pass
+    
+    @abstractmethod
+    def iter_chunks(self, batch_size: int = 1000) -> AsyncIterator[List[DocumentChunk]]:
+        """Yield every stored chunk, with content and metadata (no embeddings), in batches"""
+        pass
+    
+    @abstractmethod
+    async def get_embeddings_by_hash(self, content_hashes: List[str]) -> Dict[str, List[float]]:
+        """Look up stored embeddings by the content_hash metadata of their chunks"""
+        pass
+    
+    @abstractmethod
+    async def find_document_by_hash(self, document_hash: str, user_id: Optional[str] = None) -> Optional[str]:
+        """Get the id of a stored document with the given document_hash (owned by user_id, if given)"""
+        pass
+    
+    @abstractmethod
+    async def update_metadata(self, chunks: List[DocumentChunk]) -> None:
+        """Replace the metadata of existing chunks without touching their embeddings"""
+        pass
+    
+    def close(self) -> None:
+        """Release resources such as worker threads; the default holds none"""
+        pass
@@ -1,56 +1,309 @@
-from typing import List
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, TypeVar
+import asyncio
+import functools
+import hashlib
+import threading
 import chromadb
+from chromadb.errors import NotFoundError
 
 from app.core.config import settings
-from app.services.vectorstore.base import BaseVectorStore, DocumentChunk, SearchResult
+from app.services.vectorstore.base import BaseVectorStore, DocumentChunk, SearchFilter, SearchResult
+
+T = TypeVar("T")
 
 
 class ChromaVectorStore(BaseVectorStore):
-    """Chroma vector store implementation"""
+    """
+    Chroma vector store implementation.
+    
+    With tenant_collections, chunks carrying a user_id are written to a
+    collection of their own, so a tenant's searches only walk that tenant's
+    HNSW index; chunks without one share the default collection.
+    
+    chromadb is synchronous, so every call runs on a dedicated, bounded
+    thread pool instead of the event loop. At most max_concurrent_writes
+    writes hold a worker at a time, leaving the remaining workers free for
+    searches, and bulk writes are split into batches no larger than the
+    client accepts.
+    """
     
     COLLECTION_NAME = "documents"
     
-    def __init__(self, persist_directory: str = None):
+    def __init__(
+        self,
+        persist_directory: str = None,
+        tenant_collections: Optional[bool] = None,
+        max_workers: Optional[int] = None,
+        max_concurrent_writes: Optional[int] = None,
+        max_batch_size: Optional[int] = None
+    ):
         persist_dir = persist_directory or settings.CHROMA_PERSIST_DIR
         self._client = chromadb.PersistentClient(path=persist_dir)
-        self._collection = self._client.get_or_create_collection(
-            name=self.COLLECTION_NAME,
-            metadata={"hnsw:space": "cosine"}
+        self._collection = self._get_or_create(self.COLLECTION_NAME)
+        self._tenant_collections = (
+            settings.CHROMA_TENANT_COLLECTIONS if tenant_collections is None else tenant_collections
+        )
+        self._tenants: Dict[str, Any] = {}
+        self._tenants_lock = threading.Lock()
+        
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.CHROMA_EXECUTOR_WORKERS,
+            thread_name_prefix="chroma"
         )
+        self._write_slots = asyncio.Semaphore(max_concurrent_writes or settings.CHROMA_MAX_CONCURRENT_WRITES)
+        self.max_batch_size = min(
+            max_batch_size or settings.CHROMA_MAX_BATCH_SIZE,
+            self._client.get_max_batch_size()
+        )
+    
+    async def _read(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run a blocking chromadb read on the store's executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+    
+    async def _write(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run a blocking chromadb write on the executor, within the write concurrency limit"""
+        async with self._write_slots:
+            return await self._read(fn, *args, **kwargs)
+    
+    def _batches(self, items: List[T]) -> List[List[T]]:
+        return [items[i:i + self.max_batch_size] for i in range(0, len(items), self.max_batch_size)]
+    
+    def _get_or_create(self, name: str):
+        return self._client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+    
+    def _collection_for(self, user_id: Optional[str], create: bool = True):
+        """
+        Collection holding a tenant's chunks.
+        
+        Read paths pass create=False and get None for a tenant that has
+        never written, instead of creating an empty collection per searcher.
+        """
+        if not self._tenant_collections or user_id is None:
+            return self._collection
+        with self._tenants_lock:
+            if user_id not in self._tenants:
+                # Collection names are restricted to [a-zA-Z0-9._-], so user ids are hashed
+                digest = hashlib.blake2b(user_id.encode("utf-8"), digest_size=8).hexdigest()
+                name = f"{self.COLLECTION_NAME}_{digest}"
+                if create:
+                    self._tenants[user_id] = self._get_or_create(name)
+                else:
+                    try:
+                        self._tenants[user_id] = self._client.get_collection(name=name)
+                    except NotFoundError:
+                        return None
+            return self._tenants[user_id]
+    
+    def _all_collections(self) -> List:
+        """Every collection, for lookups by chunk or document id that do not know the tenant"""
+        if not self._tenant_collections:
+            return [self._collection]
+        prefix = f"{self.COLLECTION_NAME}_"
+        return [self._collection] + [
+            collection for collection in self._client.list_collections() if collection.name.startswith(prefix)
+        ]
+    
+    @staticmethod
+    def _where(filters: Optional[SearchFilter], **equals) -> Optional[Dict]:
+        """Translate filters into a Chroma where clause"""
+        clauses = [{key: value} for key, value in equals.items() if value is not None]
+        if filters is not None:
+            if filters.document_ids is not None:
+                clauses.append({"document_id": {"$in": list(filters.document_ids)}})
+            if filters.user_id is not None:
+                clauses.append({"user_id": filters.user_id})
+            if filters.file_type is not None:
+                clauses.append({"file_type": filters.file_type})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
     
     async def add_documents(self, chunks: List[DocumentChunk]) -> List[str]:
         if not chunks:
             return []
         
-        self._collection.add(
-            ids=[chunk.id for chunk in chunks],
-            embeddings=[chunk.embedding for chunk in chunks],
-            documents=[chunk.content for chunk in chunks],
-            metadatas=[chunk.metadata or {} for chunk in chunks]
-        )
+        def upsert(user_id: Optional[str], batch: List[DocumentChunk]) -> None:
+            self._collection_for(user_id).upsert(
+                ids=[chunk.id for chunk in batch],
+                embeddings=[chunk.embedding for chunk in batch],
+                documents=[chunk.content for chunk in batch],
+                metadatas=[chunk.metadata or {} for chunk in batch]
+            )
+        
+        for user_id, tenant_chunks in self._by_tenant(chunks).items():
+            for batch in self._batches(tenant_chunks):
+                await self._write(upsert, user_id, batch)
         return [chunk.id for chunk in chunks]
     
-    async def search(self, query_embedding: List[float], top_k: int = 5) -> List[SearchResult]:
-        results = self._collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k,
-            include=["documents", "metadatas", "distances"]
-        )
+    @staticmethod
+    def _by_tenant(chunks: List[DocumentChunk]) -> Dict[Optional[str], List[DocumentChunk]]:
+        groups: Dict[Optional[str], List[DocumentChunk]] = defaultdict(list)
+        for chunk in chunks:
+            groups[(chunk.metadata or {}).get("user_id")].append(chunk)
+        return groups
+    
+    async def search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        filters: Optional[SearchFilter] = None
+    ) -> List[SearchResult]:
+        return (await self.search_many([query_embedding], top_k=top_k, filters=filters))[0]
+    
+    async def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        filters: Optional[SearchFilter] = None
+    ) -> List[List[SearchResult]]:
+        """
+        Answer all queries with one Chroma query call per collection, filtered inside Chroma.
         
-        search_results = []
-        if results["ids"] and results["ids"][0]:
-            for i, chunk_id in enumerate(results["ids"][0]):
-                search_results.append(SearchResult(
-                    chunk_id=chunk_id,
-                    content=results["documents"][0][i],
-                    score=1 - results["distances"][0][i],
-                    metadata=results["metadatas"][0][i] if results["metadatas"] else None
-                ))
-        return search_results
+        A user_id filter selects that tenant's collection; otherwise, with
+        tenant collections, every collection is searched and results merged.
+        """
+        if not query_embeddings:
+            return []
+        return await self._read(self._search_many, query_embeddings, top_k, filters)
+    
+    def _search_many(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        filters: Optional[SearchFilter]
+    ) -> List[List[SearchResult]]:
+        user_id = filters.user_id if filters else None
+        if user_id is None:
+            collections = self._all_collections()
+        else:
+            collection = self._collection_for(user_id, create=False)
+            collections = [collection] if collection is not None else []
+        
+        all_results: List[List[SearchResult]] = [[] for _ in query_embeddings]
+        for collection in collections:
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=top_k,
+                where=self._where(filters),
+                include=["documents", "metadatas", "distances"]
+            )
+            for q, ids in enumerate(results["ids"]):
+                all_results[q].extend(
+                    SearchResult(
+                        chunk_id=chunk_id,
+                        content=results["documents"][q][i],
+                        score=1 - results["distances"][q][i],
+                        metadata=results["metadatas"][q][i] if results["metadatas"] else None
+                    )
+                    for i, chunk_id in enumerate(ids)
+                )
+        if len(collections) > 1:
+            all_results = [sorted(r, key=lambda result: result.score, reverse=True)[:top_k] for r in all_results]
+        return all_results
     
     async def delete_by_document_id(self, document_id: str) -> bool:
+        def delete() -> None:
+            for collection in self._all_collections():
+                collection.delete(where={"document_id": document_id})
+        
         try:
-            self._collection.delete(where={"document_id": document_id})
+            await self._write(delete)
             return True
         except Exception:
             return False
+    
+    async def delete_chunks(self, chunk_ids: List[str]) -> None:
+        def delete(batch: List[str]) -> None:
+            for collection in self._all_collections():
+                collection.delete(ids=batch)
+        
+        for batch in self._batches(chunk_ids):
+            await self._write(delete, batch)
+    
+    async def get_document_chunks(self, document_id: str) -> List[DocumentChunk]:
+        def get() -> List[DocumentChunk]:
+            chunks = []
+            for collection in self._all_collections():
+                results = collection.get(where={"document_id": document_id}, include=["metadatas"])
+                chunks.extend(
+                    DocumentChunk(id=chunk_id, content="", metadata=results["metadatas"][i])
+                    for i, chunk_id in enumerate(results["ids"])
+                )
+            return chunks
+        
+        return await self._read(get)
+    
+    async def iter_chunks(self, batch_size: int = 1000) -> AsyncIterator[List[DocumentChunk]]:
+        batch_size = min(batch_size, self.max_batch_size)
+        for collection in await self._read(self._all_collections):
+            offset = 0
+            while True:
+                results = await self._read(
+                    collection.get, offset=offset, limit=batch_size, include=["documents", "metadatas"]
+                )
+                if not results["ids"]:
+                    break
+                yield [
+                    DocumentChunk(id=chunk_id, content=results["documents"][i], metadata=results["metadatas"][i])
+                    for i, chunk_id in enumerate(results["ids"])
+                ]
+                offset += len(results["ids"])
+    
+    async def get_embeddings_by_hash(self, content_hashes: List[str]) -> Dict[str, List[float]]:
+        def get(batch: List[str]) -> Dict[str, List[float]]:
+            embeddings = {}
+            for collection in self._all_collections():
+                results = collection.get(
+                    where={"content_hash": {"$in": batch}},
+                    include=["embeddings", "metadatas"]
+                )
+                embeddings.update(
+                    (metadata["content_hash"], list(map(float, results["embeddings"][i])))
+                    for i, metadata in enumerate(results["metadatas"])
+                )
+            return embeddings
+        
+        embeddings = {}
+        for batch in self._batches(list(content_hashes)):
+            embeddings.update(await self._read(get, batch))
+        return embeddings
+    
+    async def find_document_by_hash(self, document_hash: str, user_id: Optional[str] = None) -> Optional[str]:
+        def find() -> Optional[str]:
+            if user_id is not None:
+                collection = self._collection_for(user_id, create=False)
+                if collection is None:
+                    return None
+                results = collection.get(
+                    where=self._where(None, document_hash=document_hash, user_id=user_id),
+                    limit=1,
+                    include=["metadatas"]
+                )
+                return results["metadatas"][0]["document_id"] if results["ids"] else None
+            
+            # Unowned documents only; Chroma cannot filter on a missing key
+            results = self._collection.get(where={"document_hash": document_hash}, include=["metadatas"])
+            return next(
+                (metadata["document_id"] for metadata in results["metadatas"] if metadata.get("user_id") is None),
+                None
+            )
+        
+        return await self._read(find)
+    
+    async def update_metadata(self, chunks: List[DocumentChunk]) -> None:
+        def update(user_id: Optional[str], batch: List[DocumentChunk]) -> None:
+            self._collection_for(user_id).update(
+                ids=[chunk.id for chunk in batch],
+                metadatas=[chunk.metadata or {} for chunk in batch]
+            )
+        
+        for user_id, tenant_chunks in self._by_tenant(chunks).items():
+            for batch in self._batches(tenant_chunks):
+                await self._write(update, user_id, batch)
+    
+    def close(self) -> None:
+        """Wait for in-flight calls and stop the executor's threads"""
+        self._executor.shutdown(wait=True)
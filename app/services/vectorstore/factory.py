@@ -1,12 +1,15 @@
 from enum import Enum
-from typing import Dict, Type
+from typing import Dict, Optional, Type
 
+from app.core.config import settings
 from app.services.vectorstore.base import BaseVectorStore
 from app.services.vectorstore.chroma import ChromaVectorStore
+from app.services.vectorstore.numpy_store import NumpyVectorStore
 
 
 class VectorStoreType(str, Enum):
     CHROMA = "chroma"
+    NUMPY = "numpy"
 
 
 class VectorStoreFactory:
@@ -14,15 +17,23 @@ class VectorStoreFactory:
     
     _stores: Dict[VectorStoreType, Type[BaseVectorStore]] = {
         VectorStoreType.CHROMA: ChromaVectorStore,
+        VectorStoreType.NUMPY: NumpyVectorStore,
     }
     
     _instance: BaseVectorStore = None
     
     @classmethod
-    def create(cls, store_type: VectorStoreType = VectorStoreType.CHROMA) -> BaseVectorStore:
+    def create(cls, store_type: Optional[VectorStoreType] = None) -> BaseVectorStore:
         if cls._instance is None:
-            store_class = cls._stores.get(store_type)
+            store_class = cls._stores.get(store_type or settings.VECTOR_STORE_TYPE)
             if not store_class:
                 raise ValueError(f"Unknown vector store type: {store_type}")
             cls._instance = store_class()
         return cls._instance
+    
+    @classmethod
+    def close(cls) -> None:
+        """Close the shared store, if one was created"""
+        if cls._instance is not None:
+            cls._instance.close()
+            cls._instance = None
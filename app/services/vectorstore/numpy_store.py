@@ -0,0 +1,322 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import os
+import threading
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.vectorstore.base import BaseVectorStore, DocumentChunk, SearchFilter, SearchResult
+
+
+class NumpyVectorStore(BaseVectorStore):
+    """
+    In-process vector store backed by a float32 NumPy matrix.
+
+    Vectors are L2-normalized at insert time and appended to a raw float32
+    file that is memory-mapped for queries, so cosine top-k is one
+    matrix-vector product plus argpartition. Chunk ids, contents and
+    metadata go to an append-only JSON-lines log that is replayed on start;
+    overwritten and deleted rows are only masked out. Metadata fields in
+    INDEXED_FIELDS are indexed by value, so document lookups and filtered
+    searches (e.g. one tenant's user_id) only touch matching rows; each
+    value's rows are also kept as a sorted index array, rebuilt only after
+    that value's rows change. Scoring runs in a worker thread.
+
+    Stored embeddings are the normalized vectors, which is equivalent for
+    cosine search.
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    RECORDS_FILE = "records.jsonl"
+    INDEXED_FIELDS = ("document_id", "content_hash", "document_hash", "file_type", "user_id")
+
+    def __init__(self, persist_directory: str = None):
+        self._dir = persist_directory or settings.NUMPY_STORE_DIR
+        os.makedirs(self._dir, exist_ok=True)
+        self._vectors_path = os.path.join(self._dir, self.VECTORS_FILE)
+        self._records_path = os.path.join(self._dir, self.RECORDS_FILE)
+        self._lock = threading.RLock()
+
+        self._dimension: Optional[int] = None
+        self._ids: List[str] = []
+        self._contents: List[str] = []
+        self._metadatas: List[dict] = []
+        self._live_buffer = np.zeros(1024, dtype=bool)  # Grown by doubling; see _live
+        self._row_by_id: Dict[str, int] = {}
+        self._index: Dict[str, Dict[Any, Set[int]]] = {field: {} for field in self.INDEXED_FIELDS}
+        self._index_arrays: Dict[Tuple[str, Any], np.ndarray] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._load()
+
+    def _load(self) -> None:
+        """Replay the record log; a torn last line from a crash is ignored"""
+        if not os.path.exists(self._records_path):
+            return
+        with open(self._records_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                self._apply(record)
+
+    def _apply(self, record: dict) -> None:
+        op = record["op"]
+        if op == "add":
+            self._dimension = record["dimension"]
+            row = len(self._ids)
+            previous = self._row_by_id.get(record["id"])
+            if previous is not None:
+                self._kill(previous)
+            self._ids.append(record["id"])
+            self._contents.append(record["content"])
+            self._metadatas.append(record["metadata"])
+            if row == len(self._live_buffer):
+                self._live_buffer = np.concatenate([self._live_buffer, np.zeros_like(self._live_buffer)])
+            self._live_buffer[row] = True
+            self._row_by_id[record["id"]] = row
+            self._index_row(row)
+        elif op == "delete":
+            for chunk_id in record["ids"]:
+                row = self._row_by_id.pop(chunk_id, None)
+                if row is not None:
+                    self._kill(row)
+        elif op == "metadata":
+            row = self._row_by_id.get(record["id"])
+            if row is not None:
+                self._unindex_row(row)
+                self._metadatas[row] = record["metadata"]
+                self._index_row(row)
+
+    @property
+    def _live(self) -> np.ndarray:
+        """Mask of rows that are neither overwritten nor deleted"""
+        return self._live_buffer[:len(self._ids)]
+
+    def _kill(self, row: int) -> None:
+        self._live[row] = False
+        self._unindex_row(row)
+
+    def _index_row(self, row: int) -> None:
+        metadata = self._metadatas[row]
+        for field in self.INDEXED_FIELDS:
+            if field in metadata:
+                self._index[field].setdefault(metadata[field], set()).add(row)
+                self._index_arrays.pop((field, metadata[field]), None)
+
+    def _unindex_row(self, row: int) -> None:
+        metadata = self._metadatas[row]
+        for field in self.INDEXED_FIELDS:
+            rows = self._index[field].get(metadata.get(field))
+            if rows is not None:
+                rows.discard(row)
+                self._index_arrays.pop((field, metadata.get(field)), None)
+
+    def _indexed_rows(self, field: str, value: Any) -> np.ndarray:
+        """Sorted live rows whose indexed field equals value, cached until those rows change"""
+        rows = self._index_arrays.get((field, value))
+        if rows is None:
+            members = self._index[field].get(value, ())
+            rows = np.fromiter(sorted(members), dtype=np.int64, count=len(members))
+            self._index_arrays[(field, value)] = rows
+        return rows
+
+    def _append_records(self, records: List[dict]) -> None:
+        with open(self._records_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        for record in records:
+            self._apply(record)
+
+    @property
+    def _vectors(self) -> np.ndarray:
+        """Memory-mapped (rows, dimension) matrix, re-mapped after appends"""
+        rows = len(self._ids)
+        if self._matrix is None or self._matrix.shape[0] != rows:
+            if rows == 0:
+                self._matrix = np.zeros((0, self._dimension or 0), dtype=np.float32)
+            else:
+                self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dimension))
+        return self._matrix
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+    def _filter_rows(self, filters: SearchFilter) -> np.ndarray:
+        """Live rows matching a SearchFilter"""
+        candidates = None
+        if filters.document_ids is not None:
+            candidates = np.unique(np.concatenate(
+                [self._indexed_rows("document_id", d) for d in filters.document_ids] or [np.zeros(0, dtype=np.int64)]
+            ))
+        equals = {"user_id": filters.user_id, "file_type": filters.file_type}
+        return self._rows_matching({k: v for k, v in equals.items() if v is not None}, candidates)
+
+    def _rows_matching(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        candidates: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Live rows (among sorted candidates) whose metadata equals every filter value; indexed fields use the index"""
+        unindexed = {}
+        for field, value in (filters or {}).items():
+            if field in self._index:
+                rows = self._indexed_rows(field, value)
+                candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+            else:
+                unindexed[field] = value
+
+        rows = np.flatnonzero(self._live) if candidates is None else candidates
+        if unindexed:
+            rows = rows[[all(self._metadatas[row].get(k) == v for k, v in unindexed.items()) for row in rows]]
+        return rows
+
+    async def add_documents(self, chunks: List[DocumentChunk]) -> List[str]:
+        if not chunks:
+            return []
+
+        vectors = self._normalize(np.asarray([chunk.embedding for chunk in chunks], dtype=np.float32))
+        with self._lock:
+            if self._dimension is not None and vectors.shape[1] != self._dimension:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store ({self._dimension})")
+            # Vectors first: a logged row always has its vector on disk
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(len(self._ids) * vectors.shape[1] * 4)
+                f.write(np.ascontiguousarray(vectors).tobytes())
+            self._append_records([
+                {
+                    "op": "add",
+                    "id": chunk.id,
+                    "dimension": vectors.shape[1],
+                    "content": chunk.content,
+                    "metadata": chunk.metadata or {}
+                }
+                for chunk in chunks
+            ])
+        return [chunk.id for chunk in chunks]
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        filters: Optional[SearchFilter] = None
+    ) -> List[SearchResult]:
+        return (await self.search_many([query_embedding], top_k=top_k, filters=filters))[0]
+
+    async def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 5,
+        filters: Optional[SearchFilter] = None
+    ) -> List[List[SearchResult]]:
+        """Score all queries against the candidate rows with one matrix product, off the event loop"""
+        if not query_embeddings:
+            return []
+        return await asyncio.to_thread(self._search_many, query_embeddings, top_k, filters)
+
+    def _search_many(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        filters: Optional[SearchFilter]
+    ) -> List[List[SearchResult]]:
+        # Only the candidate rows are resolved under the lock; rows are append-only, so scoring can run without it
+        with self._lock:
+            if self._dimension is None or not self._row_by_id:
+                return [[] for _ in query_embeddings]
+            vectors = self._vectors
+            rows = self._filter_rows(filters) if filters is not None else None
+            dead = ~self._live if filters is None else None
+
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+        if rows is not None:
+            scores = queries @ vectors[rows].T  # (queries, candidates)
+        else:
+            # Score the whole mapped matrix and mask dead rows, avoiding a copy
+            rows = np.arange(len(vectors))
+            scores = queries @ vectors.T
+            scores[:, dead] = -np.inf
+
+        k = min(top_k, int(np.count_nonzero(np.isfinite(scores[0]))) if len(rows) else 0)
+        if k <= 0:
+            return [[] for _ in query_embeddings]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        all_results = []
+        for q in range(len(queries)):
+            order = top[q][np.argsort(-scores[q, top[q]])]
+            all_results.append([
+                SearchResult(
+                    chunk_id=self._ids[rows[i]],
+                    content=self._contents[rows[i]],
+                    score=float(scores[q, i]),
+                    metadata=self._metadatas[rows[i]]
+                )
+                for i in order
+            ])
+        return all_results
+
+    async def delete_by_document_id(self, document_id: str) -> bool:
+        with self._lock:
+            chunk_ids = [self._ids[row] for row in self._rows_matching({"document_id": document_id})]
+        await self.delete_chunks(chunk_ids)
+        return True
+
+    async def delete_chunks(self, chunk_ids: List[str]) -> None:
+        with self._lock:
+            chunk_ids = [chunk_id for chunk_id in chunk_ids if chunk_id in self._row_by_id]
+            if chunk_ids:
+                self._append_records([{"op": "delete", "ids": chunk_ids}])
+
+    async def get_document_chunks(self, document_id: str) -> List[DocumentChunk]:
+        with self._lock:
+            return [
+                DocumentChunk(id=self._ids[row], content="", metadata=self._metadatas[row])
+                for row in self._rows_matching({"document_id": document_id})
+            ]
+
+    async def iter_chunks(self, batch_size: int = 1000) -> AsyncIterator[List[DocumentChunk]]:
+        with self._lock:
+            rows = sorted(self._row_by_id.values())
+        for start in range(0, len(rows), batch_size):
+            with self._lock:
+                batch = [
+                    DocumentChunk(id=self._ids[row], content=self._contents[row], metadata=self._metadatas[row])
+                    for row in rows[start:start + batch_size]
+                ]
+            yield batch
+
+    async def get_embeddings_by_hash(self, content_hashes: List[str]) -> Dict[str, List[float]]:
+        embeddings = {}
+        with self._lock:
+            for content_hash in content_hashes:
+                rows = self._index["content_hash"].get(content_hash)
+                if rows:
+                    embeddings[content_hash] = self._vectors[next(iter(rows))].tolist()
+        return embeddings
+
+    async def find_document_by_hash(self, document_hash: str, user_id: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            equals = {"document_hash": document_hash}
+            if user_id is not None:
+                equals["user_id"] = user_id
+            for row in self._rows_matching(equals):
+                metadata = self._metadatas[row]
+                if metadata.get("user_id") == user_id:
+                    return metadata["document_id"]
+        return None
+
+    async def update_metadata(self, chunks: List[DocumentChunk]) -> None:
+        with self._lock:
+            records = [
+                {"op": "metadata", "id": chunk.id, "metadata": chunk.metadata or {}}
+                for chunk in chunks
+                if chunk.id in self._row_by_id
+            ]
+            if records:
+                self._append_records(records)
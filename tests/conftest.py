@@ -1,10 +1,11 @@
 """
 Pytest Configuration and Fixtures
 """
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
 import pytest
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 
@@ -24,6 +25,12 @@ engine = create_engine(
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+@pytest.fixture
+def anyio_backend() -> str:
+    """Run async tests on asyncio only"""
+    return "asyncio"
+
+
 @pytest.fixture(scope="function")
 def db_session() -> Generator[Session, None, None]:
     """
@@ -42,6 +49,34 @@ def db_session() -> Generator[Session, None, None]:
         Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture
+async def async_db_session() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Create a fresh async database session (aiosqlite, in-memory) for each test.
+    Used by repository and service tests, which run against AsyncSession.
+    """
+    async_engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    
+    session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    try:
+        async with session_factory() as session:
+            yield session
+    finally:
+        await async_engine.dispose()
+
+
+@pytest.fixture
+async def async_sample_conversation(async_db_session: AsyncSession) -> Conversation:
+    """Create a sample conversation in the async database"""
+    conversation = Conversation(user_id="test-user-123", title="Test Conversation")
+    async_db_session.add(conversation)
+    await async_db_session.commit()
+    await async_db_session.refresh(conversation)
+    return conversation
+
+
 @pytest.fixture
 def sample_conversation(db_session: Session) -> Conversation:
     """Create a sample conversation for testing"""
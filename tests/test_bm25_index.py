@@ -0,0 +1,226 @@
+"""
+Unit Tests for the BM25 Index and Hybrid Retrieval
+"""
+from typing import List
+import sqlite3
+
+import pytest
+
+from app.core.config import settings
+from app.services.bm25_index import BM25Index, tokenize
+from app.services.embeddings.base import BaseEmbeddingProvider
+from app.services.ingestion_service import IngestionService
+from app.services.rag_service import RAGService
+from app.services.vectorstore.base import DocumentChunk, SearchFilter, SearchResult
+from app.services.vectorstore.chroma import ChromaVectorStore
+from app.services.vectorstore.factory import VectorStoreFactory
+from app.services.vectorstore.numpy_store import NumpyVectorStore
+from tests.test_ingestion_service import PARAGRAPHS, CountingEmbeddingProvider, document
+
+pytestmark = pytest.mark.anyio
+
+
+def chunk(chunk_id: str, content: str, document_id: str = "doc", **metadata) -> DocumentChunk:
+    return DocumentChunk(id=chunk_id, content=content, metadata={"document_id": document_id, **metadata})
+
+
+CHUNKS = [
+    chunk("c1", "Error ERR-1042 means the payment gateway timed out.", user_id="alice"),
+    chunk("c2", "Payments are retried three times before failing.", user_id="alice"),
+    chunk("c3", "The SKU AB-7731 ships in two business days.", document_id="other", user_id="bob"),
+]
+
+
+@pytest.fixture
+async def index(tmp_path) -> BM25Index:
+    index = BM25Index(str(tmp_path / "bm25.db"))
+    await index.add(CHUNKS)
+    yield index
+    index.close()
+
+
+class TestBM25Index:
+    """Test cases for the lexical index"""
+
+    def test_codes_are_tokenized_whole_and_by_parts(self):
+        """Test that compound codes match both exactly and by their parts"""
+        assert tokenize("See ERR-1042.") == ["see", "err-1042", "err", "1042"]
+
+    def test_stopwords_are_not_terms(self):
+        """Test that function words are dropped from text and from compound codes"""
+        assert tokenize("What is the status of the-end?") == ["status", "the-end", "end"]
+
+    async def test_exact_term_ranks_first(self, index: BM25Index):
+        """Test that a chunk containing a rare query term ranks first"""
+        results = await index.search("what does err-1042 mean", top_k=3)
+
+        assert results[0].chunk_id == "c1"
+        assert results[0].metadata["user_id"] == "alice"
+
+    async def test_filters_and_deletes(self, index: BM25Index):
+        """Test that filters restrict hits and deleted chunks are no longer found"""
+        assert await index.search("ab-7731", filters=SearchFilter(user_id="alice")) == []
+
+        await index.delete_document("doc")
+
+        assert [r.chunk_id for r in await index.search("payment ab-7731")] == ["c3"]
+
+    async def test_min_score_drops_weak_matches(self, index: BM25Index):
+        """Test that chunks matching only a small part of the query are cut off"""
+        assert [r.chunk_id for r in await index.search("err-1042 payments")] == ["c1", "c2"]
+        assert [r.chunk_id for r in await index.search("err-1042 payments", min_score=0.2)] == ["c1"]
+
+    async def test_index_survives_reopen(self, index: BM25Index, tmp_path):
+        """Test that postings and corpus statistics are persisted"""
+        reopened = BM25Index(str(tmp_path / "bm25.db"))
+
+        assert [r.chunk_id for r in await reopened.search("sku ab-7731")] == ["c3"]
+        reopened.close()
+
+
+class UnavailableEmbeddingProvider(BaseEmbeddingProvider):
+    """Fails every request, like an embedding API outage"""
+
+    async def embed_text(self, text: str) -> List[float]:
+        raise RuntimeError("embedding service unavailable")
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        raise RuntimeError("embedding service unavailable")
+
+    @property
+    def dimension(self) -> int:
+        return 2
+
+
+class TestHybridRetrieval:
+    """Test cases for fused lexical and vector retrieval"""
+
+    def test_reciprocal_rank_fusion(self):
+        """Test that chunks ranked well by both retrievers come first"""
+        def ranking(*ids: str) -> List[SearchResult]:
+            return [SearchResult(chunk_id=i, content=i, score=1.0) for i in ids]
+
+        fused = RAGService.fuse([ranking("a", "b", "c"), ranking("b", "d", "a")], top_k=3, k=60)
+
+        assert [r.chunk_id for r in fused] == ["b", "a", "d"]
+        assert fused[0].score == pytest.approx(1 / 62 + 1 / 61)
+
+    async def test_lexical_only_when_embeddings_fail(self, index: BM25Index, tmp_path):
+        """Test that retrieval falls back to BM25 when the vector path is down"""
+        service = RAGService(
+            embedding_provider=UnavailableEmbeddingProvider(),
+            vector_store=ChromaVectorStore(persist_directory=str(tmp_path / "chroma")),
+            lexical_index=index
+        )
+
+        context = await service.retrieve_context("ERR-1042")
+
+        assert context.chunks[0]["metadata"]["document_id"] == "doc"
+        assert "ERR-1042" in context.text
+
+    async def test_ingestion_keeps_index_in_sync(self, tmp_path):
+        """Test that ingested chunks are searchable lexically and removed on update"""
+        index = BM25Index(str(tmp_path / "bm25.db"))
+        service = IngestionService(
+            embedding_provider=CountingEmbeddingProvider(),
+            vector_store=ChromaVectorStore(persist_directory=str(tmp_path / "chroma")),
+            chunk_size=50,
+            chunk_overlap=1,
+            lexical_index=index
+        )
+        first = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain")
+        assert [r.content for r in await index.search("topic number 3", top_k=1)] == [PARAGRAPHS[3]]
+
+        edited = PARAGRAPHS[:3] + ["Replacement paragraph about quasars."] + PARAGRAPHS[4:]
+        await service.update_document(first.document_id, document(edited), "doc.txt", "text/plain")
+
+        assert [r.content for r in await index.search("quasars")] == ["Replacement paragraph about quasars."]
+        assert PARAGRAPHS[3] not in [r.content for r in await index.search("paragraph 3", top_k=10)]
+        index.close()
+
+    async def test_lexical_min_score_applies_without_vectors(self, index: BM25Index, tmp_path):
+        """Test that weak lexical hits are dropped even when they are the only results"""
+        service = RAGService(
+            embedding_provider=UnavailableEmbeddingProvider(),
+            vector_store=ChromaVectorStore(persist_directory=str(tmp_path / "chroma")),
+            lexical_index=index
+        )
+
+        results = await service.search("err-1042 payments", top_k=5, lexical_min_score=0.2)
+
+        assert [r.chunk_id for r in results] == ["c1"]
+
+    async def test_stopword_overlap_is_not_retrieved(self, index: BM25Index, tmp_path):
+        """Test that chunks sharing only stopwords with the query are neither returned nor packed"""
+        service = RAGService(
+            embedding_provider=UnavailableEmbeddingProvider(),
+            vector_store=ChromaVectorStore(persist_directory=str(tmp_path / "chroma")),
+            lexical_index=index
+        )
+        query = "What is the refund policy in these cases?"
+
+        assert await service.search(query) == []
+        context = await service.retrieve_context(query)
+        assert context.chunks == [] and context.text == ""
+
+    async def test_rebuild_indexes_existing_documents(self, tmp_path):
+        """Test that documents ingested before the lexical index existed are backfilled"""
+        store = ChromaVectorStore(persist_directory=str(tmp_path / "chroma"))
+        earlier = BM25Index(str(tmp_path / "earlier.db"))
+        await IngestionService(
+            embedding_provider=CountingEmbeddingProvider(),
+            vector_store=store,
+            chunk_size=50,
+            chunk_overlap=1,
+            lexical_index=earlier
+        ).ingest(document(PARAGRAPHS), "doc.txt", "text/plain")
+        earlier.close()
+
+        index = BM25Index(str(tmp_path / "bm25.db"))
+        service = IngestionService(
+            embedding_provider=CountingEmbeddingProvider(),
+            vector_store=store,
+            lexical_index=index
+        )
+
+        assert await service.rebuild_lexical_index(only_if_empty=True) == len(PARAGRAPHS)
+        assert [r.content for r in await index.search("topic number 3", top_k=1)] == [PARAGRAPHS[3]]
+        assert await service.rebuild_lexical_index(only_if_empty=True) == 0
+        index.close()
+
+
+class TestLifecycle:
+    """Test cases for closing the lexical indexes opened by the services"""
+
+    @staticmethod
+    def assert_closed(index: BM25Index):
+        with pytest.raises(sqlite3.ProgrammingError):
+            index._db.execute("SELECT 1")
+
+    async def test_services_close_the_indexes_they_opened(self, tmp_path, monkeypatch):
+        """Test that IngestionService and RAGService close their own SQLite connections"""
+        monkeypatch.setattr(settings, "LEXICAL_INDEX_PATH", str(tmp_path / "bm25.db"))
+        monkeypatch.setattr(VectorStoreFactory, "_instance", NumpyVectorStore(persist_directory=str(tmp_path / "vectors")))
+        ingestion = IngestionService(embedding_provider=CountingEmbeddingProvider())
+        ingestion._ensure_initialized()
+        ingestion_index = ingestion._lexical_index
+        rag = RAGService()
+        rag_index = rag.lexical_index
+
+        ingestion.close()
+        rag.close()
+
+        self.assert_closed(ingestion_index)
+        self.assert_closed(rag_index)
+
+    async def test_injected_index_is_left_open(self, index: BM25Index, tmp_path):
+        """Test that an index passed in by the caller stays usable after the service closes"""
+        service = IngestionService(
+            embedding_provider=CountingEmbeddingProvider(),
+            vector_store=ChromaVectorStore(persist_directory=str(tmp_path / "chroma")),
+            lexical_index=index
+        )
+
+        service.close()
+
+        assert [r.chunk_id for r in await index.search("ab-7731")] == ["c3"]
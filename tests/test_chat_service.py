@@ -0,0 +1,326 @@
+"""
+Unit Tests for Chat Service
+"""
+from typing import Dict, List, Optional
+import asyncio
+import json
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.exceptions import ChatException, LLMException
+from app.models.conversation import Conversation, MessageRole
+from app.repositories.conversation import ConversationRepository
+from app.api.v1.endpoints.conversations import get_chat_service
+from app.core.database import get_db
+from app.main import app
+from app.schemas.chat import AddMessageRequest, CreateConversationRequest
+from app.services.chat_service import ChatService
+from app.services.context_manager import ContextManager, ContextWindowStrategy, SimpleTokenCounter
+from app.services.llm.base import BaseLLMProvider
+
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeStreamingProvider(BaseLLMProvider):
+    """LLM provider returning a fixed list of tokens"""
+    
+    def __init__(self, tokens: List[str], fail_after: int = None):
+        self.tokens = tokens
+        self.fail_after = fail_after
+    
+    async def generate(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        return "".join(self.tokens)
+    
+    async def generate_stream(self, messages: List[Dict[str, str]], **kwargs):
+        for i, token in enumerate(self.tokens):
+            if self.fail_after is not None and i == self.fail_after:
+                raise RuntimeError("provider went away")
+            yield token
+
+
+class HangingProvider(FakeStreamingProvider):
+    """Streams its tokens, then waits forever, like a slow LLM"""
+    
+    async def generate_stream(self, messages: List[Dict[str, str]], **kwargs):
+        for token in self.tokens:
+            yield token
+        await asyncio.Event().wait()
+
+
+def make_service(provider: BaseLLMProvider, db: Optional[AsyncSession] = None) -> ChatService:
+    return ChatService(
+        conversation_repo=ConversationRepository(),
+        llm_provider=provider,
+        context_manager=ContextManager(token_counter=SimpleTokenCounter()),
+        session_factory=async_sessionmaker(db.bind, expire_on_commit=False) if db is not None else None,
+    )
+
+
+async def post_and_disconnect(path: str, payload: dict, spec_version: str) -> List[bytes]:
+    """
+    Drive the ASGI app like a server whose client goes away after the first body chunk.
+    
+    Below ASGI 2.4 the disconnect arrives through receive(); from 2.4 on,
+    send() raises OSError instead.
+    """
+    body = json.dumps(payload).encode("utf-8")
+    received_chunk = asyncio.Event()
+    chunks: List[bytes] = []
+    request_sent = False
+    
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await received_chunk.wait()
+        return {"type": "http.disconnect"}
+    
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            if spec_version >= "2.4":
+                raise OSError("client went away")
+            chunks.append(message["body"])
+            received_chunk.set()
+    
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": spec_version},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        pass  # ClientDisconnect propagates on the 2.4 path
+    return chunks
+
+
+class TestAddMessageStream:
+    """Test cases for the streaming variant of add_message"""
+    
+    async def test_streams_tokens_then_done(self, async_db_session: AsyncSession, async_sample_conversation: Conversation):
+        """Test that tokens are relayed in order and the reply is persisted"""
+        service = make_service(FakeStreamingProvider(["Hel", "lo", "!"]), async_db_session)
+        
+        events = await service.add_message_stream(async_db_session, async_sample_conversation.id, AddMessageRequest(message="Hi"))
+        received = [event async for event in events]
+        
+        assert [e["data"]["content"] for e in received if e["event"] == "token"] == ["Hel", "lo", "!"]
+        assert received[-1]["event"] == "done"
+        assert received[-1]["data"]["assistant_message"]["content"] == "Hello!"
+        
+        messages = await service.conversation_repo.get_messages(async_db_session, async_sample_conversation.id)
+        assert [m.role for m in messages] == [MessageRole.USER, MessageRole.ASSISTANT]
+        assert messages[1].content == "Hello!"
+        await async_db_session.refresh(async_sample_conversation)
+        assert async_sample_conversation.total_tokens == messages[0].token_count + messages[1].token_count
+    
+    @pytest.mark.parametrize("spec_version", ["2.3", "2.4"])
+    async def test_partial_reply_persisted_on_disconnect(
+        self, async_db_session: AsyncSession, async_sample_conversation: Conversation, spec_version: str
+    ):
+        """Test that a client disconnecting from the SSE endpoint mid-stream still stores the partial reply"""
+        service = make_service(HangingProvider(["one "]), async_db_session)
+        
+        async def override_db():
+            yield async_db_session
+        
+        app.dependency_overrides[get_db] = override_db
+        app.dependency_overrides[get_chat_service] = lambda: service
+        try:
+            await post_and_disconnect(
+                f"/api/v1/conversations/{async_sample_conversation.id}/messages/stream", {"message": "Count"}, spec_version
+            )
+            # From ASGI 2.4 on, the abandoned stream is finalized by the event loop
+            for _ in range(100):
+                if len(await service.conversation_repo.get_messages(async_db_session, async_sample_conversation.id)) == 2:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            app.dependency_overrides.clear()
+        
+        messages = await service.conversation_repo.get_messages(async_db_session, async_sample_conversation.id)
+        assert [m.role for m in messages] == [MessageRole.USER, MessageRole.ASSISTANT]
+        assert messages[-1].content == "one "
+    
+    async def test_error_event_on_provider_failure(self, async_db_session: AsyncSession, async_sample_conversation: Conversation):
+        """Test that a mid-stream failure yields an error event after persisting tokens"""
+        service = make_service(FakeStreamingProvider(["partial", "never"], fail_after=1), async_db_session)
+        
+        events = await service.add_message_stream(async_db_session, async_sample_conversation.id, AddMessageRequest(message="Hi"))
+        received = [event async for event in events]
+        
+        assert received[-1]["event"] == "error"
+        messages = await service.conversation_repo.get_messages(async_db_session, async_sample_conversation.id)
+        assert messages[-1].content == "partial"
+    
+    async def test_user_message_saved_before_first_token(
+        self, async_db_session: AsyncSession, async_sample_conversation: Conversation
+    ):
+        """Test that the user's message is kept when the provider fails before producing output"""
+        service = make_service(FakeStreamingProvider(["never"], fail_after=0), async_db_session)
+        
+        events = await service.add_message_stream(async_db_session, async_sample_conversation.id, AddMessageRequest(message="Hi"))
+        received = [event async for event in events]
+        
+        assert [e["event"] for e in received] == ["error"]
+        messages = await service.conversation_repo.get_messages(async_db_session, async_sample_conversation.id)
+        assert [(m.role, m.content) for m in messages] == [(MessageRole.USER, "Hi")]
+    
+    async def test_unknown_conversation_raises_before_streaming(self, async_db_session: AsyncSession):
+        """Test that a missing conversation is reported eagerly"""
+        service = make_service(FakeStreamingProvider(["x"]))
+        
+        with pytest.raises(ChatException):
+            await service.add_message_stream(async_db_session, "nonexistent-id", AddMessageRequest(message="Hi"))
+
+
+class FailingProvider(FakeStreamingProvider):
+    """Provider whose every call fails, like an LLM timeout"""
+    
+    def __init__(self):
+        super().__init__([])
+    
+    async def generate(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        raise RuntimeError("LLM timed out")
+
+
+class TestAddMessage:
+    """Test cases for the non-streaming message paths"""
+    
+    async def test_user_message_kept_when_llm_fails(
+        self, async_db_session: AsyncSession, async_sample_conversation: Conversation
+    ):
+        """Test that a failed LLM call still leaves the user's message stored"""
+        service = make_service(FailingProvider())
+        
+        with pytest.raises(LLMException):
+            await service.add_message(async_db_session, async_sample_conversation.id, AddMessageRequest(message="Hi"))
+        
+        messages = await service.conversation_repo.get_messages(async_db_session, async_sample_conversation.id)
+        assert [(m.role, m.content) for m in messages] == [(MessageRole.USER, "Hi")]
+    
+    async def test_first_message_kept_when_llm_fails(self, async_db_session: AsyncSession):
+        """Test that a conversation whose first LLM call fails keeps the opening message"""
+        service = make_service(FailingProvider())
+        
+        with pytest.raises(LLMException):
+            await service.create_conversation(async_db_session, CreateConversationRequest(user_id="u1", message="Hello"))
+        
+        conversations, _ = await service.conversation_repo.get_by_user(async_db_session, "u1")
+        messages = await service.conversation_repo.get_messages(async_db_session, conversations[0].id)
+        assert [(m.role, m.content) for m in messages] == [(MessageRole.USER, "Hello")]
+    
+    async def test_reply_follows_user_message(self, async_db_session: AsyncSession, async_sample_conversation: Conversation):
+        """Test that a successful turn stores both messages in order with their token usage"""
+        service = make_service(FakeStreamingProvider(["Hello!"]))
+        
+        await service.add_message(async_db_session, async_sample_conversation.id, AddMessageRequest(message="Hi"))
+        
+        messages = await service.conversation_repo.get_messages(async_db_session, async_sample_conversation.id)
+        assert [(m.role, m.sequence_number) for m in messages] == [(MessageRole.USER, 1), (MessageRole.ASSISTANT, 2)]
+        await async_db_session.refresh(async_sample_conversation)
+        assert async_sample_conversation.total_tokens == messages[0].token_count + messages[1].token_count
+        assert async_sample_conversation.message_count == 2
+
+
+class TestContextHistory:
+    """Test cases for loading the history window of a turn"""
+    
+    @pytest.mark.parametrize("strategy, expected", [
+        (ContextWindowStrategy.SLIDING_WINDOW, 20),
+        (ContextWindowStrategy.TRUNCATE_OLDEST, 30),
+    ])
+    async def test_message_cap_depends_on_strategy(
+        self,
+        async_db_session: AsyncSession,
+        async_sample_conversation: Conversation,
+        strategy: ContextWindowStrategy,
+        expected: int
+    ):
+        """Test that only the sliding window caps the number of short messages within the token budget"""
+        service = make_service(FakeStreamingProvider(["x"]))
+        service.context_strategy = strategy
+        for i in range(30):
+            await service.conversation_repo.add_message(async_db_session, async_sample_conversation.id, "user", f"m{i}", token_count=1)
+        
+        history = await service._load_context_history(async_db_session, async_sample_conversation.id)
+        
+        assert len(history) == expected
+        assert history[-1].content == "m29"
+
+
+class RecordingProvider(FakeStreamingProvider):
+    """Provider that records the prompts it receives"""
+    
+    def __init__(self, reply: str):
+        super().__init__([reply])
+        self.prompts: List[List[Dict[str, str]]] = []
+    
+    async def generate(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        self.prompts.append(messages)
+        return await super().generate(messages, **kwargs)
+
+
+class TestConversationSummarizer:
+    """Test cases for rolling summaries (SUMMARIZE strategy)"""
+    
+    @pytest.fixture
+    def service(self) -> ChatService:
+        service = make_service(RecordingProvider("They talked about numbers."))
+        service.context_strategy = ContextWindowStrategy.SUMMARIZE
+        service.summarizer.trigger_tokens = 20
+        return service
+    
+    async def _add_messages(self, async_db_session: AsyncSession, service: ChatService, conversation: Conversation, n: int):
+        for i in range(n):
+            await service.conversation_repo.add_message(async_db_session, conversation.id, "user", f"number {i}", token_count=10)
+    
+    async def test_summarize_folds_evicted_messages(
+        self, async_db_session: AsyncSession, service: ChatService, async_sample_conversation: Conversation
+    ):
+        """Test that messages before the window become one persisted summary"""
+        await self._add_messages(async_db_session, service, async_sample_conversation, 6)
+        
+        summary = await service.summarizer.summarize(async_db_session, async_sample_conversation.id, before_sequence=5)
+        
+        assert summary.is_summary is True
+        assert summary.role == MessageRole.SYSTEM
+        assert summary.content == "They talked about numbers."
+        await async_db_session.refresh(async_sample_conversation)
+        assert async_sample_conversation.summarized_until == 4
+        transcript = service.llm_provider.prompts[0][1]["content"]
+        assert "number 0" in transcript and "number 3" in transcript and "number 4" not in transcript
+    
+    async def test_summarize_waits_for_enough_tokens(
+        self, async_db_session: AsyncSession, service: ChatService, async_sample_conversation: Conversation
+    ):
+        """Test that nothing is summarized below the trigger threshold"""
+        await self._add_messages(async_db_session, service, async_sample_conversation, 3)
+        
+        assert await service.summarizer.summarize(async_db_session, async_sample_conversation.id, before_sequence=2) is None
+    
+    async def test_context_uses_summary_plus_tail(
+        self, async_db_session: AsyncSession, service: ChatService, async_sample_conversation: Conversation
+    ):
+        """Test that the latest summary is sent instead of the evicted messages"""
+        await self._add_messages(async_db_session, service, async_sample_conversation, 6)
+        summary = await service.summarizer.summarize(async_db_session, async_sample_conversation.id, before_sequence=5)
+        
+        history = await service._load_context_history(async_db_session, async_sample_conversation.id)
+        context = service._build_llm_messages(history, system_prompt="sys", summary=summary)
+        
+        assert all(not m.is_summary for m in history)
+        assert context[1]["role"] == "system"
+        assert context[1]["content"].endswith("They talked about numbers.")
@@ -0,0 +1,161 @@
+"""
+Unit Tests for the Chroma Vector Store
+"""
+import asyncio
+import threading
+
+import pytest
+
+from app.core.exceptions import DocumentNotFoundException
+from app.services.ingestion_service import IngestionService
+from app.services.vectorstore.base import DocumentChunk, SearchFilter
+from app.services.vectorstore.chroma import ChromaVectorStore
+from tests.test_ingestion_service import PARAGRAPHS, CountingEmbeddingProvider, document
+
+pytestmark = pytest.mark.anyio
+
+
+def chunk(chunk_id: str, document_id: str, user_id: str, file_type: str = "txt") -> DocumentChunk:
+    return DocumentChunk(
+        id=chunk_id,
+        content=f"content of {chunk_id}",
+        embedding=[1.0, 0.0],
+        metadata={"document_id": document_id, "user_id": user_id, "file_type": file_type}
+    )
+
+
+CHUNKS = [
+    chunk("a1", "doc-a", "alice", "pdf"),
+    chunk("a2", "doc-a2", "alice"),
+    chunk("b1", "doc-b", "bob"),
+]
+
+
+class TestFilteredSearch:
+    """Test cases for metadata filters and per-tenant collections"""
+
+    @pytest.mark.parametrize("tenant_collections", [False, True])
+    async def test_filters_restrict_results(self, tmp_path, tenant_collections: bool):
+        """Test that user, document and file type filters apply in both layouts"""
+        store = ChromaVectorStore(persist_directory=str(tmp_path), tenant_collections=tenant_collections)
+        await store.add_documents(CHUNKS)
+
+        async def ids(filters: SearchFilter):
+            return sorted(r.chunk_id for r in await store.search([1.0, 0.0], top_k=10, filters=filters))
+
+        assert await ids(SearchFilter(user_id="alice")) == ["a1", "a2"]
+        assert await ids(SearchFilter(user_id="alice", file_type="pdf")) == ["a1"]
+        assert await ids(SearchFilter(document_ids=["doc-a2", "doc-b"])) == ["a2", "b1"]
+
+    async def test_tenant_collections_shard_chunks(self, tmp_path):
+        """Test that each tenant's chunks live in a collection of their own"""
+        store = ChromaVectorStore(persist_directory=str(tmp_path), tenant_collections=True)
+        await store.add_documents(CHUNKS)
+
+        assert store._collection.count() == 0
+        assert store._collection_for("alice").count() == 2
+        assert [c.id for c in await store.get_document_chunks("doc-b")] == ["b1"]
+
+        await store.delete_chunks(["a1", "b1"])
+        assert [r.chunk_id for r in await store.search([1.0, 0.0], top_k=10, filters=SearchFilter(user_id="alice"))] == ["a2"]
+
+    async def test_search_does_not_create_tenant_collections(self, tmp_path):
+        """Test that reads for a user without documents leave no collection behind"""
+        store = ChromaVectorStore(persist_directory=str(tmp_path), tenant_collections=True)
+        collections = len(store._client.list_collections())
+
+        assert await store.search([1.0, 0.0], filters=SearchFilter(user_id="carol")) == []
+        assert await store.find_document_by_hash("hash", user_id="carol") is None
+        assert len(store._client.list_collections()) == collections
+
+
+class TestExecutor:
+    """Test cases for running chromadb calls off the event loop"""
+
+    async def test_bulk_add_is_split_into_batches(self, tmp_path):
+        """Test that an add larger than the batch limit is written in several upserts"""
+        store = ChromaVectorStore(persist_directory=str(tmp_path), max_batch_size=4)
+        upserts = []
+        upsert = store._collection.upsert
+
+        def recording_upsert(**kwargs):
+            upserts.append(len(kwargs["ids"]))
+            upsert(**kwargs)
+
+        store._collection.upsert = recording_upsert
+        await store.add_documents([chunk(f"c{i}", "doc", "alice") for i in range(10)])
+
+        assert upserts == [4, 4, 2]
+        assert len(await store.get_document_chunks("doc")) == 10
+        store.close()
+
+    async def test_calls_run_on_executor_threads(self, tmp_path):
+        """Test that chromadb is never called on the event loop thread"""
+        store = ChromaVectorStore(persist_directory=str(tmp_path))
+        threads = []
+        query = store._collection.query
+
+        def recording_query(**kwargs):
+            threads.append(threading.current_thread().name)
+            return query(**kwargs)
+
+        store._collection.query = recording_query
+        await store.add_documents(CHUNKS)
+        await asyncio.gather(*(store.search([1.0, 0.0]) for _ in range(4)))
+
+        assert len(threads) == 4
+        assert all(name.startswith("chroma") for name in threads)
+        store.close()
+
+
+class TestTenantOwnership:
+    """Test cases for user-owned documents during ingestion"""
+
+    @pytest.fixture
+    def service(self, tmp_path) -> IngestionService:
+        return IngestionService(
+            embedding_provider=CountingEmbeddingProvider(),
+            vector_store=ChromaVectorStore(persist_directory=str(tmp_path)),
+            chunk_size=50,
+            chunk_overlap=1
+        )
+
+    async def test_duplicates_are_per_user(self, service: IngestionService):
+        """Test that the same upload by another user becomes a separate document"""
+        alice = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain", user_id="alice")
+        bob = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain", user_id="bob")
+        again = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain", user_id="alice")
+
+        assert bob.status == "completed"
+        assert bob.document_id != alice.document_id
+        assert again.status == "duplicate" and again.document_id == alice.document_id
+
+    async def test_cannot_update_another_users_document(self, service: IngestionService):
+        """Test that a document is only updatable by its owner"""
+        alice = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain", user_id="alice")
+
+        with pytest.raises(DocumentNotFoundException):
+            await service.update_document(alice.document_id, document(PARAGRAPHS[:3]), "doc.txt", "text/plain", user_id="bob")
+
+    @pytest.mark.parametrize("tenant_collections", [False, True])
+    async def test_unowned_requests_only_reach_unowned_documents(self, tmp_path, tenant_collections: bool):
+        """Test that a request without a user_id cannot dedupe against, update or delete an owned document"""
+        service = IngestionService(
+            embedding_provider=CountingEmbeddingProvider(),
+            vector_store=ChromaVectorStore(persist_directory=str(tmp_path), tenant_collections=tenant_collections),
+            chunk_size=50,
+            chunk_overlap=1
+        )
+        alice = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain", user_id="alice")
+
+        anonymous = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain")
+        assert anonymous.status == "completed" and anonymous.document_id != alice.document_id
+        with pytest.raises(DocumentNotFoundException):
+            await service.update_document(alice.document_id, document(PARAGRAPHS[:3]), "doc.txt", "text/plain")
+        with pytest.raises(DocumentNotFoundException):
+            await service.delete_document(alice.document_id)
+        with pytest.raises(DocumentNotFoundException):
+            await service.delete_document(anonymous.document_id, user_id="alice")
+
+        assert await service.delete_document(alice.document_id, user_id="alice")
+        assert await service.delete_document(anonymous.document_id)
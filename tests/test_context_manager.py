@@ -0,0 +1,261 @@
+"""
+Unit Tests for Context Manager and Token Counters
+"""
+from typing import Dict, List
+
+import pytest
+import tiktoken
+
+from app.services.context_manager import ContextConfig, ContextManager, SimpleTokenCounter, TiktokenCounter
+
+
+@pytest.fixture
+def byte_encoding(monkeypatch) -> tiktoken.Encoding:
+    """
+    Offline byte-level encoding (one token per UTF-8 byte) so tests do not
+    depend on downloading the real BPE ranks.
+    """
+    encoding = tiktoken.Encoding(
+        name="test_bytes",
+        pat_str=r"""\S+|\s+""",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model: encoding)
+    return encoding
+
+
+class TestTiktokenCounterCache:
+    """Test cases for the token-count LRU cache"""
+    
+    def test_repeated_text_hits_cache(self, byte_encoding):
+        """Test that identical strings are only encoded once"""
+        counter = TiktokenCounter()
+        
+        assert counter.count_tokens("system prompt") == 13
+        assert counter.count_tokens("system prompt") == 13
+        
+        info = counter.cache_info()
+        assert info["hits"] == 1
+        assert info["misses"] == 1
+        assert info["hit_rate"] == 0.5
+    
+    def test_cache_is_bounded_lru(self, byte_encoding):
+        """Test that the least recently used entry is evicted first"""
+        counter = TiktokenCounter(cache_size=2)
+        
+        counter.count_tokens("a")
+        counter.count_tokens("bb")
+        counter.count_tokens("a")
+        counter.count_tokens("ccc")
+        
+        assert counter.cache_info()["size"] == 2
+        hits = counter.cache_hits
+        counter.count_tokens("a")
+        assert counter.cache_hits == hits + 1
+        counter.count_tokens("bb")
+        assert counter.cache_hits == hits + 1
+    
+    def test_count_many_matches_count_tokens(self, byte_encoding):
+        """Test that batch counting agrees with single counting and fills the cache"""
+        counter = TiktokenCounter()
+        texts = ["hello", "", "héllo", "hello", "world!"]
+        
+        assert counter.count_many(texts) == [len(t.encode()) for t in texts]
+        assert counter.cache_info()["size"] == 3
+        assert counter.count_many(["world!"]) == [6]
+        assert counter.cache_hits >= 1
+    
+    def test_small_batches_are_encoded_inline(self, byte_encoding):
+        """Test that only large batches of misses use the shared encoding executor"""
+        counter = TiktokenCounter()
+        
+        counter.count_many(["a single miss", "and another"])
+        assert counter._executor is None
+        
+        many = [f"text number {i}" for i in range(TiktokenCounter.PARALLEL_MIN_BATCH)]
+        assert counter.count_many(many) == [len(t) for t in many]
+        executor = counter._executor
+        assert executor is not None
+        counter.count_many([f"other text {i}" for i in range(TiktokenCounter.PARALLEL_MIN_BATCH)])
+        assert counter._executor is executor
+    
+    def test_role_overhead_is_precomputed(self, byte_encoding):
+        """Test that role strings are not re-encoded per message"""
+        counter = TiktokenCounter()
+        messages = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+        
+        total = counter.count_messages_tokens(messages)
+        
+        assert total == (4 + 4 + 2) + (4 + 9 + 5) + 3
+        assert counter.cache_info()["size"] == 2
+
+
+class TestTruncation:
+    """Test cases for token-aware truncation"""
+    
+    def test_tiktoken_truncate_encodes_once(self, byte_encoding, monkeypatch):
+        """Test that truncation slices the token array instead of re-encoding prefixes"""
+        counter = TiktokenCounter()
+        calls = []
+        original_encode = byte_encoding.encode
+        monkeypatch.setattr(byte_encoding, "encode", lambda text, **kw: calls.append(text) or original_encode(text, **kw))
+        
+        result = counter.truncate("x" * 20_000, 100)
+        
+        assert result == "x" * 100
+        assert len(calls) == 1
+    
+    def test_tiktoken_truncate_drops_split_characters(self, byte_encoding):
+        """Test that a multi-byte character cut in half is dropped"""
+        counter = TiktokenCounter()
+        
+        assert counter.truncate("aé", 2) == "a"
+        assert counter.truncate("short", 100) == "short"
+        assert counter.truncate("anything", 0) == ""
+    
+    def test_simple_truncate_fits_budget(self):
+        """Test that the character-based fallback stays within the budget"""
+        counter = SimpleTokenCounter()
+        text = "y" * 1000
+        
+        for max_tokens in (1, 5, 37, 250):
+            truncated = counter.truncate(text, max_tokens)
+            assert counter.count_tokens(truncated) <= max_tokens
+            assert counter.count_tokens(text[:len(truncated) + 1]) > max_tokens
+    
+    def test_build_context_truncates_oversized_system_prompt(self):
+        """Test that an oversized system prompt is cut to the available budget"""
+        manager = ContextManager(
+            config=ContextConfig(max_context_tokens=200, max_response_tokens=50),
+            token_counter=SimpleTokenCounter()
+        )
+        
+        context = manager.build_context([{"role": "user", "content": "hi"}], system_prompt="z" * 5000)
+        
+        assert context[0]["role"] == "system"
+        assert manager.count_messages_tokens(context) <= manager.available_context_tokens + 10
+
+
+class TestSelectChunks:
+    """Test cases for whole-chunk document context selection"""
+    
+    def test_keeps_highest_priority_chunks_that_fit(self):
+        """Test that chunks are kept in priority order and oversized ones are skipped"""
+        manager = ContextManager(token_counter=SimpleTokenCounter())
+        chunks = ["a" * 40, "b" * 400, "c" * 40, "d" * 40]
+        
+        kept = manager.select_chunks(chunks, max_tokens=40, separator="|")
+        
+        assert kept == [0, 2, 3]
+    
+    def test_empty_budget_keeps_nothing(self):
+        """Test that a non-positive budget selects no chunks"""
+        manager = ContextManager(token_counter=SimpleTokenCounter())
+        
+        assert manager.select_chunks(["a"], max_tokens=0) == []
+
+
+class CountingTokenCounter(SimpleTokenCounter):
+    """SimpleTokenCounter that records how many strings it counts"""
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def count_tokens(self, text: str) -> int:
+        self.calls += 1
+        return super().count_tokens(text)
+
+
+def make_history(n: int) -> List[Dict[str, str]]:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message number {i} " * 3}
+        for i in range(n)
+    ]
+
+
+class TestContextStrategies:
+    """Test cases for sliding window and truncate-oldest strategies"""
+    
+    @pytest.fixture
+    def manager(self) -> ContextManager:
+        return ContextManager(
+            config=ContextConfig(max_context_tokens=100_000, max_response_tokens=0, sliding_window_messages=20_000),
+            token_counter=SimpleTokenCounter()
+        )
+    
+    def test_sliding_window_keeps_newest_that_fit(self, manager: ContextManager):
+        """Test that the newest messages within budget are kept in order"""
+        messages = make_history(10)
+        costs = [manager.token_counter.count_message_tokens(m) for m in messages]
+        
+        selected = manager._apply_sliding_window(messages, sum(costs[-3:]))
+        
+        assert selected == messages[-3:]
+    
+    def test_sliding_window_keeps_latest_when_nothing_fits(self, manager: ContextManager):
+        """Test that the latest message is always kept"""
+        messages = make_history(5)
+        
+        assert manager._apply_sliding_window(messages, 1) == [messages[-1]]
+    
+    def test_sliding_window_uses_persisted_counts(self, manager: ContextManager):
+        """Test that provided token counts replace counting the content"""
+        messages = make_history(4)
+        
+        selected = manager._apply_sliding_window(messages, 2 * 110, token_counts=[100, 100, 100, 100])
+        
+        assert selected == messages[-2:]
+    
+    def test_truncate_oldest_matches_full_recount(self, manager: ContextManager):
+        """Test that the prefix-sum version drops exactly as many messages as recounting would"""
+        messages = make_history(50)
+        
+        for max_tokens in (0, 3, 50, 400, 10_000):
+            expected = list(messages)
+            while expected and manager.count_messages_tokens(expected) > max_tokens:
+                expected.pop(0)
+            assert manager._truncate_oldest(messages, max_tokens) == expected
+    
+    def test_add_message_to_context_preserves_system_message(self):
+        """Test that the system message survives when the window slides"""
+        manager = ContextManager(
+            config=ContextConfig(max_context_tokens=120, max_response_tokens=20),
+            token_counter=SimpleTokenCounter()
+        )
+        context = [{"role": "system", "content": "be brief"}] + make_history(20)
+        
+        updated = manager.add_message_to_context(context, "user", "latest question")
+        
+        assert updated[0]["role"] == "system"
+        assert updated[-1]["content"] == "latest question"
+        assert manager.count_messages_tokens(updated) <= manager.available_context_tokens
+
+
+class TestContextStrategiesScaling:
+    """Strategies must scale linearly with history length, measured in counting work"""
+    
+    SIZES = (1_000, 10_000)
+    
+    @pytest.mark.parametrize("strategy", ["_apply_sliding_window", "_truncate_oldest", "add_message_to_context"])
+    def test_linear_scaling(self, strategy: str):
+        """Test that 10x more messages costs 10x, not 100x, the token counting"""
+        calls = {}
+        for n in self.SIZES:
+            counter = CountingTokenCounter()
+            manager = ContextManager(
+                config=ContextConfig(max_context_tokens=n * 10, max_response_tokens=0, sliding_window_messages=n * 2),
+                token_counter=counter
+            )
+            messages = make_history(n)
+            if strategy == "add_message_to_context":
+                manager.add_message_to_context(messages, "user", "next")
+            else:
+                getattr(manager, strategy)(messages, n * 10)
+            calls[n] = counter.calls
+        
+        small, large = self.SIZES
+        ratio = large // small
+        # Each message is counted a constant number of times
+        assert calls[large] <= ratio * calls[small] + ratio
+        assert calls[large] <= 4 * large
@@ -1,11 +1,18 @@
 """
 Unit Tests for Conversation Repository
 """
+from datetime import datetime
+
 import pytest
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine, inspect, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.database import upgrade_schema
+from app.models.base import Base
 from app.models.conversation import Conversation, Message, MessageRole
-from app.repositories.conversation import ConversationRepository, conversation_repository
+from app.repositories.conversation import ConversationRepository, MessageRepository, conversation_repository
+
+pytestmark = pytest.mark.anyio
 
 
 class TestConversationRepository:
@@ -16,118 +23,118 @@ class TestConversationRepository:
         """Create a fresh repository instance"""
         return ConversationRepository()
     
-    def test_create_conversation(self, db_session: Session, repo: ConversationRepository):
+    async def test_create_conversation(self, async_db_session: AsyncSession, repo: ConversationRepository):
         """Test creating a conversation through repository"""
-        conversation = repo.create(db_session, {"user_id": "test-user-123", "title": "New Conversation"})
+        conversation = await repo.create(async_db_session, {"user_id": "test-user-123", "title": "New Conversation"})
         
         assert conversation is not None
         assert conversation.id is not None
         assert conversation.title == "New Conversation"
         assert conversation.user_id == "test-user-123"
     
-    def test_get_conversation_by_id(self, db_session: Session, repo: ConversationRepository, sample_conversation: Conversation):
+    async def test_get_conversation_by_id(self, async_db_session: AsyncSession, repo: ConversationRepository, async_sample_conversation: Conversation):
         """Test retrieving a conversation by ID"""
-        found = repo.get(db_session, sample_conversation.id)
+        found = await repo.get(async_db_session, async_sample_conversation.id)
         
         assert found is not None
-        assert found.id == sample_conversation.id
-        assert found.title == sample_conversation.title
+        assert found.id == async_sample_conversation.id
+        assert found.title == async_sample_conversation.title
     
-    def test_get_nonexistent_conversation(self, db_session: Session, repo: ConversationRepository):
+    async def test_get_nonexistent_conversation(self, async_db_session: AsyncSession, repo: ConversationRepository):
         """Test retrieving a non-existent conversation returns None"""
-        found = repo.get(db_session, "nonexistent-id")
+        found = await repo.get(async_db_session, "nonexistent-id")
         
         assert found is None
     
-    def test_get_all_conversations(self, db_session: Session, repo: ConversationRepository):
+    async def test_get_all_conversations(self, async_db_session: AsyncSession, repo: ConversationRepository):
         """Test retrieving all conversations"""
         # Create multiple conversations
-        repo.create(db_session, {"user_id": "test-user-123", "title": "Conversation 1"})
-        repo.create(db_session, {"user_id": "test-user-123", "title": "Conversation 2"})
-        repo.create(db_session, {"user_id": "test-user-123", "title": "Conversation 3"})
+        await repo.create(async_db_session, {"user_id": "test-user-123", "title": "Conversation 1"})
+        await repo.create(async_db_session, {"user_id": "test-user-123", "title": "Conversation 2"})
+        await repo.create(async_db_session, {"user_id": "test-user-123", "title": "Conversation 3"})
         
-        conversations = repo.get_all(db_session)
+        conversations = await repo.get_all(async_db_session)
         
         assert len(conversations) == 3
     
-    def test_get_all_with_pagination(self, db_session: Session, repo: ConversationRepository):
+    async def test_get_all_with_pagination(self, async_db_session: AsyncSession, repo: ConversationRepository):
         """Test pagination when retrieving conversations"""
         # Create 5 conversations
         for i in range(5):
-            repo.create(db_session, {"user_id": "test-user-123", "title": f"Conversation {i+1}"})
+            await repo.create(async_db_session, {"user_id": "test-user-123", "title": f"Conversation {i+1}"})
         
         # Get first 2
-        first_page = repo.get_all(db_session, skip=0, limit=2)
+        first_page = await repo.get_all(async_db_session, skip=0, limit=2)
         assert len(first_page) == 2
         
         # Get next 2
-        second_page = repo.get_all(db_session, skip=2, limit=2)
+        second_page = await repo.get_all(async_db_session, skip=2, limit=2)
         assert len(second_page) == 2
         
         # Get remaining
-        third_page = repo.get_all(db_session, skip=4, limit=2)
+        third_page = await repo.get_all(async_db_session, skip=4, limit=2)
         assert len(third_page) == 1
     
-    def test_delete_conversation(self, db_session: Session, repo: ConversationRepository, sample_conversation: Conversation):
+    async def test_delete_conversation(self, async_db_session: AsyncSession, repo: ConversationRepository, async_sample_conversation: Conversation):
         """Test deleting a conversation"""
-        conversation_id = sample_conversation.id
+        conversation_id = async_sample_conversation.id
         
-        result = repo.delete(db_session, conversation_id)
+        result = await repo.delete(async_db_session, conversation_id)
         
         assert result is True
-        assert repo.get(db_session, conversation_id) is None
+        assert await repo.get(async_db_session, conversation_id) is None
     
-    def test_delete_nonexistent_conversation(self, db_session: Session, repo: ConversationRepository):
+    async def test_delete_nonexistent_conversation(self, async_db_session: AsyncSession, repo: ConversationRepository):
         """Test deleting a non-existent conversation returns False"""
-        result = repo.delete(db_session, "nonexistent-id")
+        result = await repo.delete(async_db_session, "nonexistent-id")
         
         assert result is False
     
-    def test_add_message(self, db_session: Session, repo: ConversationRepository, sample_conversation: Conversation):
+    async def test_add_message(self, async_db_session: AsyncSession, repo: ConversationRepository, async_sample_conversation: Conversation):
         """Test adding a message to a conversation"""
-        message = repo.add_message(
-            db_session,
-            sample_conversation.id,
+        message = await repo.add_message(
+            async_db_session,
+            async_sample_conversation.id,
             role="user",
             content="Hello, world!"
         )
         
         assert message is not None
         assert message.id is not None
-        assert message.conversation_id == sample_conversation.id
+        assert message.conversation_id == async_sample_conversation.id
         assert message.role == "user"
         assert message.content == "Hello, world!"
     
-    def test_get_messages(self, db_session: Session, repo: ConversationRepository, sample_conversation: Conversation):
+    async def test_get_messages(self, async_db_session: AsyncSession, repo: ConversationRepository, async_sample_conversation: Conversation):
         """Test retrieving messages for a conversation"""
         # Add multiple messages
-        repo.add_message(db_session, sample_conversation.id, "user", "Message 1")
-        repo.add_message(db_session, sample_conversation.id, "assistant", "Message 2")
-        repo.add_message(db_session, sample_conversation.id, "user", "Message 3")
+        await repo.add_message(async_db_session, async_sample_conversation.id, "user", "Message 1")
+        await repo.add_message(async_db_session, async_sample_conversation.id, "assistant", "Message 2")
+        await repo.add_message(async_db_session, async_sample_conversation.id, "user", "Message 3")
         
-        messages = repo.get_messages(db_session, sample_conversation.id)
+        messages = await repo.get_messages(async_db_session, async_sample_conversation.id)
         
         assert len(messages) == 3
         assert messages[0].content == "Message 1"
         assert messages[1].content == "Message 2"
         assert messages[2].content == "Message 3"
     
-    def test_get_messages_empty_conversation(self, db_session: Session, repo: ConversationRepository, sample_conversation: Conversation):
+    async def test_get_messages_empty_conversation(self, async_db_session: AsyncSession, repo: ConversationRepository, async_sample_conversation: Conversation):
         """Test retrieving messages from a conversation with no messages"""
-        messages = repo.get_messages(db_session, sample_conversation.id)
+        messages = await repo.get_messages(async_db_session, async_sample_conversation.id)
         
         assert messages == []
     
-    def test_get_messages_ordered_by_created_at(self, db_session: Session, repo: ConversationRepository, sample_conversation: Conversation):
+    async def test_get_messages_ordered_by_created_at(self, async_db_session: AsyncSession, repo: ConversationRepository, async_sample_conversation: Conversation):
         """Test that messages are returned in chronological order"""
         import time
         
         # Add messages with slight delays to ensure different timestamps
-        repo.add_message(db_session, sample_conversation.id, "user", "First")
-        repo.add_message(db_session, sample_conversation.id, "assistant", "Second")
-        repo.add_message(db_session, sample_conversation.id, "user", "Third")
+        await repo.add_message(async_db_session, async_sample_conversation.id, "user", "First")
+        await repo.add_message(async_db_session, async_sample_conversation.id, "assistant", "Second")
+        await repo.add_message(async_db_session, async_sample_conversation.id, "user", "Third")
         
-        messages = repo.get_messages(db_session, sample_conversation.id)
+        messages = await repo.get_messages(async_db_session, async_sample_conversation.id)
         
         # Verify order
         assert messages[0].content == "First"
@@ -138,6 +145,208 @@ class TestConversationRepository:
         for i in range(len(messages) - 1):
             assert messages[i].created_at <= messages[i + 1].created_at
 
+    async def test_add_turn_assigns_contiguous_sequences(self, async_db_session: AsyncSession, repo: ConversationRepository, async_sample_conversation: Conversation):
+        """Test that a turn is stored with consecutive sequence numbers and its token usage"""
+        await repo.add_message(async_db_session, async_sample_conversation.id, "user", "First", token_count=2)
+
+        await repo.add_turn(async_db_session, async_sample_conversation.id, [
+            Message(role=MessageRole.USER, content="Second", token_count=3),
+            Message(role=MessageRole.ASSISTANT, content="Third", token_count=4),
+        ])
+
+        messages = await repo.get_messages(async_db_session, async_sample_conversation.id)
+        await async_db_session.refresh(async_sample_conversation)
+
+        assert [m.sequence_number for m in messages] == [1, 2, 3]
+        assert [m.content for m in messages] == ["First", "Second", "Third"]
+        assert async_sample_conversation.message_sequence == 3
+        assert async_sample_conversation.total_tokens == 7
+
+    async def test_writes_maintain_listing_fields(self, async_db_session: AsyncSession, repo: ConversationRepository, async_sample_conversation: Conversation):
+        """Test that message_count and last_message_preview are kept up to date on write"""
+        await repo.add_message(async_db_session, async_sample_conversation.id, "user", "First")
+        await repo.add_turn(async_db_session, async_sample_conversation.id, [
+            Message(role=MessageRole.USER, content="Second"),
+            Message(role=MessageRole.ASSISTANT, content="x" * 150),
+        ])
+        await repo.add_summary(async_db_session, async_sample_conversation.id, "Summary", token_count=1, summarized_until=1)
+
+        await async_db_session.refresh(async_sample_conversation)
+
+        assert async_sample_conversation.message_count == 3
+        assert async_sample_conversation.last_message_preview == "x" * 100 + "..."
+
+    async def test_summary_keeps_listing_position(self, async_db_session: AsyncSession, repo: ConversationRepository, async_sample_conversation: Conversation):
+        """Test that storing a background summary does not change updated_at"""
+        await async_db_session.execute(
+            update(Conversation).where(Conversation.id == async_sample_conversation.id).values(updated_at=datetime(2024, 1, 1))
+        )
+        await async_db_session.commit()
+
+        await repo.add_summary(async_db_session, async_sample_conversation.id, "Summary", token_count=1, summarized_until=0)
+        await async_db_session.refresh(async_sample_conversation)
+
+        assert async_sample_conversation.updated_at == datetime(2024, 1, 1)
+        assert async_sample_conversation.message_sequence == 1
+
+    async def test_get_by_user_keyset_pagination(self, async_db_session: AsyncSession, repo: ConversationRepository):
+        """Test that cursor pages cover every conversation exactly once, newest first"""
+        for i in range(5):
+            await repo.create(async_db_session, {"user_id": "test-user-123", "title": f"Conversation {i+1}"})
+        await repo.create(async_db_session, {"user_id": "other-user", "title": "Not mine"})
+
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            page, cursor = await repo.get_by_user(async_db_session, "test-user-123", limit=2, cursor=cursor)
+            seen.extend(page)
+            pages += 1
+            if cursor is None:
+                break
+
+        assert pages == 3
+        assert len({c.id for c in seen}) == 5
+        keys = [(c.updated_at, c.id) for c in seen]
+        assert keys == sorted(keys, reverse=True)
+
+    async def test_get_by_user_rejects_invalid_cursor(self, async_db_session: AsyncSession, repo: ConversationRepository):
+        """Test that a malformed cursor raises ValueError"""
+        with pytest.raises(ValueError):
+            await repo.get_by_user(async_db_session, "test-user-123", cursor="not-a-cursor")
+
+    async def test_duplicate_sequence_number_is_rejected(self, async_db_session: AsyncSession, repo: ConversationRepository, async_sample_conversation: Conversation):
+        """Test that the unique index guards against two messages sharing a sequence number"""
+        from sqlalchemy.exc import IntegrityError
+
+        await repo.add_message(async_db_session, async_sample_conversation.id, "user", "First")
+        async_db_session.add(Message(
+            conversation_id=async_sample_conversation.id,
+            role=MessageRole.USER,
+            content="Duplicate",
+            sequence_number=1,
+        ))
+
+        with pytest.raises(IntegrityError):
+            await async_db_session.commit()
+        await async_db_session.rollback()
+
+    async def test_create_with_turn(self, async_db_session: AsyncSession, repo: ConversationRepository):
+        """Test creating a conversation together with its first turn"""
+        conversation = await repo.create_with_turn(
+            async_db_session,
+            {"user_id": "test-user-123", "title": "New Conversation"},
+            [
+                Message(role=MessageRole.USER, content="Hi", token_count=1),
+                Message(role=MessageRole.ASSISTANT, content="Hello!", token_count=2),
+            ],
+        )
+
+        messages = await repo.get_messages(async_db_session, conversation.id)
+
+        assert [m.sequence_number for m in messages] == [1, 2]
+        assert conversation.message_sequence == 2
+        assert conversation.total_tokens == 3
+        assert await repo.get_next_sequence_number(async_db_session, conversation.id) == 3
+
+
+class TestMessageRepository:
+    """Test cases for the MessageRepository class"""
+    
+    @pytest.fixture
+    def repo(self) -> ConversationRepository:
+        return ConversationRepository()
+    
+    @pytest.fixture
+    def message_repo(self) -> MessageRepository:
+        return MessageRepository()
+    
+    async def test_messages_within_token_limit_returns_newest_fit(
+        self, async_db_session: AsyncSession, repo: ConversationRepository, message_repo: MessageRepository, async_sample_conversation: Conversation
+    ):
+        """Test that the newest messages fitting the budget are returned oldest first"""
+        for i in range(10):
+            await repo.add_message(async_db_session, async_sample_conversation.id, "user", f"Message {i}", token_count=10)
+        
+        messages = await message_repo.get_messages_within_token_limit(async_db_session, async_sample_conversation.id, max_tokens=35)
+        
+        assert [m.content for m in messages] == ["Message 7", "Message 8", "Message 9"]
+    
+    async def test_messages_within_token_limit_applies_overhead_and_cap(
+        self, async_db_session: AsyncSession, repo: ConversationRepository, message_repo: MessageRepository, async_sample_conversation: Conversation
+    ):
+        """Test that per-message overhead and the message cap are respected"""
+        for i in range(10):
+            await repo.add_message(async_db_session, async_sample_conversation.id, "user", f"Message {i}", token_count=10)
+        
+        with_overhead = await message_repo.get_messages_within_token_limit(
+            async_db_session, async_sample_conversation.id, max_tokens=35, per_message_overhead=5
+        )
+        capped = await message_repo.get_messages_within_token_limit(
+            async_db_session, async_sample_conversation.id, max_tokens=1000, max_messages=4
+        )
+        
+        assert [m.content for m in with_overhead] == ["Message 8", "Message 9"]
+        assert [m.content for m in capped] == ["Message 6", "Message 7", "Message 8", "Message 9"]
+    
+    async def test_messages_within_token_limit_is_not_capped_at_100(
+        self, async_db_session: AsyncSession, repo: ConversationRepository, message_repo: MessageRepository, async_sample_conversation: Conversation
+    ):
+        """Test that long conversations still return their newest messages"""
+        for i in range(120):
+            await repo.add_message(async_db_session, async_sample_conversation.id, "user", f"Message {i}", token_count=1)
+        
+        messages = await message_repo.get_messages_within_token_limit(async_db_session, async_sample_conversation.id, max_tokens=2)
+        
+        assert [m.content for m in messages] == ["Message 118", "Message 119"]
+
+
+class TestSchemaUpgrade:
+    """Test cases for upgrading databases created before the conversation counters"""
+    
+    OLD_SCHEMA = [
+        """CREATE TABLE conversations (
+            id VARCHAR PRIMARY KEY, user_id VARCHAR NOT NULL, title VARCHAR(255), mode VARCHAR(9) NOT NULL,
+            total_tokens INTEGER, is_active BOOLEAN,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, updated_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+        )""",
+        """CREATE TABLE messages (
+            id VARCHAR PRIMARY KEY, conversation_id VARCHAR NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+            role VARCHAR(9) NOT NULL, content TEXT NOT NULL, sequence_number INTEGER NOT NULL,
+            token_count INTEGER, is_summary BOOLEAN,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, updated_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+        )""",
+        "INSERT INTO conversations (id, user_id, mode, updated_at) VALUES ('c1', 'u1', 'OPEN_CHAT', '2024-01-01 00:00:00')",
+        "INSERT INTO messages (id, conversation_id, role, content, sequence_number) VALUES ('m1', 'c1', 'USER', 'hi', 1)",
+        "INSERT INTO messages (id, conversation_id, role, content, sequence_number) VALUES ('m2', 'c1', 'ASSISTANT', 'hello', 2)",
+        # Duplicate left by a race in the old MAX()+1 allocation
+        "INSERT INTO messages (id, conversation_id, role, content, sequence_number) VALUES ('m3', 'c1', 'USER', 'again', 2)",
+    ]
+    
+    def test_old_database_is_upgraded_and_backfilled(self, tmp_path):
+        """Test that new columns are added, counters backfilled and indexes created"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with engine.begin() as conn:
+            for statement in self.OLD_SCHEMA:
+                conn.execute(text(statement))
+        
+        with engine.begin() as conn:
+            Base.metadata.create_all(conn)
+            upgrade_schema(conn)
+            upgrade_schema(conn)  # Idempotent
+        
+        with engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT message_sequence, message_count, last_message_preview, updated_at FROM conversations"
+            )).one()
+            sequences = conn.execute(text("SELECT id, sequence_number FROM messages ORDER BY id")).all()
+            indexes = {index["name"] for index in inspect(conn).get_indexes("messages")}
+        engine.dispose()
+        
+        assert tuple(row) == (3, 3, "again", "2024-01-01 00:00:00")
+        assert [tuple(r) for r in sequences] == [("m1", 1), ("m2", 2), ("m3", 3)]
+        assert "ix_messages_conversation_sequence" in indexes
+
 
 class TestConversationRepositorySingleton:
     """Test the singleton instance of ConversationRepository"""
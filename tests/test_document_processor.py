@@ -0,0 +1,167 @@
+"""
+Unit Tests for Document Processing
+"""
+from typing import List
+
+import pytest
+
+from app.services.context_manager import SimpleTokenCounter
+from app.services.document_processor.chunker import TextChunker
+from app.services.document_processor.processor import PAGE_SEPARATOR, DocumentProcessor, ExtractionProgress
+
+pytestmark = pytest.mark.anyio
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """Build a minimal PDF with one line of Helvetica text per page"""
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(pages)} >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id, text in zip(page_ids, pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return out
+
+
+PAGES = [f"Page number {i}" for i in range(7)]
+
+
+class TestPdfExtraction:
+    """Test cases for page-streaming PDF extraction"""
+
+    async def test_pages_are_yielded_in_order(self):
+        """Test that a PDF is extracted page by page, joined by the page separator"""
+        processor = DocumentProcessor(pdf_processes=0)
+
+        segments = [s async for s in processor.iter_text(make_pdf(PAGES), "pdf")]
+
+        assert [s.strip() for s in segments] == PAGES
+        assert all(s.startswith(PAGE_SEPARATOR) for s in segments[1:])
+
+    @pytest.mark.parametrize("pdf_processes", [0, 2])
+    async def test_progress_follows_extracted_pages(self, tmp_path, pdf_processes: int):
+        """Test that byte progress grows with the pages extracted and ends at the file size"""
+        path = tmp_path / "doc.pdf"
+        path.write_bytes(make_pdf(PAGES))
+        processor = DocumentProcessor(pdf_processes=pdf_processes, pages_per_task=2)
+        progress = ExtractionProgress()
+
+        try:
+            seen = [progress.bytes_processed async for _ in processor.iter_text(str(path), "pdf", progress=progress)]
+        finally:
+            processor.close()
+
+        size = path.stat().st_size
+        assert seen == [size * page // len(PAGES) for page in range(1, len(PAGES) + 1)]
+
+    async def test_process_pool_matches_thread_extraction(self, tmp_path):
+        """Test that page ranges extracted in worker processes keep document order"""
+        path = tmp_path / "doc.pdf"
+        path.write_bytes(make_pdf(PAGES))
+        threaded = DocumentProcessor(pdf_processes=0)
+        parallel = DocumentProcessor(pdf_processes=2, pages_per_task=2)
+
+        try:
+            expected, _ = await threaded.process(str(path), "doc.pdf", "application/pdf")
+            text, file_type = await parallel.process(str(path), "doc.pdf", "application/pdf")
+        finally:
+            parallel.close()
+
+        assert file_type == "pdf"
+        assert text == expected
+
+    async def test_text_file_is_read_in_blocks(self, tmp_path):
+        """Test that a text file source is streamed and reassembled unchanged"""
+        path = tmp_path / "doc.txt"
+        path.write_text("héllo wörld " * 200_000, encoding="utf-8")
+
+        segments = [s async for s in DocumentProcessor().iter_text(str(path), "txt")]
+
+        assert len(segments) > 1
+        assert "".join(segments) == path.read_text(encoding="utf-8")
+
+
+class TestStreamingChunker:
+    """Test cases for chunking a document given as a stream of segments"""
+
+    TEXT = " ".join(f"Sentence {i} of the streamed document." for i in range(400))
+
+    def test_chunks_carry_global_positions(self):
+        """Test that streamed chunks index into the whole document and are numbered consecutively"""
+        chunker = TextChunker(chunk_size=100, chunk_overlap=20)
+        segments = [self.TEXT[i:i + 333] for i in range(0, len(self.TEXT), 333)]
+
+        chunks = list(chunker.iter_chunks(segments))
+
+        assert [c.chunk_index for c in chunks] == list(range(len(chunks)))
+        for chunk in chunks:
+            assert len(chunk.content) <= 100
+            assert self.TEXT[chunk.start_index:chunk.start_index + len(chunk.content)] == chunk.content
+        assert chunks[-1].content == chunker.chunk_text(self.TEXT)[-1].content
+
+    def test_overlap_spans_segment_boundaries(self):
+        """Test that consecutive chunks overlap even where the buffer was cut"""
+        chunker = TextChunker(chunk_size=100, chunk_overlap=20)
+        segments = [self.TEXT[i:i + 333] for i in range(0, len(self.TEXT), 333)]
+
+        chunks = list(chunker.iter_chunks(segments))
+
+        for previous, chunk in zip(chunks, chunks[1:]):
+            assert chunk.start_index < previous.start_index + len(previous.content)
+
+    async def test_async_segments(self):
+        """Test that aiter_chunks matches iter_chunks"""
+        chunker = TextChunker(chunk_size=100, chunk_overlap=20)
+        segments = [self.TEXT[i:i + 333] for i in range(0, len(self.TEXT), 333)]
+
+        async def stream():
+            for segment in segments:
+                yield segment
+
+        streamed = [c async for c in chunker.aiter_chunks(stream())]
+
+        assert streamed == list(chunker.iter_chunks(segments))
+
+
+class TestTokenChunking:
+    """Test cases for chunk sizes measured in tokens"""
+
+    def test_chunks_fit_token_size(self):
+        """Test that every chunk stays within chunk_size tokens"""
+        counter = SimpleTokenCounter()
+        chunker = TextChunker(chunk_size=40, chunk_overlap=8, token_counter=counter)
+        text = " ".join(f"Tokenized sentence number {i}, with punctuation; and numbers {i * 7919}." for i in range(300))
+
+        chunks = chunker.chunk_text(text)
+
+        assert len(chunks) > 1
+        assert max(counter.count_tokens(c.content) for c in chunks) <= 40
+        assert max(len(c.content) for c in chunks) > 40
+
+    def test_streaming_respects_token_size(self):
+        """Test that the streaming path measures chunks in tokens too"""
+        counter = SimpleTokenCounter()
+        chunker = TextChunker(chunk_size=40, chunk_overlap=8, token_counter=counter)
+        text = " ".join(f"Streamed sentence {i} about token budgets." for i in range(300))
+
+        chunks = list(chunker.iter_chunks(text[i:i + 500] for i in range(0, len(text), 500)))
+
+        assert [c.chunk_index for c in chunks] == list(range(len(chunks)))
+        assert max(counter.count_tokens(c.content) for c in chunks) <= 40
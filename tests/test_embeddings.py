@@ -0,0 +1,141 @@
+"""
+Unit Tests for Embedding Providers
+"""
+from typing import List
+import asyncio
+
+import pytest
+
+from app.services.embeddings.base import BaseEmbeddingProvider
+from app.services.embeddings.cache import CachedEmbeddingProvider
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeEmbeddingProvider(BaseEmbeddingProvider):
+    """Embeds each text as [len(text)] and records request concurrency"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches: List[List[str]] = []
+        self.text_calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def embed_text(self, text: str) -> List[float]:
+        self.text_calls += 1
+        return [float(len(text))]
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        self.batches.append(texts)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # Later batches finish first to check that order is preserved
+        await asyncio.sleep(0.01 / len(self.batches))
+        self.in_flight -= 1
+        return [[float(len(text))] for text in texts]
+
+    @property
+    def dimension(self) -> int:
+        return 1
+
+
+class TestBatchedEmbeddings:
+    """Test cases for BaseEmbeddingProvider.embed_texts batching"""
+
+    async def test_batches_preserve_order(self):
+        """Test that texts are split into batches and results keep input order"""
+        provider = FakeEmbeddingProvider(batch_size=3, max_concurrency=4)
+        texts = ["x" * i for i in range(1, 11)]
+
+        embeddings = await provider.embed_texts(texts)
+
+        assert embeddings == [[float(i)] for i in range(1, 11)]
+        assert [len(batch) for batch in provider.batches] == [3, 3, 3, 1]
+
+    async def test_concurrency_is_bounded(self):
+        """Test that no more than max_concurrency batches are in flight"""
+        provider = FakeEmbeddingProvider(batch_size=1, max_concurrency=2)
+
+        await provider.embed_texts(["a"] * 8)
+
+        assert provider.max_in_flight == 2
+
+    async def test_empty_input_makes_no_requests(self):
+        """Test that embedding nothing does not call the provider"""
+        provider = FakeEmbeddingProvider()
+
+        assert await provider.embed_texts([]) == []
+        assert provider.batches == []
+
+
+class OtherModelProvider(FakeEmbeddingProvider):
+    MODEL_NAME = "other-model"
+
+
+class TestCachedEmbeddingProvider:
+    """Test cases for the query-embedding cache"""
+
+    async def test_repeated_query_hits_cache(self):
+        """Test that whitespace-normalized repeats are served without calling the provider"""
+        provider = FakeEmbeddingProvider()
+        cached = CachedEmbeddingProvider(provider, max_size=10, ttl_seconds=60)
+
+        first = await cached.embed_text("What is RAG?")
+        second = await cached.embed_text("  What is   RAG? ")
+
+        assert first == second
+        assert provider.text_calls == 1
+        info = cached.cache_info()
+        assert info["hits"] == 1 and info["misses"] == 1
+        assert info["hit_rate"] == 0.5
+
+    async def test_case_distinct_queries_do_not_collide(self):
+        """Test that codes differing only in case are embedded separately, in their normalized form"""
+        provider = FakeEmbeddingProvider()
+        cached = CachedEmbeddingProvider(provider, max_size=10, ttl_seconds=60)
+
+        await cached.embed_text("AB-7731")
+        await cached.embed_text("ab-7731")
+        assert await cached.embed_text("  ab-7731 ") == [7.0]
+
+        assert cached.cache_key("AB-7731") != cached.cache_key("ab-7731")
+        assert provider.text_calls == 2
+
+    async def test_entries_expire_and_evict(self):
+        """Test TTL expiry and least-recently-used eviction"""
+        now = [0.0]
+        provider = FakeEmbeddingProvider()
+        cached = CachedEmbeddingProvider(provider, max_size=2, ttl_seconds=10, clock=lambda: now[0])
+
+        await cached.embed_text("a")
+        await cached.embed_text("b")
+        await cached.embed_text("c")  # evicts "a"
+        await cached.embed_text("a")
+        assert provider.text_calls == 4
+
+        now[0] = 11.0
+        await cached.embed_text("c")
+        assert provider.text_calls == 5
+
+    async def test_sqlite_tier_survives_restart(self, tmp_path):
+        """Test that a new cache instance reads vectors persisted by a previous one"""
+        path = str(tmp_path / "embeddings.db")
+        provider = FakeEmbeddingProvider()
+
+        first = CachedEmbeddingProvider(provider, path=path)
+        await first.embed_text("hello")
+        first.close()
+
+        second = CachedEmbeddingProvider(provider, path=path)
+        assert await second.embed_text("hello") == [5.0]
+        assert provider.text_calls == 1
+        assert second.cache_info()["disk_hits"] == 1
+        second.close()
+
+    async def test_key_includes_model_name(self):
+        """Test that the same text embedded by different models gets different keys"""
+        first = CachedEmbeddingProvider(FakeEmbeddingProvider())
+        second = CachedEmbeddingProvider(OtherModelProvider())
+
+        assert first.cache_key("hello") != second.cache_key("hello")
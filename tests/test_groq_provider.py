@@ -0,0 +1,73 @@
+"""
+Unit Tests for the Groq LLM Provider
+"""
+import json
+
+import httpx
+import pytest
+
+from app.services.llm.groq import GroqProvider
+
+
+pytestmark = pytest.mark.anyio
+
+
+def sse_body(*chunks: dict) -> bytes:
+    lines = [f"data: {json.dumps(chunk)}\n\n" for chunk in chunks]
+    lines.append("data: [DONE]\n\n")
+    return "".join(lines).encode()
+
+
+def delta(content: str) -> dict:
+    return {"choices": [{"index": 0, "delta": {"content": content}}]}
+
+
+class TestGroqProvider:
+    """Test cases for GroqProvider over a mocked transport"""
+    
+    async def test_generate_stream_yields_deltas(self):
+        """Test that SSE chunks are parsed into content deltas until [DONE]"""
+        requests = []
+        
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(json.loads(request.content))
+            body = sse_body({"choices": [{"delta": {"role": "assistant"}}]}, delta("Hel"), delta("lo"))
+            return httpx.Response(200, content=body, headers={"content-type": "text/event-stream"})
+        
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            provider = GroqProvider(client=client)
+            tokens = [t async for t in provider.generate_stream([{"role": "user", "content": "Hi"}])]
+        
+        assert tokens == ["Hel", "lo"]
+        assert requests[0]["stream"] is True
+    
+    async def test_generate_stream_raises_on_error_event(self):
+        """Test that an in-stream error payload is surfaced"""
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, content=sse_body({"error": {"message": "rate limited"}}))
+        
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            provider = GroqProvider(client=client)
+            with pytest.raises(RuntimeError, match="rate limited"):
+                [t async for t in provider.generate_stream([{"role": "user", "content": "Hi"}])]
+    
+    async def test_generate_reuses_client(self):
+        """Test that non-streaming calls go through the injected pooled client"""
+        calls = []
+        
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request.url.path)
+            return httpx.Response(200, json={"choices": [{"message": {"content": "pong"}}]})
+        
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            provider = GroqProvider(client=client)
+            assert await provider.generate([{"role": "user", "content": "ping"}]) == "pong"
+            assert await provider.generate([{"role": "user", "content": "ping"}]) == "pong"
+        
+        assert calls == ["/openai/v1/chat/completions"] * 2
+    
+    def test_parse_sse_line_ignores_non_data_lines(self):
+        """Test that comments and blank keep-alive lines are skipped"""
+        assert GroqProvider._parse_sse_line("") is None
+        assert GroqProvider._parse_sse_line(": keep-alive") is None
+        assert GroqProvider._parse_sse_line("data: [DONE]") == "[DONE]"
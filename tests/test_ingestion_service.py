@@ -0,0 +1,300 @@
+"""
+Unit Tests for Ingestion Service
+"""
+from typing import List
+import io
+import os
+import tempfile
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.exceptions import DocumentNotFoundException, DocumentTooLargeException
+from app.models.ingestion_job import JobStatus
+from app.services.embeddings.base import BaseEmbeddingProvider
+from app.services.ingestion_jobs import IngestionJobQueue
+from app.services.document_processor import processor
+from app.services.document_processor.processor import spool_stream
+from app.services.ingestion_service import IngestionService
+from app.services.vectorstore.chroma import ChromaVectorStore
+
+pytestmark = pytest.mark.anyio
+
+PARAGRAPHS = [f"Paragraph {i} talks about topic number {i}." for i in range(6)]
+
+
+class CountingEmbeddingProvider(BaseEmbeddingProvider):
+    """Deterministic embeddings that record every text sent for embedding"""
+
+    def __init__(self):
+        super().__init__(batch_size=100, max_concurrency=1)
+        self.embedded: List[str] = []
+
+    async def embed_text(self, text: str) -> List[float]:
+        return [float(len(text)), 1.0]
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    @property
+    def dimension(self) -> int:
+        return 2
+
+
+def document(paragraphs: List[str]) -> bytes:
+    return "\n\n".join(paragraphs).encode("utf-8")
+
+
+def spool(directory, content: bytes) -> str:
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".txt")
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    return path
+
+
+class AsyncReader:
+    """Async read(size) over in-memory bytes, like UploadFile.read"""
+
+    def __init__(self, data: bytes):
+        self._buffer = io.BytesIO(data)
+
+    async def __call__(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
+
+
+class TestContentAddressedIngestion:
+    """Test cases for embedding reuse during (re-)ingestion"""
+
+    @pytest.fixture
+    def store(self, tmp_path) -> ChromaVectorStore:
+        return ChromaVectorStore(persist_directory=str(tmp_path))
+
+    @pytest.fixture
+    def embeddings(self) -> CountingEmbeddingProvider:
+        return CountingEmbeddingProvider()
+
+    @pytest.fixture
+    def service(self, store: ChromaVectorStore, embeddings: CountingEmbeddingProvider) -> IngestionService:
+        return IngestionService(embedding_provider=embeddings, vector_store=store, chunk_size=50, chunk_overlap=1)
+
+    async def test_identical_upload_is_short_circuited(self, service: IngestionService, embeddings: CountingEmbeddingProvider):
+        """Test that re-uploading the same bytes returns the stored document"""
+        first = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain")
+        embeddings.embedded.clear()
+
+        second = await service.ingest(document(PARAGRAPHS), "copy.txt", "text/plain")
+
+        assert second.status == "duplicate"
+        assert second.document_id == first.document_id
+        assert second.chunk_count == first.chunk_count
+        assert embeddings.embedded == []
+
+    async def test_update_only_embeds_changed_chunks(
+        self, service: IngestionService, store: ChromaVectorStore, embeddings: CountingEmbeddingProvider
+    ):
+        """Test that updating a document re-embeds and replaces only edited chunks"""
+        first = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain")
+        embeddings.embedded.clear()
+
+        edited = PARAGRAPHS[:2] + ["A brand new second half of the text."] + PARAGRAPHS[3:]
+        result = await service.update_document(first.document_id, document(edited), "doc.txt", "text/plain")
+
+        assert result.status == "updated"
+        assert embeddings.embedded == ["A brand new second half of the text."]
+        assert result.embedded_count == 1
+        assert result.reused_count == result.chunk_count - 1
+        stored = await store.get_document_chunks(first.document_id)
+        assert len(stored) == result.chunk_count
+        assert sorted(c.metadata["chunk_index"] for c in stored) == list(range(result.chunk_count))
+
+    async def test_unchanged_update_is_a_no_op(self, service: IngestionService, embeddings: CountingEmbeddingProvider):
+        """Test that updating with identical content does nothing"""
+        first = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain")
+        embeddings.embedded.clear()
+
+        result = await service.update_document(first.document_id, document(PARAGRAPHS), "doc.txt", "text/plain")
+
+        assert result.status == "unchanged"
+        assert embeddings.embedded == []
+
+    async def test_shared_chunks_reuse_embeddings_across_documents(
+        self, service: IngestionService, embeddings: CountingEmbeddingProvider
+    ):
+        """Test that a new document reuses vectors stored for identical chunks"""
+        await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain")
+        embeddings.embedded.clear()
+
+        result = await service.ingest(document(PARAGRAPHS + ["One extra closing paragraph."]), "v2.txt", "text/plain")
+
+        assert result.status == "completed"
+        assert embeddings.embedded == ["One extra closing paragraph."]
+
+    async def test_file_source_matches_bytes_source(self, service: IngestionService, tmp_path):
+        """Test that a spooled file is ingested like the same bytes in memory"""
+        first = await service.ingest(spool(tmp_path, document(PARAGRAPHS)), "doc.txt", "text/plain")
+        second = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain")
+
+        assert first.status == "completed"
+        assert second.status == "duplicate"
+        assert second.document_id == first.document_id
+
+    async def test_large_document_is_processed_in_windows(self, store: ChromaVectorStore, tmp_path):
+        """Test that chunks stream through embedding and storage in bounded windows"""
+        embeddings = CountingEmbeddingProvider()
+        embeddings.batch_size = 2
+        service = IngestionService(embedding_provider=embeddings, vector_store=store, chunk_size=50, chunk_overlap=1)
+        paragraphs = [f"Paragraph {i} of a longer document." for i in range(40)]
+        progress = []
+
+        async def on_progress(**counters):
+            progress.append(counters)
+
+        result = await service.ingest(spool(tmp_path, document(paragraphs)), "doc.txt", "text/plain", on_progress=on_progress)
+
+        assert result.chunk_count == result.embedded_count == 40
+        assert [c["chunks_total"] for c in progress if "chunks_total" in c] == list(range(2, 41, 2))
+        stored = await store.get_document_chunks(result.document_id)
+        assert sorted(c.metadata["chunk_index"] for c in stored) == list(range(40))
+
+    async def test_byte_progress_is_reported_per_window(self, store: ChromaVectorStore, tmp_path, monkeypatch):
+        """Test that bytes_processed advances while the file is still being read"""
+        monkeypatch.setattr(processor, "READ_BLOCK_SIZE", 256)
+        embeddings = CountingEmbeddingProvider()
+        embeddings.batch_size = 2
+        service = IngestionService(embedding_provider=embeddings, vector_store=store, chunk_size=50, chunk_overlap=1)
+        path = spool(tmp_path, document([f"Paragraph {i} of a longer document." for i in range(40)]))
+        reported = []
+
+        async def on_progress(**counters):
+            if "bytes_processed" in counters:
+                reported.append(counters["bytes_processed"])
+
+        await service.ingest(path, "doc.txt", "text/plain", on_progress=on_progress)
+
+        size = os.path.getsize(path)
+        assert reported == sorted(reported)
+        assert 0 < reported[0] < size
+        assert len({value for value in reported if value < size}) > 1
+        assert reported[-1] == size
+
+    async def test_failed_ingestion_leaves_no_chunks(self, service: IngestionService, store: ChromaVectorStore, embeddings):
+        """Test that chunks written before a failure are removed again"""
+        calls = 0
+        embed_batch = embeddings._embed_batch
+
+        async def fail_second_window(texts):
+            nonlocal calls
+            calls += 1
+            if calls > 1:
+                raise RuntimeError("embedding service unavailable")
+            return await embed_batch(texts)
+
+        embeddings.batch_size = 2
+        embeddings._embed_batch = fail_second_window
+
+        with pytest.raises(RuntimeError):
+            await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain")
+
+        assert store._collection.count() == 0
+
+    async def test_update_unknown_document_raises(self, service: IngestionService):
+        """Test that updating a missing document is reported"""
+        with pytest.raises(DocumentNotFoundException):
+            await service.update_document("missing", document(PARAGRAPHS), "doc.txt", "text/plain")
+
+
+class TestIngestionJobQueue:
+    """Test cases for background ingestion jobs"""
+
+    @pytest.fixture
+    async def queue(self, tmp_path, async_db_session: AsyncSession):
+        service = IngestionService(
+            embedding_provider=CountingEmbeddingProvider(),
+            vector_store=ChromaVectorStore(persist_directory=str(tmp_path)),
+            chunk_size=50,
+            chunk_overlap=1
+        )
+        queue = IngestionJobQueue(
+            ingestion=service,
+            session_factory=async_sessionmaker(async_db_session.bind, expire_on_commit=False),
+            concurrency=1  # Sessions share one in-memory SQLite connection
+        )
+        yield queue
+        await queue.stop()
+
+    async def test_upload_runs_in_background(self, queue: IngestionJobQueue, async_db_session: AsyncSession, tmp_path):
+        """Test that a submitted job is queued, then completed with progress counters"""
+        content = document(PARAGRAPHS)
+        path = spool(tmp_path, content)
+        job = await queue.submit(async_db_session, path, "doc.txt", "text/plain")
+        assert job.status == JobStatus.QUEUED
+
+        await queue.join()
+        await async_db_session.refresh(job)
+
+        assert not os.path.exists(path)
+        assert job.status == JobStatus.COMPLETED
+        assert job.result_status == "completed"
+        assert job.document_id is not None
+        assert job.bytes_processed == job.bytes_total == len(content)
+        assert job.chunks_total == job.chunks_embedded == len(PARAGRAPHS)
+
+    async def test_failed_job_records_error(self, queue: IngestionJobQueue, async_db_session: AsyncSession, tmp_path):
+        """Test that an ingestion error marks the job failed instead of crashing the worker"""
+        failing = await queue.submit(
+            async_db_session, spool(tmp_path, document(PARAGRAPHS)), "doc.txt", "text/plain", document_id="missing"
+        )
+        succeeding = await queue.submit(async_db_session, spool(tmp_path, document(PARAGRAPHS)), "doc.txt", "text/plain")
+
+        await queue.join()
+        await async_db_session.refresh(failing)
+        await async_db_session.refresh(succeeding)
+
+        assert failing.status == JobStatus.FAILED
+        assert "Document not found" in failing.error
+        assert succeeding.status == JobStatus.COMPLETED
+
+    async def test_worker_survives_failure_outside_ingest(
+        self, queue: IngestionJobQueue, async_db_session: AsyncSession, tmp_path
+    ):
+        """Test that a failing job status write fails the job, removes its file and keeps the worker alive"""
+        update_fields = queue.job_repo.update_fields
+
+        async def fail_completion(db, job_id, **values):
+            if values.get("status") == JobStatus.COMPLETED and job_id == failing.id:
+                raise RuntimeError("database went away")
+            await update_fields(db, job_id, **values)
+
+        queue.job_repo.update_fields = fail_completion
+        path = spool(tmp_path, document(PARAGRAPHS))
+        failing = await queue.submit(async_db_session, path, "doc.txt", "text/plain")
+        following = await queue.submit(async_db_session, spool(tmp_path, document(PARAGRAPHS[:2])), "doc.txt", "text/plain")
+
+        await queue.join()
+        await async_db_session.refresh(failing)
+        await async_db_session.refresh(following)
+
+        assert failing.status == JobStatus.FAILED
+        assert "database went away" in failing.error
+        assert not os.path.exists(path)
+        assert following.status == JobStatus.COMPLETED
+
+
+class TestSpoolStream:
+    """Test cases for spooling uploads to disk"""
+
+    async def test_copies_stream_to_file(self, tmp_path):
+        """Test that the stream is written to a new file in the spool directory"""
+        data = b"x" * 3_000_000
+        path = await spool_stream(AsyncReader(data), max_bytes=len(data), directory=str(tmp_path))
+
+        with open(path, "rb") as f:
+            assert f.read() == data
+
+    async def test_rejects_oversized_stream(self, tmp_path):
+        """Test that exceeding the limit raises and leaves no file behind"""
+        with pytest.raises(DocumentTooLargeException):
+            await spool_stream(AsyncReader(b"x" * 100), max_bytes=99, directory=str(tmp_path))
+
+        assert os.listdir(tmp_path) == []
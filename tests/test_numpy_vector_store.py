@@ -0,0 +1,160 @@
+"""
+Unit Tests for the NumPy Vector Store
+"""
+from typing import List
+import threading
+
+import numpy as np
+import pytest
+
+from app.services.ingestion_service import IngestionService
+from app.services.vectorstore.base import DocumentChunk, SearchFilter
+from app.services.vectorstore.numpy_store import NumpyVectorStore
+from tests.test_ingestion_service import PARAGRAPHS, CountingEmbeddingProvider, document
+
+pytestmark = pytest.mark.anyio
+
+
+def chunk(chunk_id: str, embedding: List[float], document_id: str = "doc", **metadata) -> DocumentChunk:
+    return DocumentChunk(
+        id=chunk_id,
+        content=f"content of {chunk_id}",
+        embedding=embedding,
+        metadata={"document_id": document_id, **metadata}
+    )
+
+
+class TestNumpyVectorStore:
+    """Test cases for NumpyVectorStore"""
+
+    @pytest.fixture
+    def store(self, tmp_path) -> NumpyVectorStore:
+        return NumpyVectorStore(persist_directory=str(tmp_path))
+
+    async def test_search_matches_brute_force_cosine(self, store: NumpyVectorStore):
+        """Test that top-k results and scores equal exact cosine similarity"""
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(200, 8))
+        await store.add_documents([chunk(f"c{i}", v.tolist()) for i, v in enumerate(vectors)])
+        query = rng.normal(size=8)
+
+        results = await store.search(query.tolist(), top_k=5)
+
+        cosine = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+        expected = np.argsort(-cosine)[:5]
+        assert [r.chunk_id for r in results] == [f"c{i}" for i in expected]
+        assert [r.score for r in results] == pytest.approx(cosine[expected].tolist(), abs=1e-5)
+
+    async def test_overwrites_and_deletes_are_masked(self, store: NumpyVectorStore):
+        """Test that upserted and deleted rows no longer appear in results"""
+        await store.add_documents([chunk("a", [1.0, 0.0]), chunk("b", [0.0, 1.0]), chunk("c", [0.7, 0.7])])
+        await store.add_documents([chunk("a", [0.0, -1.0])])
+        await store.delete_chunks(["c"])
+
+        results = await store.search([1.0, 0.0], top_k=5)
+
+        assert [r.chunk_id for r in results] == ["b", "a"]
+
+    async def test_iter_chunks_yields_live_rows(self, store: NumpyVectorStore):
+        """Test that iteration returns the current content of every live chunk"""
+        await store.add_documents([chunk("a", [1.0, 0.0]), chunk("b", [0.0, 1.0]), chunk("c", [0.7, 0.7])])
+        await store.add_documents([DocumentChunk(id="a", content="new a", embedding=[0.0, -1.0], metadata={})])
+        await store.delete_chunks(["b"])
+
+        batches = [batch async for batch in store.iter_chunks(batch_size=1)]
+
+        assert [len(batch) for batch in batches] == [1, 1]
+        assert sorted((c.id, c.content) for batch in batches for c in batch) == [("a", "new a"), ("c", "content of c")]
+
+    async def test_filters_use_metadata(self, store: NumpyVectorStore):
+        """Test that filtered searches only score matching rows"""
+        await store.add_documents([
+            chunk("a", [1.0, 0.0], document_id="d1", file_type="pdf"),
+            chunk("b", [0.9, 0.1], document_id="d2", file_type="txt"),
+            chunk("c", [0.8, 0.2], document_id="d2", file_type="pdf"),
+        ])
+
+        results = await store.search([1.0, 0.0], top_k=5, filters=SearchFilter(document_ids=["d2", "d3"], file_type="pdf"))
+
+        assert [r.chunk_id for r in results] == ["c"]
+
+    async def test_index_arrays_are_cached_until_rows_change(self, store: NumpyVectorStore):
+        """Test that a value's row array is reused across searches and rebuilt after adds and deletes"""
+        await store.add_documents([chunk("a", [1.0, 0.0], user_id="alice"), chunk("b", [0.0, 1.0], user_id="bob")])
+        alice = SearchFilter(user_id="alice")
+        await store.search([1.0, 0.0], filters=alice)
+        cached = store._indexed_rows("user_id", "alice")
+        await store.search([1.0, 0.0], filters=alice)
+        assert store._indexed_rows("user_id", "alice") is cached
+
+        await store.add_documents([chunk("c", [0.7, 0.7], user_id="alice")])
+        await store.delete_chunks(["a"])
+
+        assert [r.chunk_id for r in await store.search([1.0, 0.0], filters=alice)] == ["c"]
+        assert store._indexed_rows("user_id", "bob").tolist() == [1]
+
+    async def test_scoring_runs_off_the_event_loop(self, store: NumpyVectorStore, monkeypatch):
+        """Test that the matrix product runs in a worker thread"""
+        await store.add_documents([chunk("a", [1.0, 0.0])])
+        threads = []
+        search_many = store._search_many
+
+        def record_thread(*args):
+            threads.append(threading.current_thread())
+            return search_many(*args)
+
+        monkeypatch.setattr(store, "_search_many", record_thread)
+
+        assert [r.chunk_id for r in await store.search([1.0, 0.0])] == ["a"]
+        assert threads and threads[0] is not threading.main_thread()
+
+    async def test_empty_store_returns_no_results(self, store: NumpyVectorStore):
+        """Test that searching an empty, emptied or filtered-out store returns empty lists"""
+        assert await store.search([1.0, 0.0]) == []
+        assert await store.search_many([[1.0, 0.0], [0.0, 1.0]], filters=SearchFilter(user_id="alice")) == [[], []]
+
+        await store.add_documents([chunk("a", [1.0, 0.0])])
+        assert await store.search([1.0, 0.0], filters=SearchFilter(user_id="alice")) == []
+        await store.delete_chunks(["a"])
+        assert await store.search([1.0, 0.0]) == []
+
+    async def test_state_survives_reopen(self, store: NumpyVectorStore, tmp_path):
+        """Test that the append-only files restore vectors, metadata and deletions"""
+        await store.add_documents([chunk("a", [1.0, 0.0], document_hash="h1"), chunk("b", [0.0, 1.0])])
+        await store.update_metadata([DocumentChunk(id="b", content="", metadata={"document_id": "other"})])
+        await store.delete_chunks(["a"])
+        await store.add_documents([chunk("c", [1.0, 1.0])])
+
+        reopened = NumpyVectorStore(persist_directory=str(tmp_path))
+
+        assert [r.chunk_id for r in await reopened.search([1.0, 0.0], top_k=5)] == ["c", "b"]
+        assert await reopened.find_document_by_hash("h1") is None
+        assert [c.id for c in await reopened.get_document_chunks("other")] == ["b"]
+
+    async def test_search_many_matches_search(self, store: NumpyVectorStore):
+        """Test that batched queries return the same results as single ones"""
+        await store.add_documents([chunk(f"c{i}", [float(i), 1.0]) for i in range(10)])
+        queries = [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]
+
+        batched = await store.search_many(queries, top_k=3)
+
+        for results, query in zip(batched, queries):
+            single = await store.search(query, top_k=3)
+            assert [r.chunk_id for r in results] == [r.chunk_id for r in single]
+            assert [r.score for r in results] == pytest.approx([r.score for r in single])
+
+    async def test_supports_content_addressed_ingestion(self, store: NumpyVectorStore):
+        """Test that IngestionService runs on the NumPy store, reusing embeddings"""
+        embeddings = CountingEmbeddingProvider()
+        service = IngestionService(embedding_provider=embeddings, vector_store=store, chunk_size=50, chunk_overlap=1)
+        first = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain")
+        embeddings.embedded.clear()
+
+        edited = PARAGRAPHS[:2] + ["A brand new second half of the text."] + PARAGRAPHS[3:]
+        result = await service.update_document(first.document_id, document(edited), "doc.txt", "text/plain")
+        duplicate = await service.ingest(document(edited), "copy.txt", "text/plain")
+
+        assert result.status == "updated"
+        assert embeddings.embedded == ["A brand new second half of the text."]
+        assert len(await store.get_document_chunks(first.document_id)) == result.chunk_count
+        assert duplicate.status == "duplicate"
@@ -0,0 +1,107 @@
+"""
+Unit Tests for RAG Service
+"""
+from typing import List, Optional
+
+import pytest
+
+from app.services.context_manager import SimpleTokenCounter
+from app.services.embeddings.base import BaseEmbeddingProvider
+from app.services.rag_service import RAGService
+from app.services.vectorstore.base import DocumentChunk, SearchResult
+from app.services.vectorstore.chroma import ChromaVectorStore
+
+pytestmark = pytest.mark.anyio
+
+DOCUMENT = "".join(f"Sentence {i:02d} of the source document. " for i in range(40))
+
+
+def result(score: float, start: Optional[int] = None, length: int = 200, document_id: str = "doc") -> SearchResult:
+    content = DOCUMENT[start:start + length] if start is not None else f"Standalone chunk scored {score}."
+    metadata = {"document_id": document_id, "filename": "doc.txt"}
+    if start is not None:
+        metadata["start_index"] = start
+    return SearchResult(chunk_id=f"{document_id}_{start}_{score}", content=content, score=score, metadata=metadata)
+
+
+class AxisEmbeddingProvider(BaseEmbeddingProvider):
+    """Embeds "x" and "y" as unit vectors along their axis"""
+
+    async def embed_text(self, text: str) -> List[float]:
+        return [1.0, 0.0] if text == "x" else [0.0, 1.0]
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return [await self.embed_text(text) for text in texts]
+
+    @property
+    def dimension(self) -> int:
+        return 2
+
+
+@pytest.fixture
+def service() -> RAGService:
+    return RAGService(token_counter=SimpleTokenCounter())
+
+
+class TestPackContext:
+    """Test cases for token-budgeted context packing"""
+
+    def test_packs_by_score_within_budget(self, service: RAGService):
+        """Test that chunks are taken best first and ones that do not fit are skipped"""
+        large = result(0.8, start=0, length=800)
+        results = [result(0.5, start=1000), large, result(0.9, start=1400)]
+
+        context = service.pack_context(results, max_tokens=120)
+
+        assert [c["score"] for c in context.chunks] == [0.9, 0.5]
+        assert context.token_count <= 120
+        assert context.text == service.CHUNK_SEPARATOR.join(
+            service.format_chunk(c["content"], c["metadata"]) for c in context.chunks
+        )
+
+    def test_min_score_drops_weak_chunks(self, service: RAGService):
+        """Test that chunks below the score threshold are never packed"""
+        context = service.pack_context([result(0.9), result(0.2)], min_score=0.3)
+
+        assert [c["score"] for c in context.chunks] == [0.9]
+
+    def test_overlapping_neighbors_are_deduplicated(self, service: RAGService):
+        """Test that text shared with a packed neighbor is only sent once"""
+        results = [result(0.9, start=0), result(0.8, start=150), result(0.7, start=50, length=100)]
+
+        context = service.pack_context(results)
+
+        assert [c["content"] for c in context.chunks] == [DOCUMENT[0:200], DOCUMENT[200:350]]
+
+    def test_overlap_is_per_document(self, service: RAGService):
+        """Test that identical positions in different documents are both kept"""
+        results = [result(0.9, start=0, document_id="a"), result(0.8, start=0, document_id="b")]
+
+        assert len(service.pack_context(results).chunks) == 2
+
+
+class TestSearchMany:
+    """Test cases for batched multi-query retrieval"""
+
+    async def test_one_vector_search_for_all_queries(self, tmp_path):
+        """Test that results come back per query, in order, from a single store call"""
+        store = ChromaVectorStore(persist_directory=str(tmp_path))
+        await store.add_documents([
+            DocumentChunk(id=f"c{i}", content=f"chunk {i}", embedding=vector, metadata={"document_id": "doc"})
+            for i, vector in enumerate([[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]])
+        ])
+        calls = []
+        search_many = store.search_many
+
+        async def counting_search_many(query_embeddings, top_k=5, filters=None):
+            calls.append(len(query_embeddings))
+            return await search_many(query_embeddings, top_k=top_k, filters=filters)
+
+        store.search_many = counting_search_many
+        service = RAGService(embedding_provider=AxisEmbeddingProvider(), vector_store=store)
+
+        results = await service.search_many(["x", "y"], top_k=1)
+
+        assert calls == [2]
+        assert [[c["content"] for c in r] for r in results] == [["chunk 0"], ["chunk 1"]]
+        assert await store.search([0.0, 1.0], top_k=1) == (await store.search_many([[0.0, 1.0]], top_k=1))[0]
@@ -0,0 +1,161 @@
+"""
+Unit Tests for the Response Cache
+"""
+from typing import Dict, List
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.conversation import ConversationMode
+from app.schemas.chat import CreateConversationRequest
+from app.services.ingestion_service import IngestionService
+from app.services.response_cache import ResponseCache
+from app.services.vectorstore.chroma import ChromaVectorStore
+from tests.test_chat_service import FakeStreamingProvider, make_service
+from tests.test_ingestion_service import PARAGRAPHS, CountingEmbeddingProvider, document
+
+pytestmark = pytest.mark.anyio
+
+PROMPT = "You are a helpful assistant."
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestResponseCache:
+    """Test cases for exact and similarity lookups"""
+
+    def test_exact_hit_ignores_case_and_whitespace(self):
+        """Test that a normalized repeat of a message under the same prompt hits"""
+        cache = ResponseCache(modes=["open_chat"], max_size=10, ttl_seconds=0)
+        cache.put("open_chat", PROMPT, "What are your hours?", "9 to 5.")
+
+        assert cache.get("open_chat", PROMPT, "  what are   your HOURS? ") == "9 to 5."
+        assert cache.get("open_chat", "A different prompt.", "What are your hours?") is None
+        assert cache.cache_info()["hits"] == 1
+        assert cache.cache_info()["misses"] == 1
+
+    def test_only_enabled_modes_are_cached(self):
+        """Test that modes without opt-in are never stored or looked up"""
+        cache = ResponseCache(modes=["open_chat"], max_size=10, ttl_seconds=0)
+        cache.put("rag", PROMPT, "reset password", "Use the link.")
+
+        assert cache.get("rag", PROMPT, "reset password") is None
+        assert cache.cache_info()["size"] == 0
+
+    def test_similar_message_hits_above_threshold(self):
+        """Test that the similarity tier reuses answers of close enough messages"""
+        cache = ResponseCache(modes=["open_chat"], max_size=10, ttl_seconds=0, similarity_threshold=0.9)
+        cache.put("open_chat", PROMPT, "reset password", "Use the link.", embedding=[1.0, 0.0])
+
+        assert cache.get("open_chat", PROMPT, "how do I reset my password", embedding=[0.95, 0.1]) == "Use the link."
+        assert cache.get("open_chat", PROMPT, "opening hours", embedding=[0.1, 1.0]) is None
+        assert cache.cache_info()["semantic_hits"] == 1
+
+    def test_entries_expire_and_are_evicted(self):
+        """Test TTL expiry and least-recently-used eviction"""
+        clock = FakeClock()
+        cache = ResponseCache(modes=["open_chat"], max_size=2, ttl_seconds=60, clock=clock)
+        cache.put("open_chat", PROMPT, "a", "A")
+        cache.put("open_chat", PROMPT, "b", "B")
+        cache.get("open_chat", PROMPT, "a")
+        cache.put("open_chat", PROMPT, "c", "C")
+
+        assert cache.get("open_chat", PROMPT, "b") is None
+        clock.now += 61
+        assert cache.get("open_chat", PROMPT, "a") is None
+
+    def test_invalidate_drops_mode_and_stale_puts(self):
+        """Test that invalidation clears one mode and rejects answers computed before it"""
+        cache = ResponseCache(modes=["open_chat", "rag"], max_size=10, ttl_seconds=0)
+        cache.put("open_chat", PROMPT, "hello", "Hi!")
+        cache.put("rag", PROMPT, "policy", "Old policy.")
+        generation = cache.generation("rag")
+
+        cache.invalidate("rag")
+        cache.put("rag", PROMPT, "policy", "Stale policy.", generation=generation)
+
+        assert cache.get("rag", PROMPT, "policy") is None
+        assert cache.get("open_chat", PROMPT, "hello") == "Hi!"
+
+
+class CountingProvider(FakeStreamingProvider):
+    """Records every generate call"""
+
+    def __init__(self, answer: str):
+        super().__init__([answer])
+        self.calls = 0
+
+    async def generate(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        self.calls += 1
+        return await super().generate(messages, **kwargs)
+
+
+class CountingEmbedder:
+    """Stands in for RAGService.embed_query and records every call"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def embed_query(self, query: str) -> List[float]:
+        self.calls += 1
+        return [1.0, 0.0]
+
+
+class TestCachedConversations:
+    """Test cases for cached answers in ChatService and their invalidation"""
+
+    async def test_repeated_first_message_skips_llm(self, async_db_session: AsyncSession):
+        """Test that a repeated first message is answered from the cache and still persisted"""
+        provider = CountingProvider("We are open 9 to 5.")
+        service = make_service(provider)
+        service.response_cache = ResponseCache(modes=["open_chat"], max_size=10, ttl_seconds=0)
+
+        first = await service.create_conversation(
+            async_db_session, CreateConversationRequest(user_id="u1", message="What are your hours?")
+        )
+        second = await service.create_conversation(
+            async_db_session, CreateConversationRequest(user_id="u2", message="what are your hours?")
+        )
+
+        assert provider.calls == 1
+        assert second.conversation_id != first.conversation_id
+        assert second.assistant_message.content == "We are open 9 to 5."
+        assert service.response_cache.cache_info()["hits"] == 1
+
+    async def test_miss_embeds_message_once(self, async_db_session: AsyncSession):
+        """Test that the similarity lookup and the store after a miss share one embedding"""
+        service = make_service(CountingProvider("Hello!"))
+        service.response_cache = ResponseCache(
+            modes=["open_chat"], max_size=10, ttl_seconds=0, similarity_threshold=0.9
+        )
+        service.rag_service = CountingEmbedder()
+
+        await service.create_conversation(async_db_session, CreateConversationRequest(user_id="u1", message="Hi there"))
+
+        assert service.rag_service.calls == 1
+        assert service.response_cache.cache_info()["size"] == 1
+
+    async def test_ingestion_invalidates_rag_answers(self, tmp_path):
+        """Test that adding or deleting documents drops cached RAG answers"""
+        cache = ResponseCache(modes=["rag"], max_size=10, ttl_seconds=0)
+        service = IngestionService(
+            embedding_provider=CountingEmbeddingProvider(),
+            vector_store=ChromaVectorStore(persist_directory=str(tmp_path)),
+            chunk_size=50,
+            chunk_overlap=1,
+            answer_cache=cache
+        )
+        cache.put(ConversationMode.RAG.value, PROMPT, "policy", "Old policy.")
+
+        result = await service.ingest(document(PARAGRAPHS), "doc.txt", "text/plain")
+        assert cache.get(ConversationMode.RAG.value, PROMPT, "policy") is None
+
+        cache.put(ConversationMode.RAG.value, PROMPT, "policy", "Current policy.")
+        await service.delete_document(result.document_id)
+        assert cache.get(ConversationMode.RAG.value, PROMPT, "policy") is None